@@ -1,10 +1,20 @@
 from fastapi import APIRouter
 from .chat import router as chat_router
+from .batch import router as batch_router
+from .sessions import router as sessions_router
+from .websocket import router as websocket_router
+from .retrieval import router as retrieval_router
+from .embeddings import router as embeddings_router
 
 # Main API router
 api_router = APIRouter()
 
 # Include sub-routers
 api_router.include_router(chat_router, tags=["chat"])
+api_router.include_router(batch_router, tags=["batch"])
+api_router.include_router(sessions_router, tags=["sessions"])
+api_router.include_router(websocket_router, tags=["websocket"])
+api_router.include_router(retrieval_router, tags=["retrieval"])
+api_router.include_router(embeddings_router, tags=["embeddings"])
 
 __all__ = ["api_router"]
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import math
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.schemas import ChatRequest
+from app.services import (
+    model_catalog, ollama_service, scheduler, SchedulerRejected, rate_limiter, RateLimitExceeded, tracer
+)
+from app.services.context_manager import estimate_tokens
+from .chat import client_id, complete_chat, limited
+
+router = APIRouter()
+
+
+class BatchItem:
+    """One input line: its position, caller-supplied ID and parsed request"""
+    __slots__ = ("index", "id", "request", "error")
+
+    def __init__(self, index: int, item_id: Any, request: Optional[ChatRequest] = None, error: Optional[str] = None):
+        self.index = index
+        self.id = item_id
+        self.request = request
+        self.error = error
+
+
+def parse_batch(text: str) -> List[BatchItem]:
+    """
+    Parse JSONL chat requests
+
+    Each non-empty line is a ChatRequest object with an optional ``id``
+    (defaults to the line's index). Items run in the ``batch`` scheduling
+    lane unless they set a priority. Bad lines become items with an error
+    instead of failing the whole batch.
+    """
+    items = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        index = len(items)
+        try:
+            payload = json.loads(line)
+            if not isinstance(payload, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            items.append(BatchItem(index, index, error=f"Invalid JSON: {e}"))
+            continue
+        item_id = payload.pop("id", index)
+        payload.setdefault("priority", "batch")
+        try:
+            items.append(BatchItem(index, item_id, ChatRequest(**payload)))
+        except ValidationError as e:
+            items.append(BatchItem(index, item_id, error=f"Invalid request: {e.errors()[0]['msg']}"))
+    return items
+
+
+async def run_item(item: BatchItem, caller: str, slots: asyncio.Semaphore) -> Dict[str, Any]:
+    """
+    Answer one batch item, waiting and retrying while the scheduler is busy
+
+    The caller's token quota is checked before the item runs; over it, the
+    item fails with a rate-limit error instead of adding to the debt.
+
+    Returns:
+        Result line for the item
+    """
+    line: Dict[str, Any] = {"index": item.index, "id": item.id}
+    if item.error is not None:
+        line.update(success=False, error=item.error)
+        return line
+
+    start = time.perf_counter()
+    for attempt in range(settings.batch_max_retries + 1):
+        try:
+            async with slots:
+                await rate_limiter.check_tokens(caller)
+                result = await complete_chat(item.request, caller)
+            break
+        except RateLimitExceeded as e:
+            result = {"success": False, "error": f"Rate limit exceeded: {e.limit_name}",
+                      "retry_after": math.ceil(e.retry_after)}
+            break
+        except SchedulerRejected as e:
+            if attempt == settings.batch_max_retries:
+                result = {"success": False, "error": f"Server busy: {e}"}
+                break
+            # Bulk work can wait: back off outside the batch slot
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+            break
+
+    line["seconds"] = round(time.perf_counter() - start, 4)
+    if not result["success"]:
+        line.update(success=False, error=result.get("error", "Unknown error"))
+        if "retry_after" in result:
+            line["retry_after"] = result["retry_after"]
+        return line
+    line.update(
+        success=True,
+        response=result["response"],
+        model=result["model"],
+        cached=result.get("cached", False),
+        tokens=result.get("eval_count") or estimate_tokens(result["response"])
+    )
+    return line
+
+
+async def run_batch(items: List[BatchItem], concurrency: int, caller: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run batch items with bounded parallelism, yielding results as they complete
+
+    At most ``concurrency`` items run at once. Each model gets no more
+    workers than the scheduler has slots for it, so a slow model queues
+    its own items instead of holding every batch slot while other models
+    sit idle; the backend pool spreads each model's work over the nodes.
+
+    Yields:
+        One result line per item in completion order, then a summary line
+    """
+    slots = asyncio.Semaphore(concurrency)
+    results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    by_model: Dict[str, List[BatchItem]] = {}
+    for item in items:
+        model = (item.request.model or ollama_service.default_model) if item.request else ""
+        by_model.setdefault(model, []).append(item)
+
+    async def worker(pending: List[BatchItem]):
+        while pending:
+            await results.put(await run_item(pending.pop(), caller, slots))
+
+    workers = []
+    for model, pending in by_model.items():
+        pending.reverse()  # pop() from the end keeps input order
+        # Routed items may go to any model and unknown ones fail: only the batch concurrency applies
+        limit = scheduler.limit(model) if model_catalog.known(model) else None
+        count = min(len(pending), concurrency, limit or concurrency) if model else 1
+        workers.extend(asyncio.create_task(worker(pending)) for _ in range(count))
+
+    start = time.perf_counter()
+    succeeded = cached = tokens = generated = 0
+    try:
+        for _ in range(len(items)):
+            line = await results.get()
+            if line["success"]:
+                succeeded += 1
+                tokens += line["tokens"]
+                if line["cached"]:
+                    cached += 1
+                else:
+                    generated += line["tokens"]
+            yield line
+    finally:
+        # Stop the remaining items if the client went away
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    elapsed = time.perf_counter() - start
+    yield {"summary": {
+        "items": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "cached": cached,
+        "tokens": tokens,
+        "elapsed_seconds": round(elapsed, 4),
+        # Generated tokens only: cache hits would overstate model throughput
+        "tokens_per_second": round(generated / elapsed, 2) if elapsed else 0.0
+    }}
+
+
+async def encode_jsonl(lines: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for line in lines:
+        yield json.dumps(line) + "\n"
+
+
+@router.post("/chat/batch")
+async def chat_batch(http_request: Request, concurrency: Optional[int] = Query(None, ge=1)):
+    """
+    Batch chat endpoint - run JSONL chat requests and stream JSONL results
+
+    The request body holds one chat request per line, each with an
+    optional ``id``. Result lines (``index``, ``id``, ``success``,
+    ``response`` or ``error``, ``tokens``) are streamed in completion
+    order, followed by a ``summary`` line with aggregate tokens/sec.
+    Clients resume an interrupted batch by resubmitting the items whose
+    IDs have no successful result yet (see ``run_batch.py``).
+
+    A batch counts as one request against the caller's rate limit. The
+    token quota applies to each item: items are charged the tokens they
+    generate, and once the quota is used up the remaining items fail with
+    a ``Rate limit exceeded: tokens`` error and a ``retry_after``.
+    """
+    caller = client_id(http_request)
+    try:
+        headers = await rate_limiter.check(caller)
+    except RateLimitExceeded as e:
+        raise limited(e)
+    items = parse_batch((await http_request.body()).decode("utf-8", errors="replace"))
+    tracer.span_since_start("request.parse", items=len(items))
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch has {len(items)} items; the limit is {settings.batch_max_items}"
+        )
+    concurrency = min(concurrency or settings.batch_concurrency, settings.batch_max_concurrency)
+    return StreamingResponse(
+        encode_jsonl(run_batch(items, concurrency, caller)),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
@@ -1,22 +1,324 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.requests import HTTPConnection
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import hashlib
+import math
+import re
 from app.schemas import ChatRequest, ChatResponse, HealthResponse
-from app.services import ollama_service
-import json
+from app.services import (
+    ollama_service,
+    response_cache,
+    request_coalescer,
+    conversation_store,
+    context_manager,
+    scheduler,
+    SchedulerRejected,
+    metrics,
+    stream_registry,
+    model_residency,
+    model_catalog,
+    UnknownModel,
+    semantic_cache,
+    rate_limiter,
+    RateLimitExceeded,
+    retriever,
+    model_router,
+    tracer,
+)
+from app.services.context_manager import estimate_tokens
+from app.services.model_router import AUTO_MODEL, Route
+from app.services.shared_state import STATE_ERRORS
+from app.core.config import settings
+from .streaming import encode_sse
 
 router = APIRouter()
 
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _key_digest(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+# SHA-256 digests of the API keys that identify a client
+KNOWN_KEY_DIGESTS = frozenset(
+    key[len("sha256:"):].lower() if key.startswith("sha256:") else _key_digest(key)
+    for key in settings.api_keys
+)
+
+
+def client_id(http_request: HTTPConnection) -> str:
+    """
+    Identify the caller for fair scheduling and rate limits (API key, else client IP)
+
+    Only keys in ``settings.api_keys`` count: the header is not
+    authenticated, and a made-up key per request would otherwise get a
+    fresh rate limit every time.
+    """
+    api_key = http_request.headers.get("x-api-key")
+    if api_key:
+        digest = _key_digest(api_key)
+        if digest in KNOWN_KEY_DIGESTS:
+            return f"key:{digest[:16]}"
+    return f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+
+
+def stream_request_id(http_request: Request) -> str:
+    """Use the caller's X-Request-ID if it is well formed, else make one up"""
+    supplied = http_request.headers.get("x-request-id", "")
+    if REQUEST_ID_PATTERN.match(supplied) and not stream_registry.is_active(supplied):
+        return supplied
+    return stream_registry.new_id()
+
+
+def sse_response(stream_id: str, events, protocol: int, last_event_id: int = 0,
+                 headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Serve registry events as a Server-Sent Events response"""
+    return StreamingResponse(
+        encode_sse(events, protocol, last_event_id, retry=settings.sse_retry_ms),
+        media_type="text/event-stream",
+        headers={
+            "X-Request-ID": stream_id,
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",  # stop nginx from buffering the stream
+            **(headers or {})
+        }
+    )
+
+
+def rejected(e: SchedulerRejected) -> HTTPException:
+    """Map a scheduler rejection to 429 Too Many Requests"""
+    return HTTPException(
+        status_code=429,
+        detail=f"Server busy: {e}",
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+
+def limited(e: RateLimitExceeded) -> HTTPException:
+    """Map a client over its rate limit to 429 with RateLimit-* headers"""
+    return HTTPException(status_code=429, detail=f"Rate limit exceeded: {e.limit_name}", headers=e.headers)
+
+
+def unknown_model(e: UnknownModel) -> HTTPException:
+    """Map a model no node reports to 404 Not Found"""
+    return HTTPException(status_code=404, detail=str(e))
+
+
+def shutting_down() -> HTTPException:
+    """503 for new streams while the worker drains before exiting"""
+    return HTTPException(
+        status_code=503,
+        detail="Server shutting down",
+        headers={"Retry-After": "1"}
+    )
+
+
+def cache_model(model: str, route: Optional[Route]) -> str:
+    """
+    Model name answers are cached under
+
+    Routed answers are shared by all ``model="auto"`` requests, except
+    those downgraded under load, which are only as good as the lighter
+    model and are cached under its name.
+    """
+    if route is None or route.reason == "downgrade":
+        return model
+    return AUTO_MODEL
+
+
+async def prepare_chat(request: ChatRequest) -> Tuple[str, Optional[Route], List[Tuple[str, str]], List[Tuple[str, str]], str, Optional[Dict[str, Any]]]:
+    """
+    Resolve the model, conversation history, retrieved passages, cache key and cached answer
+
+    ``model="auto"`` requests are routed on the size and content of the
+    message and retrieved passages.
+
+    Returns:
+        Tuple of (model, route or None, history, passages, cache_key, cached answer or None)
+
+    Raises:
+        UnknownModel: No node reports the requested model
+    """
+    passages = []
+    if request.use_retrieval:
+        with tracer.span("retrieval.search") as span:
+            passages = await retriever.passages(request.message)
+            span.set("passages", len(passages))
+    model = request.model or ollama_service.default_model
+    route = None
+    if model == AUTO_MODEL:
+        prompt_tokens = estimate_tokens(request.message) + sum(estimate_tokens(c) for _, c in passages)
+        route = model_router.route(request.message, prompt_tokens, ollama_service.default_model)
+        model = route.model
+    else:
+        # Per-model state (queues, metrics, request rates) only ever sees catalog names
+        model_catalog.check(model)
+    history = []
+    if request.session_id:
+        # Trimmed to the model's token budget, with a summary of older turns
+        history = await context_manager.prepare(request.session_id, request.message, model)
+    cache_key = response_cache.make_key(request.message, cache_model(model, route), request.options, history, passages)
+    cached = None
+    if request.use_cache:
+        with tracer.span("cache.lookup", model=model) as span:
+            cached = await response_cache.get(cache_key)
+            if cached is None and not history and not passages:
+                # Paraphrases of an earlier prompt (only meaningful without a conversation)
+                cached = await semantic_cache.get(request.message, cache_model(model, route), request.options)
+            span.set("hit", cached is not None)
+    else:
+        response_cache.record_bypass()
+    if cached is None:
+        model_residency.record(model)
+    return model, route, history, passages, cache_key, cached
+
+
+def scheduling_lane(request: ChatRequest, history: List[Tuple[str, str]], passages: List[Tuple[str, str]]) -> str:
+    prompt_tokens = estimate_tokens(request.message) + sum(estimate_tokens(c) for _, c in history + passages)
+    return scheduler.classify(prompt_tokens, request.priority)
+
+
+async def open_stream(request: ChatRequest, connection: HTTPConnection) -> Tuple[str, AsyncIterator[Dict[str, Any]]]:
+    """
+    Build the event stream for a streaming chat request
+
+    Cached answers are replayed; otherwise the generation goes through
+    the coalescer, the response cache and the scheduler, and its tokens
+    are charged to the caller's quota. Completed turns are appended to
+    the session. Routed (``model="auto"``) streams are not escalated:
+    their tokens are already on the way to the client.
+
+    Returns:
+        Tuple of (model, service events)
+
+    Raises:
+        SchedulerRejected: The model's queue cannot take the request
+        UnknownModel: No node reports the requested model
+    """
+    model, route, history, passages, cache_key, cached = await prepare_chat(request)
+
+    if cached is not None:
+        events = response_cache.replay(cached)
+        source = "cached"
+    else:
+        source = "coalesced" if request_coalescer.is_streaming(cache_key) else "generated"
+        if source == "generated":
+            # Refuse now (429) rather than after the stream has started
+            scheduler.check(model)
+        lane = scheduling_lane(request, history, passages)
+        caller = client_id(connection)
+        # Identical concurrent streams fan out from one upstream stream
+        events = request_coalescer.stream(cache_key, lambda: response_cache.record_stream(
+            cache_key,
+            scheduler.stream(model, caller, lane, ollama_service.stream_response(
+                message=request.message,
+                model=model,
+                options=request.options,
+                history=history,
+                passages=passages
+            ))
+        ))
+        events = rate_limiter.record_stream(caller, events)
+        if route is not None:
+            events = model_router.record_stream(route, events)
+        if not history and not passages:
+            events = semantic_cache.record_stream(request.message, cache_model(model, route), request.options, events)
+    if request.session_id:
+        events = conversation_store.record_stream(request.session_id, request.message, events)
+    return model, metrics.track_stream(model, events, source)
+
+
+async def complete_chat(request: ChatRequest, caller: str) -> Dict[str, Any]:
+    """
+    Answer a chat request without streaming
+
+    The answer comes from the cache or a coalesced, scheduled generation,
+    is cached and appended to the session. Generated tokens are charged
+    to the caller's quota. A routed (``model="auto"``) answer that fails
+    the router's answer check is regenerated on the next larger model.
+
+    Args:
+        request: Chat request
+        caller: Client identity for fair scheduling
+
+    Returns:
+        Service result dictionary (``success`` False on generation errors)
+
+    Raises:
+        SchedulerRejected: The model's queue cannot take the request
+        UnknownModel: No node reports the requested model
+    """
+    model, route, history, passages, cache_key, cached = await prepare_chat(request)
+    if cached is not None:
+        result = {
+            "response": cached["response"],
+            "model": cached["model"],
+            "timestamp": datetime.now().isoformat(),
+            "success": True,
+            "cached": True
+        }
+    else:
+        lane = scheduling_lane(request, history, passages)
+
+        async def generate_on(name: str) -> Dict[str, Any]:
+            async with scheduler.slot(name, caller, lane):
+                return await ollama_service.generate_response(
+                    message=request.message,
+                    model=name,
+                    options=request.options,
+                    history=history,
+                    passages=passages
+                )
+
+        async def generate():
+            result = await generate_on(model)
+            if route is not None:
+                # Cascade: retry on larger models while the answer check fails
+                larger = model_router.next_model(route, result)
+                while larger is not None:
+                    result = await generate_on(larger)
+                    larger = model_router.next_model(route, result)
+                model_router.finish(route)
+            return result
+
+        # Identical concurrent requests share one upstream generation
+        result = await request_coalescer.do(cache_key, generate)
+        if result["success"]:
+            await rate_limiter.charge(caller, result.get("eval_count") or estimate_tokens(result["response"]))
+            await response_cache.set(cache_key, {"response": result["response"], "model": result["model"]})
+            if not history and not passages:
+                await semantic_cache.set(request.message, cache_model(model, route), request.options, result)
+
+    if result["success"] and request.session_id:
+        await conversation_store.append(
+            request.session_id,
+            [("user", request.message), ("assistant", result["response"])]
+        )
+    return result
+
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, response: Response):
     """
     Chat endpoint - send a message to Ollama LLM and get a response
+
+    With ``use_retrieval`` the most relevant passages from the document
+    index are added to the prompt. Responses carry ``RateLimit-*``
+    headers when rate limits are configured; over the limit the answer is
+    ``429`` with ``Retry-After``.
     """
+    tracer.span_since_start("request.parse")
+    caller = client_id(http_request)
     try:
-        result = await ollama_service.generate_response(
-            message=request.message,
-            model=request.model
-        )
+        response.headers.update(await rate_limiter.check(caller))
+    except RateLimitExceeded as e:
+        raise limited(e)
+    try:
+        result = await complete_chat(request, caller)
         
         if not result["success"]:
             raise HTTPException(
@@ -24,12 +326,22 @@ async def chat(request: ChatRequest):
                 detail=f"Failed to generate response: {result.get('error', 'Unknown error')}"
             )
         
-        return ChatResponse(
-            response=result["response"],
-            model=result["model"],
-            timestamp=result["timestamp"]
-        )
-        
+        with tracer.span("response.serialize"):
+            body = ChatResponse(
+                response=result["response"],
+                model=result["model"],
+                timestamp=result["timestamp"],
+                cached=result.get("cached", False),
+                session_id=request.session_id
+            ).model_dump_json()
+        return Response(body, media_type="application/json", headers=dict(response.headers))
+
+    except HTTPException:
+        raise
+    except SchedulerRejected as e:
+        raise rejected(e)
+    except UnknownModel as e:
+        raise unknown_model(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -38,35 +350,40 @@ async def chat(request: ChatRequest):
 
 
 @router.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
+async def chat_stream(request: ChatRequest, http_request: Request):
     """
     Streaming chat endpoint - stream response chunks as they're generated
+
+    ``stream_protocol=2`` selects the delta-only format: each event carries
+    just the new text and the terminal event carries the final text once.
+    Cached answers are replayed through the same event format. With a
+    ``session_id`` the completed turn is appended to the conversation.
+    The response is ``text/event-stream`` with numbered frames and
+    heartbeat comments. The ``X-Request-ID`` response header names the
+    stream for ``GET /chat/stream/{request_id}`` (resume) and
+    ``POST /chat/cancel/{request_id}``. Generation stops upstream once no
+    client has been connected for the resume grace period. Rate limits
+    apply as for ``/chat``.
     """
+    tracer.span_since_start("request.parse")
+    if stream_registry.draining:
+        raise shutting_down()
     try:
-        async def generate():
-            async for chunk in ollama_service.stream_response(
-                message=request.message,
-                model=request.model
-            ):
-                if chunk.get("success", False):
-                    yield f"data: {json.dumps(chunk)}\n\n"
-                else:
-                    yield f"data: {json.dumps({'error': chunk.get('error', 'Unknown error')})}\n\n"
-                    break
-            
-            # Send end signal
-            yield f"data: {json.dumps({'done': True})}\n\n"
-        
-        return StreamingResponse(
-            generate(),
-            media_type="text/plain",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Content-Type": "text/plain; charset=utf-8"
-            }
+        headers = await rate_limiter.check(client_id(http_request))
+    except RateLimitExceeded as e:
+        raise limited(e)
+    try:
+        model, events = await open_stream(request, http_request)
+        stream_id = stream_request_id(http_request)
+        events = stream_registry.guard(
+            stream_id, model, events, meta={"protocol": request.stream_protocol}, heartbeats=True
         )
-        
+        return sse_response(stream_id, events, request.stream_protocol, headers=headers)
+
+    except SchedulerRejected as e:
+        raise rejected(e)
+    except UnknownModel as e:
+        raise unknown_model(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -74,14 +391,58 @@ async def chat_stream(request: ChatRequest):
         )
 
 
+@router.get("/chat/stream/{request_id}")
+async def resume_stream(
+    request_id: str,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Resume a /chat/stream response after a dropped connection
+
+    Frames after ``Last-Event-ID`` (header, or ``last_event_id`` query
+    parameter) are replayed from the server-side buffer and the stream
+    continues live if generation is still running; nothing is regenerated.
+    """
+    if not stream_registry.is_active(request_id):
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    if last_event_id is None:
+        try:
+            last_event_id = int(last_event_id_header or 0)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    protocol = stream_registry.meta(request_id).get("protocol", 2)
+    events = stream_registry.resume(request_id, heartbeats=True)
+    return sse_response(request_id, events, protocol, last_event_id)
+
+
+@router.post("/chat/cancel/{request_id}")
+async def cancel_stream(request_id: str):
+    """
+    Stop an in-flight /chat/stream response and its upstream generation
+    """
+    if not stream_registry.cancel(request_id):
+        raise HTTPException(status_code=404, detail="No active stream with this request ID")
+    return {"success": True, "request_id": request_id}
+
+
+@router.get("/streams/stats")
+async def stream_stats():
+    """
+    Active, completed, disconnected and cancelled streams and tokens saved
+    """
+    return stream_registry.stats()
+
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
     """
     Health check endpoint - verify API and Ollama status
+
+    Ollama status comes from the model catalog's last background refresh.
     """
     try:
-        ollama_status_result = await ollama_service.check_ollama_status()
-        ollama_status = ollama_status_result["status"]
+        ollama_status = model_catalog.health()["status"]
         
         return HealthResponse(
             status="healthy" if ollama_status == "healthy" else "degraded",
@@ -97,17 +458,105 @@ async def health_check():
         )
 
 
+def models_etag() -> str:
+    """
+    Weak ETag for /models: changes with the model list or the resident set
+
+    Request rates in the residency section change on every call and do not
+    count as a change.
+    """
+    material = f"{model_catalog.version}:{','.join(sorted(model_residency.resident))}"
+    return f'W/"{hashlib.sha1(material.encode()).hexdigest()[:16]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``etag``"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
 @router.get("/models")
-async def list_models():
+async def list_models(if_none_match: Optional[str] = Header(None)):
     """
     List available Ollama models
+
+    Served from the in-memory model catalog. Send the ``ETag`` back in
+    ``If-None-Match`` to get ``304 Not Modified`` while nothing changed.
     """
-    try:
-        result = ollama_service.list_models()
-        return result
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to list models: {str(e)}"
-        )
+    etag = models_etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if model_catalog.models is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    result = model_catalog.listing()
+    result["residency"] = model_residency.stats()
+    return JSONResponse(result, headers=headers if model_catalog.models is not None else {})
+
+
+@router.post("/models/refresh")
+async def refresh_models():
+    """
+    Reload the model list from Ollama now (e.g. after pulling a model)
+    """
+    changed = await model_catalog.refresh()
+    return {**model_catalog.listing(), "changed": changed}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """
+    Response cache hit/miss statistics, including the semantic cache
+    """
+    return {**response_cache.stats(), "semantic": semantic_cache.stats()}
+
+
+@router.get("/coalescing/stats")
+async def coalescing_stats():
+    """
+    In-flight request coalescing statistics
+    """
+    return request_coalescer.stats()
+
+
+@router.get("/scheduler/stats")
+async def scheduler_stats():
+    """
+    Per-model concurrency, queue depth and queue wait statistics
+
+    With a shared state, ``cluster`` holds admission counts summed over
+    all workers.
+    """
+    stats = scheduler.stats()
+    if scheduler.state is not None:
+        try:
+            stats["cluster"] = await scheduler.cluster_stats()
+        except STATE_ERRORS:
+            stats["cluster"] = None
+    return stats
+
+
+@router.get("/ratelimit/stats")
+async def rate_limit_stats():
+    """
+    Configured per-client limits and how many requests they refused
+    """
+    return rate_limiter.stats()
+
+
+@router.get("/router/stats")
+async def router_stats():
+    """
+    Routing decisions for ``model="auto"``: chosen models, downgrades,
+    escalations and average latency per route
+    """
+    return model_router.stats()
+
+
+@router.get("/backends")
+async def backends():
+    """
+    Health, circuit state, loaded models and outstanding requests per
+    Ollama node, and hedged request statistics
+    """
+    return {**ollama_service.pool.stats(), "hedging": ollama_service.hedging.stats()}
@@ -0,0 +1,85 @@
+import sys
+from array import array
+from typing import List
+
+import httpx
+import orjson
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from app.core.config import settings
+from app.schemas import EmbeddingRequest, EmbeddingResponse
+from app.services import embedding_batcher, rate_limiter, RateLimitExceeded, tracer
+from .chat import client_id, limited
+
+router = APIRouter()
+
+
+def encode_float32(vectors: List[List[float]]) -> bytes:
+    """Row-major little-endian float32 matrix, 4 bytes per value"""
+    values = array("f", [value for vector in vectors for value in vector])
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+@router.post("/embeddings", response_model=EmbeddingResponse)
+async def embeddings(request: EmbeddingRequest, http_request: Request):
+    """
+    Embed one or more texts with an Ollama embedding model
+
+    Concurrent requests are sent to Ollama together in micro-batches.
+    ``encoding_format="binary"`` returns the vectors as a little-endian
+    float32 matrix (``application/octet-stream``, a quarter of the JSON
+    size) with its shape in ``X-Embedding-Count`` and
+    ``X-Embedding-Dimensions``.
+    """
+    tracer.span_since_start("request.parse")
+    try:
+        headers = await rate_limiter.check(client_id(http_request))
+    except RateLimitExceeded as e:
+        raise limited(e)
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    if not texts:
+        raise HTTPException(status_code=400, detail="No input to embed")
+    if len(texts) > settings.embed_max_inputs:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request has {len(texts)} inputs; the limit is {settings.embed_max_inputs}"
+        )
+    model = request.model or settings.embed_default_model
+    try:
+        vectors = await embedding_batcher.embed(texts, model)
+    except Exception as e:
+        status = 500
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+            # Ollama refused the request (e.g. not an embedding model): pass its status on
+            status = e.response.status_code
+        raise HTTPException(status_code=status, detail=f"Failed to generate embeddings: {str(e)}")
+
+    dimensions = len(vectors[0])
+    if request.encoding_format == "binary":
+        with tracer.span("response.serialize", format="binary"):
+            content = encode_float32(vectors)
+        return Response(
+            content=content,
+            media_type="application/octet-stream",
+            headers={
+                "X-Embedding-Model": model,
+                "X-Embedding-Count": str(len(vectors)),
+                "X-Embedding-Dimensions": str(dimensions),
+                **headers
+            }
+        )
+    # orjson: several times faster than json for long float lists
+    with tracer.span("response.serialize", format="json"):
+        body = orjson.dumps({"model": model, "dimensions": dimensions, "embeddings": vectors})
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@router.get("/embeddings/stats")
+async def embedding_stats():
+    """
+    Micro-batching statistics: requests, upstream batches and batch sizes
+    """
+    return embedding_batcher.stats()
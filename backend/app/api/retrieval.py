@@ -0,0 +1,111 @@
+import asyncio
+import os
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app.core.config import settings
+from app.schemas import IngestFilesRequest, IngestTextRequest
+from app.services import retriever
+
+router = APIRouter()
+
+
+def resolve_files(paths: List[str], root: str, suffixes: List[str]) -> List[str]:
+    """
+    Expand ``paths`` (relative to ``root``) into the text files to ingest
+
+    Directories are walked recursively and only files with one of
+    ``suffixes`` are kept. Paths outside ``root`` (including through
+    symlinks) are refused.
+
+    Raises:
+        ValueError: A path is outside ``root`` or does not exist
+    """
+    root = os.path.realpath(root)
+    files = []
+    for path in paths:
+        full = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, full]) != root:
+            raise ValueError(f"{path} is outside the documents directory")
+        if os.path.isfile(full):
+            files.append(full)
+        elif os.path.isdir(full):
+            for directory, subdirs, names in os.walk(full):
+                subdirs.sort()
+                files.extend(
+                    os.path.join(directory, name) for name in sorted(names)
+                    if os.path.splitext(name)[1].lower() in suffixes
+                )
+        else:
+            raise ValueError(f"{path} does not exist")
+    return list(dict.fromkeys(files))
+
+
+@router.post("/retrieval/documents")
+async def ingest_documents(request: IngestTextRequest):
+    """
+    Add documents given as text to the retrieval index
+
+    Each document is chunked, embedded and indexed under its source name;
+    a source that was indexed before is replaced once its new chunks are
+    in. Unchanged documents are skipped.
+    """
+    return await retriever.ingest_texts(request.documents)
+
+
+@router.post("/retrieval/ingest")
+async def ingest_files(request: IngestFilesRequest):
+    """
+    Add files from the server's documents directory to the retrieval index
+
+    ``paths`` are files or directories relative to ``RETRIEVAL_DOCS_DIR``;
+    directories are read recursively for the configured file types.
+    """
+    if not settings.retrieval_docs_dir:
+        raise HTTPException(status_code=403, detail="File ingestion is disabled (RETRIEVAL_DOCS_DIR is not set)")
+    try:
+        files = await asyncio.to_thread(
+            resolve_files, request.paths, settings.retrieval_docs_dir, settings.retrieval_file_types
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await retriever.ingest_files(files)
+
+
+@router.delete("/retrieval/documents")
+async def delete_document(source: str = Query(...)):
+    """
+    Remove a document from the retrieval index
+    """
+    if not retriever.remove(source):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"success": True}
+
+
+@router.get("/retrieval/search")
+async def search(q: str = Query(..., min_length=1), k: int = Query(None, ge=1, le=50)):
+    """
+    Passages the retriever would add to a prompt for ``q``
+    """
+    return {"query": q, "passages": await retriever.search(q, k)}
+
+
+@router.post("/retrieval/rebuild")
+async def rebuild():
+    """
+    Merge pending index updates and re-cluster the vectors now
+
+    Searches keep being served from the current index until the rebuilt
+    parts are swapped in.
+    """
+    await retriever.rebuild(force=True)
+    return {"success": True, **retriever.stats()}
+
+
+@router.get("/retrieval/stats")
+async def retrieval_stats():
+    """
+    Document index size, search latency and maintenance counters
+    """
+    return retriever.stats()
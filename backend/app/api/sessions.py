@@ -0,0 +1,44 @@
+from fastapi import APIRouter, HTTPException
+from app.schemas import SessionResponse, SessionTurn
+from app.services import conversation_store, context_manager
+
+router = APIRouter()
+
+
+@router.post("/sessions", response_model=SessionResponse)
+async def create_session():
+    """
+    Start a new conversation session
+    """
+    session_id = await conversation_store.create()
+    return SessionResponse(session_id=session_id)
+
+
+@router.get("/sessions/stats")
+async def session_stats():
+    """
+    Conversation store and context window statistics
+    """
+    return {**conversation_store.stats(), "context": context_manager.stats()}
+
+
+@router.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str):
+    """
+    Get the history of a conversation session
+    """
+    turns = await conversation_store.history(session_id)
+    return SessionResponse(
+        session_id=session_id,
+        turns=[SessionTurn(role=role, content=content) for role, content in turns]
+    )
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """
+    Delete a conversation session
+    """
+    if not await conversation_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"success": True}
@@ -0,0 +1,144 @@
+"""
+Wire formats for the /chat/stream endpoint
+
+Protocol 1 (legacy) resends the accumulated ``full_response`` in every
+event. Protocol 2 sends only the new text per event and the final text and
+metadata once, in the terminal ``done`` event. Both are carried as
+Server-Sent Events with numbered frames and heartbeat comments.
+"""
+
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+import orjson
+
+from app.services.stream_registry import HEARTBEAT
+from app.services.tracing import tracer
+
+# SSE comment line; keeps proxies and idle timeouts from closing the stream
+KEEPALIVE = ": keepalive\n\n"
+
+
+def format_event(data: Dict[str, Any], compact: bool = True) -> str:
+    """Serialize a payload as a single ``data:`` frame (protocol 1 keeps the old spacing)"""
+    if compact:
+        return f"data: {orjson.dumps(data).decode()}\n\n"
+    return f"data: {json.dumps(data)}\n\n"
+
+
+async def iter_payloads(events: AsyncIterator[Optional[Dict[str, Any]]], protocol: int = 1) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Turn service stream events into wire payloads for a protocol version
+
+    Args:
+        events: Events yielded by OllamaService.stream_response, possibly
+            interleaved with HEARTBEAT (None) markers
+        protocol: Stream protocol version (1 or 2)
+
+    Yields:
+        Payload dicts, with HEARTBEAT markers passed through
+    """
+    if protocol == 2:
+        async for event in events:
+            if event is HEARTBEAT:
+                yield HEARTBEAT
+                continue
+            if not event.get("success", False):
+                yield {"error": event.get("error", "Unknown error"), "done": True}
+                return
+            if event.get("done"):
+                final = {
+                    "done": True,
+                    "response": event["response"],
+                    "model": event["model"],
+                    "timestamp": event["timestamp"]
+                }
+                if event.get("cached"):
+                    final["cached"] = True
+                if event.get("session_id"):
+                    final["session_id"] = event["session_id"]
+                yield final
+                return
+            yield {"chunk": event["chunk"]}
+        return
+
+    full_response = ""
+    async for event in events:
+        if event is HEARTBEAT:
+            yield HEARTBEAT
+            continue
+        if not event.get("success", False):
+            yield {"error": event.get("error", "Unknown error")}
+            break
+        full_response += event["chunk"]
+        yield {
+            "chunk": event["chunk"],
+            "full_response": full_response,
+            "model": event["model"],
+            "timestamp": event.get("timestamp") or datetime.now().isoformat(),
+            "success": True,
+            "done": event["done"]
+        }
+
+    # Send end signal
+    yield {"done": True}
+
+
+async def encode_stream(events: AsyncIterator[Dict[str, Any]], protocol: int = 1) -> AsyncIterator[str]:
+    """
+    Encode service stream events for the requested protocol version
+
+    Args:
+        events: Events yielded by OllamaService.stream_response
+        protocol: Stream protocol version (1 or 2)
+
+    Yields:
+        Encoded frames ready to be written to the response
+    """
+    async for payload in iter_payloads(events, protocol):
+        yield KEEPALIVE if payload is HEARTBEAT else format_event(payload, compact=protocol == 2)
+
+
+async def encode_sse(events: AsyncIterator[Optional[Dict[str, Any]]], protocol: int = 1,
+                     last_event_id: int = 0, retry: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Encode service stream events as Server-Sent Events
+
+    Frames are numbered from 1 in order. The numbering depends only on
+    the event log, so replaying the log gives every frame the same ID.
+    A reconnecting client therefore gets exactly the frames after its
+    ``Last-Event-ID``.
+
+    Args:
+        events: Events from the start of the stream, with HEARTBEAT markers
+        protocol: Stream protocol version (1 or 2)
+        last_event_id: Last frame the client already received
+        retry: Reconnection delay to suggest to EventSource clients (ms)
+
+    Yields:
+        ``id:``/``data:`` frames and ``:`` heartbeat comments
+    """
+    # Serialization is spread over the whole stream, so it is recorded as
+    # the time spent encoding frames rather than as a span of its own
+    span = tracer.start_span("response.stream", protocol=protocol)
+    encoding = 0
+    event_id = 0
+    try:
+        if retry is not None:
+            yield f"retry: {retry}\n\n"
+        async for payload in iter_payloads(events, protocol):
+            if payload is HEARTBEAT:
+                yield KEEPALIVE
+                continue
+            event_id += 1
+            if event_id > last_event_id:
+                start = time.perf_counter_ns()
+                frame = f"id: {event_id}\n{format_event(payload, compact=protocol == 2)}"
+                encoding += time.perf_counter_ns() - start
+                yield frame
+    finally:
+        span.set("frames", max(event_id - last_event_id, 0))
+        span.set("serialize_ms", encoding / 1e6)
+        span.end()
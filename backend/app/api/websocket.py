@@ -0,0 +1,270 @@
+"""
+WebSocket chat endpoint carrying several conversations over one socket
+
+Every frame is a compact JSON array whose first element is the frame type.
+
+Client to server:
+    ["chat", id, {message, model, options, session_id, priority, use_cache, use_retrieval}]
+    ["cancel", id]          stop the generation for conversation ``id``
+    ["regen", id]           regenerate the last answer of conversation ``id``
+    ["ack", n]              the client has processed ``n`` data frames in total
+    ["ping"]
+
+Server to client:
+    ["ready", {window, max_streams}]
+    ["queued", id, {estimated_wait}]    pushed while waiting for a model slot
+    ["start", id, request_id]
+    ["tok", id, text]                   new text only
+    ["done", id, {response, model, timestamp, cached?, session_id?}]
+    ["err", id, message, {retry_after?}]   also when the client is over its rate limit
+    ["pong"]
+
+``tok``, ``done`` and ``err`` are data frames and use flow control. The
+server sends at most ``window`` data frames the client has not acked yet,
+and a conversation stops reading its generation while the socket is out of
+credit, so a client that does not ack slows Ollama down instead of filling
+server memory. Control frames are never held back.
+"""
+
+import asyncio
+import json
+from collections import OrderedDict, deque
+from contextlib import aclosing
+from typing import Any, Deque, Dict, List, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from app.core.config import settings
+from app.schemas import ChatRequest
+from app.services import (
+    conversation_store, metrics, model_catalog, UnknownModel, scheduler, stream_registry, SchedulerRejected,
+    rate_limiter, RateLimitExceeded
+)
+from app.services.model_router import AUTO_MODEL
+from .chat import REQUEST_ID_PATTERN, client_id, open_stream
+
+router = APIRouter()
+
+
+def encode_frame(frame: List[Any]) -> str:
+    return json.dumps(frame, separators=(",", ":"))
+
+
+class _Conversation:
+    __slots__ = ("id", "request", "task", "request_id", "completed")
+
+    def __init__(self, conversation_id: str, request: ChatRequest):
+        self.id = conversation_id
+        self.request = request
+        self.task: Optional[asyncio.Task] = None
+        self.request_id: Optional[str] = None
+        self.completed = False
+
+
+class ChatSocket:
+    """
+    One WebSocket connection and its conversations
+
+    Frames leave through a single writer task: control frames first, then
+    data frames while the client has credit left. Generating conversations
+    wait in ``data()`` until a frame fits in the window.
+    """
+
+    def __init__(self, websocket: WebSocket, window: int, max_streams: int, max_conversations: int = 100):
+        self.websocket = websocket
+        self.window = window
+        self.max_streams = max_streams
+        self.max_conversations = max_conversations
+        self.sent = 0
+        self.acked = 0
+        self._control: Deque[List[Any]] = deque()
+        self._data: Deque[List[Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._credit = asyncio.Event()  # set when acks free up window space
+        self._conversations: "OrderedDict[str, _Conversation]" = OrderedDict()
+
+    def control(self, frame: List[Any]):
+        self._control.append(frame)
+        self._wakeup.set()
+
+    async def data(self, frame: List[Any]):
+        """Queue a data frame once the window has room for it"""
+        while self.sent - self.acked + len(self._data) >= self.window:
+            self._credit.clear()
+            await self._credit.wait()
+        self._push(frame)
+
+    def _push(self, frame: List[Any]):
+        self._data.append(frame)
+        self._wakeup.set()
+
+    def ack(self, count: int):
+        if count > self.acked:
+            self.acked = min(count, self.sent)
+            self._wakeup.set()
+            self._credit.set()
+
+    async def writer(self):
+        while True:
+            if self._control:
+                await self.websocket.send_text(encode_frame(self._control.popleft()))
+            elif self._data and self.sent - self.acked < self.window:
+                self.sent += 1
+                await self.websocket.send_text(encode_frame(self._data.popleft()))
+            else:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+    def _running(self) -> int:
+        return sum(1 for c in self._conversations.values() if c.task is not None and not c.task.done())
+
+    def _error(self, conversation_id: Optional[str], message: str, **info):
+        # Not held back for credit: errors are raised while handling client
+        # frames, and waiting there would stop the acks from being read
+        self._push(["err", conversation_id, message, info] if info else ["err", conversation_id, message])
+
+    async def handle(self, text: str):
+        try:
+            frame = json.loads(text)
+            kind = frame[0]
+        except (ValueError, TypeError, IndexError, KeyError):
+            self._error(None, "Malformed frame")
+            return
+
+        if kind == "ack" and len(frame) == 2 and isinstance(frame[1], int):
+            self.ack(frame[1])
+        elif kind == "ping":
+            self.control(["pong"])
+        elif kind == "chat" and len(frame) == 3 and isinstance(frame[2], dict):
+            self._chat(frame[1], frame[2])
+        elif kind == "cancel" and len(frame) == 2:
+            self._cancel(frame[1])
+        elif kind == "regen" and len(frame) == 2:
+            await self._regenerate(frame[1])
+        else:
+            self._error(None, f"Unknown frame type: {kind}")
+
+    def _chat(self, conversation_id: Any, payload: Dict[str, Any]):
+        if not isinstance(conversation_id, str) or not REQUEST_ID_PATTERN.match(conversation_id):
+            self._error(None, "Invalid conversation id")
+            return
+        current = self._conversations.get(conversation_id)
+        if current is not None and current.task is not None and not current.task.done():
+            self._error(conversation_id, "Conversation is already generating")
+            return
+        if stream_registry.draining:
+            self._error(conversation_id, "Server shutting down", retry_after=1)
+            return
+        if self._running() >= self.max_streams:
+            self._error(conversation_id, "Too many concurrent conversations on this socket")
+            return
+        try:
+            request = ChatRequest(**payload)
+        except ValidationError as e:
+            self._error(conversation_id, f"Invalid request: {e.errors()[0]['msg']}")
+            return
+        self._start(_Conversation(conversation_id, request))
+
+    def _start(self, conversation: _Conversation):
+        self._conversations.pop(conversation.id, None)
+        self._conversations[conversation.id] = conversation
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+        conversation.task = asyncio.create_task(self._generate(conversation))
+
+    def _cancel(self, conversation_id: Any):
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None or conversation.task is None or conversation.task.done():
+            self._error(conversation_id, "Conversation is not generating")
+        elif conversation.request_id is None or not stream_registry.cancel(conversation.request_id):
+            # Still waiting to start: nothing generated yet
+            conversation.task.cancel()
+            self._error(conversation_id, "Request cancelled")
+
+    async def _regenerate(self, conversation_id: Any):
+        conversation = self._conversations.get(conversation_id)
+        if conversation is None:
+            self._error(conversation_id, "Unknown conversation")
+            return
+        if conversation.task is not None and not conversation.task.done():
+            self._cancel(conversation_id)
+            await asyncio.gather(conversation.task, return_exceptions=True)
+        request = conversation.request
+        if conversation.completed and request.session_id:
+            # Replace the previous answer instead of adding a second one
+            await conversation_store.drop_last(request.session_id, 2)
+        self._start(_Conversation(conversation_id, request.model_copy(update={"use_cache": False})))
+
+    async def _generate(self, conversation: _Conversation):
+        request = conversation.request
+        try:
+            model = request.model or settings.default_model
+            if model != AUTO_MODEL:
+                model_catalog.check(model)
+            # Routed requests are sent to a model whose wait is within the router's SLO
+            wait = scheduler.estimated_wait(model) if model != AUTO_MODEL else 0.0
+            if wait > 0:
+                self.control(["queued", conversation.id, {"estimated_wait": round(wait, 2)}])
+            await rate_limiter.check(client_id(self.websocket))
+            model, events = await open_stream(request, self.websocket)
+        except RateLimitExceeded as e:
+            self._error(conversation.id, f"Rate limit exceeded: {e.limit_name}", retry_after=round(e.retry_after, 2))
+            return
+        except SchedulerRejected as e:
+            self._error(conversation.id, f"Server busy: {e}", retry_after=round(e.retry_after, 2))
+            return
+        except UnknownModel as e:
+            self._error(conversation.id, str(e))
+            return
+        except Exception as e:
+            self._error(conversation.id, f"Internal server error: {e}")
+            return
+
+        conversation.request_id = stream_registry.new_id()
+        self.control(["start", conversation.id, conversation.request_id])
+        # Sockets cannot resume a stream: it stops with the conversation
+        async with aclosing(stream_registry.guard(conversation.request_id, model, events, resumable=False)) as events:
+            async for event in events:
+                if not event.get("success", False):
+                    self._error(conversation.id, event.get("error", "Unknown error"))
+                    return
+                if event.get("done"):
+                    final = {"response": event["response"], "model": event["model"], "timestamp": event["timestamp"]}
+                    if event.get("cached"):
+                        final["cached"] = True
+                    if event.get("session_id"):
+                        final["session_id"] = event["session_id"]
+                    conversation.completed = True
+                    await self.data(["done", conversation.id, final])
+                    return
+                if event["chunk"]:
+                    await self.data(["tok", conversation.id, event["chunk"]])
+
+    async def run(self):
+        writer = asyncio.create_task(self.writer())
+        self.control(["ready", {"window": self.window, "max_streams": self.max_streams}])
+        try:
+            while True:
+                await self.handle(await self.websocket.receive_text())
+        except WebSocketDisconnect:
+            pass
+        finally:
+            # Socket gone: readers leave and the registry stops the generations at once
+            tasks = [c.task for c in self._conversations.values() if c.task is not None]
+            for task in tasks + [writer]:
+                task.cancel()
+            await asyncio.gather(*tasks, writer, return_exceptions=True)
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    Multiplexed chat over one WebSocket (see the module docstring for frames)
+    """
+    await websocket.accept()
+    metrics.ws_connections.inc()
+    try:
+        await ChatSocket(websocket, settings.ws_window, settings.ws_max_streams).run()
+    finally:
+        metrics.ws_connections.dec()
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 
 
 class Settings(BaseSettings):
@@ -22,7 +22,180 @@ class Settings(BaseSettings):
     # Ollama settings
     ollama_host: str = "http://localhost:11434"
     default_model: str = "mistral:latest"
+
+    # Ollama HTTP connection pool (shared by all Ollama traffic)
+    ollama_max_connections: int = 100
+    ollama_max_keepalive_connections: int = 20
+    ollama_keepalive_expiry: float = 30.0  # seconds an idle connection is kept open
+    ollama_connect_timeout: float = 5.0
+    ollama_read_timeout: Optional[float] = 300.0  # None waits indefinitely
+    ollama_write_timeout: Optional[float] = 60.0  # sending the request body (large prompts)
+    ollama_pool_timeout: Optional[float] = 10.0  # wait for a free connection
+    ollama_first_token_timeout: Optional[float] = 120.0  # give up on a node (and fail over) after this
+
+    # Several Ollama nodes to balance across (falls back to ollama_host)
+    ollama_hosts: List[str] = []
+    ollama_health_interval: float = 10.0  # seconds between /api/ps checks, 0 disables
+    catalog_refresh_interval: float = 30.0  # seconds between /api/tags refreshes, 0 disables
+
+    # Circuit breaker per Ollama node: no requests to a node that keeps failing or stalling
+    breaker_enabled: bool = True
+    breaker_window: int = 20  # recent requests the failure ratio is computed over
+    breaker_min_calls: int = 5
+    breaker_failure_ratio: float = 0.5  # share of failed or slow requests that opens the circuit
+    breaker_slow_call_seconds: float = 30.0  # a first token later than this counts as a failure
+    breaker_open_seconds: float = 30.0  # then one probe request is let through
+    breaker_half_open_probes: int = 1
+
+    # Hedged requests: a late first token triggers a second copy on another node
+    hedge_enabled: bool = True  # only has an effect with several Ollama nodes
+    hedge_min_delay: float = 0.1  # seconds; the delay is the p95 first-token latency, at least this
+    hedge_default_delay: float = 2.0  # until enough first-token latencies are known
+    hedge_budget_ratio: float = 0.05  # extra requests hedging may add, as a share of all requests
+    hedge_budget_burst: float = 10.0
     
+    # Response cache (memory LRU, plus an SQLite tier when a path is set)
+    cache_enabled: bool = True
+    cache_ttl: float = 3600.0
+    cache_max_entries: int = 1000
+    cache_max_bytes: int = 50 * 1024 * 1024
+    cache_disk_path: Optional[str] = None
+    cache_disk_max_entries: int = 100000
+
+    # Semantic cache: reuse answers to paraphrased prompts (prompts without history only)
+    semantic_cache_enabled: bool = False
+    semantic_cache_model: str = "nomic-embed-text"  # Ollama embedding model
+    semantic_cache_threshold: float = 0.92  # minimum cosine similarity for a hit
+    semantic_cache_top_k: int = 5
+    semantic_cache_max_entries: int = 10000
+    semantic_cache_path: Optional[str] = None  # file prefix for the memory-mapped index
+
+    # Model residency: preloading, keep-alive pings and a per-node memory budget
+    residency_preload_models: List[str] = []
+    residency_keep_alive: str = "10m"  # how long Ollama keeps a pinged model loaded
+    residency_interval: float = 120.0  # seconds between keep-alive rounds, 0 disables
+    residency_memory_budget_mb: float = 0.0  # 0 = no budget, nothing is unloaded
+    residency_model_sizes_mb: Dict[str, float] = {}  # overrides sizes reported by Ollama
+    residency_rate_window: float = 300.0  # seconds over which request rates are averaged
+    residency_min_rate: float = 0.1  # requests per minute a model needs to stay resident
+
+    # Server-Sent Events for /chat/stream
+    sse_heartbeat_interval: float = 15.0  # seconds between keepalive comments
+    sse_retry_ms: int = 3000  # reconnect delay suggested to EventSource clients
+    sse_resume_grace: float = 10.0  # keep generating this long after a disconnect
+    sse_replay_ttl: float = 60.0  # keep finished streams replayable this long
+    sse_replay_max_streams: int = 1000
+
+    # Token coalescing for streamed answers: a frame is sent after this many
+    # tokens, bytes or milliseconds, whichever comes first (1 token = no coalescing)
+    stream_flush_tokens: int = 1
+    stream_flush_bytes: int = 1024
+    stream_flush_ms: float = 50.0
+    # Backpressure: events read from Ollama ahead of the fastest reader of a stream
+    stream_read_ahead: int = 64
+
+    # WebSocket chat (/ws): unacked data frames per socket, concurrent generations per socket
+    ws_window: int = 256
+    ws_max_streams: int = 8
+
+    # Prometheus metrics at /metrics
+    metrics_enabled: bool = True
+
+    # Request tracing: a span per request stage, slowest requests at /debug/traces
+    tracing_enabled: bool = True
+    tracing_sample_rate: float = 1.0  # share of traces kept; slow and failed ones are always kept
+    tracing_slow_seconds: float = 5.0
+    tracing_buffer_size: int = 1000  # recent kept traces held in memory
+    tracing_export_path: Optional[str] = None  # append kept traces here as OTLP/JSON lines
+    tracing_max_spans: int = 500  # per trace, so large batches stay bounded
+
+    # Share one upstream generation between identical concurrent requests
+    coalesce_requests: bool = True
+
+    # Conversation sessions (in memory, persisted to SQLite when a path is set)
+    session_ttl: float = 24 * 3600.0  # idle seconds before a session expires
+    session_max_sessions: int = 10000
+    session_max_turns: int = 200
+    session_max_bytes: int = 100 * 1024 * 1024
+    session_db_path: Optional[str] = None
+
+    # Context window: prompt token budget per model and how old turns are handled
+    context_default_budget: int = 4096
+    context_model_budgets: Dict[str, int] = {}
+    context_trim_ratio: float = 0.6  # fraction of the budget kept after a trim
+    context_summarize: bool = True  # summarize dropped turns instead of forgetting them
+    context_summary_model: Optional[str] = None  # defaults to the chat model
+    context_summary_max_tokens: int = 256
+
+    # Admission control: concurrent generations per model and queueing limits
+    scheduler_enabled: bool = True
+    scheduler_default_concurrency: int = 4
+    scheduler_model_concurrency: Dict[str, int] = {}
+    scheduler_max_queue: int = 100  # waiting requests per model
+    scheduler_max_queue_wait: float = 30.0  # reject when the expected wait is longer
+    scheduler_short_prompt_tokens: int = 256  # prompts up to this size use the interactive lane
+    scheduler_aging: float = 10.0  # seconds before a lower-priority request is served anyway
+
+    # Model router for model="auto": tiers from cheapest to most capable (empty = default_model)
+    router_models: List[str] = []
+    router_short_prompt_tokens: int = 200  # longer prompts start one tier up
+    router_escalate_patterns: List[str] = [  # each match moves the prompt one tier up
+        r"```",
+        r"\b(step[- ]by[- ]step|prove|derive|analy[sz]e|debug|refactor|implement)\b"
+    ]
+    router_uncertain_patterns: List[str] = [  # answers matching these fail the answer check
+        r"\bI(?:'m| am) not (?:sure|certain)\b",
+        r"\bI (?:don't|do not) know\b",
+        r"\bI (?:can't|cannot) (?:answer|help)\b"
+    ]
+    router_min_answer_chars: int = 1  # shorter answers fail the answer check
+    router_cascade: bool = True  # regenerate failed answers on the next tier (non-streaming only)
+    router_queue_slo: float = 2.0  # seconds of expected queue wait before moving to a lighter tier
+
+    # Batch chat: parallel items per batch and input limits
+    batch_concurrency: int = 4
+    batch_max_concurrency: int = 32
+    batch_max_items: int = 10000
+    batch_max_retries: int = 5  # retries per item when the scheduler is busy
+
+    # Embeddings (/embeddings): concurrent requests are sent to Ollama in micro-batches
+    embed_default_model: str = "nomic-embed-text"
+    embed_batch_size: int = 64  # texts per upstream call, 1 disables batching
+    embed_batch_wait_ms: float = 5.0  # how long the first text waits for others
+    embed_max_inputs: int = 2048  # texts per request
+
+    # Per-client rate limits (by API key, else client IP); 0 disables a limit
+    api_keys: List[str] = []  # keys that identify a client, plain or "sha256:<hex digest>"; others count by IP
+    rate_limit_requests_per_minute: float = 0.0
+    rate_limit_request_burst: int = 0  # 0 = one minute's worth
+    rate_limit_tokens_per_minute: float = 0.0  # generated tokens
+    rate_limit_token_burst: int = 0  # 0 = one minute's worth
+    rate_limit_max_clients: int = 1000000  # in-process buckets kept (about 100 bytes each)
+
+    # Retrieval-augmented chat: local document index used with use_retrieval
+    retrieval_embed_model: str = "nomic-embed-text"  # Ollama embedding model
+    retrieval_index_path: Optional[str] = None  # file prefix for the persisted index
+    retrieval_docs_dir: Optional[str] = None  # /retrieval/ingest only reads files under this directory
+    retrieval_file_types: List[str] = [".txt", ".md", ".rst"]
+    retrieval_max_chunks: int = 100000
+    retrieval_chunk_words: int = 200
+    retrieval_chunk_overlap: int = 40  # words repeated from the previous chunk
+    retrieval_embed_batch: int = 32  # chunks per /api/embed call
+    retrieval_embed_concurrency: int = 4  # embedding calls in flight while ingesting
+    retrieval_top_k: int = 4  # passages added to the prompt
+    retrieval_nprobe: int = 8  # vector clusters scanned per query
+    retrieval_ivf_min_chunks: int = 20000  # below this every vector is scanned
+
+    # Startup: backend checks, model preloads and index loads run in the background
+    warmup_timeout: float = 60.0  # seconds each warm-up step may take
+
+    # Multi-worker deployment: state shared between worker processes
+    workers: int = 0  # worker processes in production mode, 0 = one per CPU core
+    shared_state_url: Optional[str] = None  # redis://[:password@]host:port/db, None = in-process
+    shared_state_prefix: str = "ollama-chat:"
+    scheduler_publish_interval: float = 5.0  # seconds between scheduler counter publishes
+    shutdown_drain_timeout: float = 30.0  # seconds in-flight streams may finish on shutdown
+
     # API settings
     api_prefix: str = "/api/v1"
     
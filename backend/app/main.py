@@ -1,7 +1,187 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.api import api_router
 from app.core.config import settings
+from app.services import (
+    ollama_service,
+    context_manager,
+    conversation_store,
+    embedding_batcher,
+    metrics,
+    model_catalog,
+    model_residency,
+    response_cache,
+    retriever,
+    scheduler,
+    semantic_cache,
+    shared_state,
+    stream_registry,
+    tracer,
+    warmup,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open shared resources on startup and release them on shutdown
+
+    Nothing here waits on the network or the disk: backend checks, model
+    preloads, opening the cache and session databases and the semantic and
+    document index loads run as background warm-up, so the server accepts
+    connections (and answers /livez) right away.
+    """
+    async def check_backends():
+        # Health first, so the catalog reuses the connections it opened
+        await ollama_service.startup()
+        await model_catalog.startup()
+
+    await scheduler.startup()
+    warmup.start(
+        {
+            "backends": check_backends,
+            "models": model_residency.startup,
+            "response_cache": response_cache.warm,
+            "sessions": conversation_store.warm,
+            "semantic_cache": semantic_cache.warm,
+            "retrieval": retriever.warm,
+        },
+        required=["backends"]
+    )
+    yield
+    # Let in-flight streams finish before their connections go away
+    await stream_registry.drain(settings.shutdown_drain_timeout)
+    await warmup.shutdown()
+    await model_catalog.shutdown()
+    await scheduler.shutdown()
+    await model_residency.shutdown()
+    await context_manager.drain()
+    await retriever.shutdown()
+    await embedding_batcher.shutdown()
+    semantic_cache.flush()
+    retriever.flush()
+    tracer.close()
+    await ollama_service.shutdown()
+    await shared_state.close()
+
+
+class RouteLabels:
+    """Base for middlewares that label requests by their route's path template"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route(self, scope) -> str:
+        if self._routes is None:
+            self._routes = {
+                getattr(route, "endpoint", None): route.path for route in scope["app"].routes
+            }
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+
+class MetricsMiddleware(RouteLabels):
+    """
+    Count requests and time them until the last body byte is sent
+
+    Plain ASGI rather than BaseHTTPMiddleware so streamed responses pass
+    through untouched. Routes are labelled by their path template to keep
+    label cardinality bounded.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.http_in_flight.dec()
+            metrics.observe_request(scope["method"], self._route(scope), status, time.perf_counter() - start)
+
+
+class TracingMiddleware(RouteLabels):
+    """
+    Trace each HTTP request from arrival until the last body byte is sent
+
+    Opens the root span that handler and service spans attach to, continues
+    the caller's trace when a W3C ``traceparent`` header is sent, and returns
+    the trace ID in ``X-Trace-ID`` and ``traceparent`` response headers.
+    Probes, /metrics and /debug are not traced.
+    """
+
+    SKIP = ("/livez", "/readyz", "/ping", "/metrics")
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not tracer.enabled or path in self.SKIP or path.startswith("/debug/"):
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        trace = tracer.start_trace(scope["method"], traceparent, {"http.request.method": scope["method"], "url.path": path})
+        root = trace.root
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.error = f"HTTP {message['status']}"
+                message["headers"] = [*message.get("headers", ()), *tracer.headers(trace)]
+            await send(message)
+
+        token = tracer.activate(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.fail(e)
+            raise
+        finally:
+            tracer.deactivate(token)
+            route = self._route(scope)
+            root.name = f"{scope['method']} {route}"
+            root.set("http.route", route)
+            tracer.finish(trace)
+
+
+class WarmupGate:
+    """
+    Hold requests that arrive before the required warm-up steps finish
+
+    The server accepts connections at once so probes answer, but traffic
+    waits for the first backend check (bounded by its timeout) so it is
+    routed with real health information. Afterwards this is a flag check.
+    """
+
+    PROBES = ("/livez", "/readyz", "/ping", "/metrics")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and not warmup.ready and scope["path"] not in self.PROBES:
+            await warmup.wait(required_only=True)
+        await self.app(scope, receive, send)
+
 
 # Create FastAPI application
 app = FastAPI(
@@ -9,7 +189,8 @@ app = FastAPI(
     version=settings.version,
     debug=settings.debug,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -19,8 +200,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # X-Request-ID is read by clients to resume or cancel streams
+    expose_headers=["X-Request-ID", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset",
+                    "RateLimit-Policy", "Retry-After", "X-Embedding-Model", "X-Embedding-Count",
+                    "X-Embedding-Dimensions", "X-Trace-ID", "traceparent"],
 )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(WarmupGate)
+app.add_middleware(TracingMiddleware)  # outermost, so time held by the warm-up gate shows up
+
 # Include API router
 app.include_router(api_router, prefix=settings.api_prefix)
 
@@ -35,12 +224,69 @@ async def root():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/traces")
+async def debug_traces(
+    limit: int = Query(20, ge=1, le=1000),
+    min_duration_ms: float = Query(0.0, ge=0),
+    format: Literal["summary", "otlp"] = "summary"
+):
+    """
+    Slowest recent requests, slowest first
+
+    ``summary`` lists each trace's spans as offsets from the start of the
+    request; ``otlp`` returns the same traces as an OTLP/JSON export request.
+    """
+    traces = tracer.slowest(limit, min_duration_ms)
+    if format == "otlp":
+        return tracer.to_otlp(traces)
+    return {"traces": [tracer.summary(trace) for trace in traces], "tracing": tracer.stats()}
+
+
+@app.get("/debug/traces/{trace_id}")
+async def debug_trace(trace_id: str, format: Literal["summary", "otlp"] = "summary"):
+    """One recent trace by ID (from the X-Trace-ID response header)"""
+    trace = tracer.find(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (not sampled, or no longer buffered)")
+    return tracer.to_otlp([trace]) if format == "otlp" else tracer.summary(trace)
+
+
 @app.get("/ping")
 async def ping():
     """Simple ping endpoint"""
     return {"message": "pong"}
 
 
+@app.get("/livez")
+async def livez():
+    """Liveness probe: the process is up and its event loop is responsive"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness probe: 200 once warm-up has checked the Ollama nodes (and
+    loaded the model list) and at least one is healthy, 503 before that
+    and while draining
+    """
+    healthy = sum(1 for backend in ollama_service.pool.backends if backend.healthy)
+    ready = warmup.ready and healthy > 0 and not stream_registry.draining
+    body = {
+        "status": "ready" if ready else "not ready",
+        "healthy_backends": healthy,
+        "draining": stream_registry.draining,
+        "warmup": warmup.stats()
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
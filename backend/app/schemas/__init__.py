@@ -1,3 +1,15 @@
-from .chat import ChatRequest, ChatResponse, HealthResponse
+from .chat import ChatRequest, ChatResponse, HealthResponse, SessionResponse, SessionTurn
+from .retrieval import IngestFilesRequest, IngestTextRequest
+from .embeddings import EmbeddingRequest, EmbeddingResponse
 
-__all__ = ["ChatRequest", "ChatResponse", "HealthResponse"]
+__all__ = [
+    "ChatRequest",
+    "ChatResponse",
+    "HealthResponse",
+    "SessionResponse",
+    "SessionTurn",
+    "IngestFilesRequest",
+    "IngestTextRequest",
+    "EmbeddingRequest",
+    "EmbeddingResponse",
+]
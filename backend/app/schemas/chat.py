@@ -1,11 +1,24 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
 
 
 class ChatRequest(BaseModel):
     """Request model for chat endpoint"""
     message: str
+    # "auto" lets the server pick a model by prompt size, answer quality and load
     model: Optional[str] = "mistral:latest"
+    # /chat/stream wire format: 1 = legacy full_response per event, 2 = delta-only
+    stream_protocol: Literal[1, 2] = 1
+    # Ollama generation options (temperature, num_predict, ...)
+    options: Optional[Dict[str, Any]] = None
+    # False skips the cache lookup; the fresh answer still refreshes the cache
+    use_cache: bool = True
+    # Scheduling lane; by default short prompts are treated as interactive
+    priority: Optional[Literal["interactive", "standard", "batch"]] = None
+    # Continue a server-side conversation; unknown IDs start a new session
+    session_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{1,64}$")
+    # Ground the answer in passages from the local document index
+    use_retrieval: bool = False
 
 
 class ChatResponse(BaseModel):
@@ -13,6 +26,8 @@ class ChatResponse(BaseModel):
     response: str
     model: str
     timestamp: str
+    cached: bool = False
+    session_id: Optional[str] = None
 
 
 class HealthResponse(BaseModel):
@@ -20,3 +35,15 @@ class HealthResponse(BaseModel):
     status: str
     message: str
     ollama_status: str
+
+
+class SessionTurn(BaseModel):
+    """A single turn of a conversation"""
+    role: str
+    content: str
+
+
+class SessionResponse(BaseModel):
+    """Response model for session endpoints"""
+    session_id: str
+    turns: List[SessionTurn] = []
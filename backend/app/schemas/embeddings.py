@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+
+
+class EmbeddingRequest(BaseModel):
+    """Request model for the embeddings endpoint"""
+    # One text or a list of texts
+    input: Union[str, List[str]]
+    # Ollama embedding model (defaults to the configured one)
+    model: Optional[str] = None
+    # "float" = JSON arrays, "binary" = little-endian float32 matrix (application/octet-stream)
+    encoding_format: Literal["float", "binary"] = "float"
+
+
+class EmbeddingResponse(BaseModel):
+    """Response model for the embeddings endpoint (JSON encoding)"""
+    model: str
+    dimensions: int
+    embeddings: List[List[float]]
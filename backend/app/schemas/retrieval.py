@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List
+
+
+class IngestTextRequest(BaseModel):
+    """Documents to index, given as text"""
+    # Source name (e.g. a path or URL) -> document text
+    documents: Dict[str, str] = Field(min_length=1)
+
+
+class IngestFilesRequest(BaseModel):
+    """Files or directories under the configured documents directory"""
+    paths: List[str] = Field(min_length=1)
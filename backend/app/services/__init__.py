@@ -1,3 +1,42 @@
+from .shared_state import shared_state
 from .ollama_service import ollama_service
+from .response_cache import response_cache
+from .request_coalescer import request_coalescer
+from .conversation_store import conversation_store
+from .context_manager import context_manager
+from .scheduler import scheduler, SchedulerRejected
+from .metrics import metrics
+from .stream_registry import stream_registry
+from .model_residency import model_residency
+from .model_catalog import model_catalog, UnknownModel
+from .semantic_cache import semantic_cache
+from .warmup import warmup
+from .rate_limiter import rate_limiter, RateLimitExceeded
+from .retrieval import retriever
+from .embedding_batcher import embedding_batcher
+from .model_router import model_router
+from .tracing import tracer
 
-__all__ = ["ollama_service"]
+__all__ = [
+    "shared_state",
+    "ollama_service",
+    "response_cache",
+    "request_coalescer",
+    "conversation_store",
+    "context_manager",
+    "scheduler",
+    "SchedulerRejected",
+    "metrics",
+    "stream_registry",
+    "model_residency",
+    "model_catalog",
+    "UnknownModel",
+    "semantic_cache",
+    "warmup",
+    "rate_limiter",
+    "RateLimitExceeded",
+    "retriever",
+    "embedding_batcher",
+    "model_router",
+    "tracer",
+]
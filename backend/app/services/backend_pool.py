@@ -0,0 +1,339 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+import httpx
+from app.core.config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def create_client(host: str) -> httpx.AsyncClient:
+    """Build a pooled keep-alive client for one Ollama node from settings"""
+    return httpx.AsyncClient(
+        base_url=host,
+        limits=httpx.Limits(
+            max_connections=settings.ollama_max_connections,
+            max_keepalive_connections=settings.ollama_max_keepalive_connections,
+            keepalive_expiry=settings.ollama_keepalive_expiry
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.ollama_connect_timeout,
+            read=settings.ollama_read_timeout,
+            write=settings.ollama_write_timeout,
+            pool=settings.ollama_pool_timeout
+        )
+    )
+
+
+class CircuitBreaker:
+    """
+    Stops traffic to an Ollama node that keeps failing or answering slowly
+
+    Closed, the outcomes of the last ``window`` requests are kept; a failed
+    request or one whose first token took longer than ``slow_seconds``
+    counts as bad. Once at least ``min_calls`` outcomes are known and the
+    bad share reaches ``failure_ratio``, the circuit opens and the node gets
+    no requests for ``open_seconds``. Then it is half-open: ``probes``
+    requests at a time are let through, and the first outcome closes the
+    circuit again (good) or reopens it (bad). A probe that never reports
+    back stops counting after ``slow_seconds``.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, window: int = 20, min_calls: int = 5, failure_ratio: float = 0.5,
+                 slow_seconds: float = 30.0, open_seconds: float = 30.0, probes: int = 1,
+                 enabled: bool = True, name: str = ""):
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.enabled = enabled
+        self.name = name
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True = bad
+        self._opened_at: Optional[float] = None
+        self._probes: List[float] = []  # start times of requests sent while half-open
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at < self.open_seconds:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Whether the node may get a request now"""
+        if not self.enabled:
+            return True
+        state = self.state
+        if state != self.HALF_OPEN:
+            return state == self.CLOSED
+        now = time.monotonic()
+        self._probes = [start for start in self._probes if now - start < self.slow_seconds]
+        return len(self._probes) < self.probes
+
+    def acquire(self):
+        """Note that a request is being sent (a probe, while half-open)"""
+        if self.enabled and self.state == self.HALF_OPEN:
+            self._probes.append(time.monotonic())
+
+    def release(self):
+        """Forget a probe that ended without an outcome"""
+        if self._probes:
+            self._probes.pop(0)
+
+    def record(self, ok: bool, latency: Optional[float] = None):
+        """
+        Count the outcome of a request
+
+        Args:
+            ok: The request succeeded
+            latency: Seconds until the first token, if known
+        """
+        if not self.enabled:
+            return
+        bad = not ok or (latency is not None and latency >= self.slow_seconds)
+        state = self.state
+        if state == self.HALF_OPEN:
+            self._probes.clear()
+            if bad:
+                self._open()
+            else:
+                self._opened_at = None
+                self._outcomes.clear()
+            return
+        if state == self.OPEN:
+            return  # a request sent before the circuit opened
+        self._outcomes.append(bad)
+        if len(self._outcomes) >= self.min_calls and sum(self._outcomes) >= self.failure_ratio * len(self._outcomes):
+            self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opens += 1
+        metrics.observe_circuit_open(self.name)
+        logger.warning("Circuit for %s opened for %.0fs", self.name, self.open_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state if self.enabled else "disabled",
+            "recent_calls": len(self._outcomes),
+            "recent_bad": sum(self._outcomes),
+            "opens": self.opens
+        }
+
+
+def create_breaker(host: str) -> CircuitBreaker:
+    """Build the circuit breaker for one Ollama node from settings"""
+    return CircuitBreaker(
+        window=settings.breaker_window,
+        min_calls=settings.breaker_min_calls,
+        failure_ratio=settings.breaker_failure_ratio,
+        slow_seconds=settings.breaker_slow_call_seconds,
+        open_seconds=settings.breaker_open_seconds,
+        probes=settings.breaker_half_open_probes,
+        enabled=settings.breaker_enabled,
+        name=host
+    )
+
+
+class Backend:
+    """One Ollama node and what we know about it"""
+
+    def __init__(self, host: str):
+        self.host = host.rstrip("/")
+        self.breaker = create_breaker(self.host)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.healthy = True  # optimistic until a check or request says otherwise
+        self.loaded_models: Set[str] = set()
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_check: Optional[float] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = create_client(self.host)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+
+    def mark_success(self, model: Optional[str] = None, latency: Optional[float] = None):
+        """
+        Record a successful request
+
+        Args:
+            model: Model the node served
+            latency: Seconds until the first token (slow answers count against the circuit)
+        """
+        self.healthy = True
+        if model:
+            # A node that just served a model has it loaded
+            self.loaded_models.add(model)
+        self.breaker.record(True, latency)
+
+    def mark_failure(self, error: Exception):
+        self.failures += 1
+        self.last_error = str(error)
+        if isinstance(error, (httpx.TransportError, OSError)):
+            self.healthy = False
+        # Client errors (e.g. 404 for an unknown model) say nothing about the node
+        if not (isinstance(error, httpx.HTTPStatusError) and error.response.status_code < 500):
+            self.breaker.record(False)
+
+    def mark_abandoned(self, elapsed: float):
+        """
+        Record a request given up without an answer (e.g. a hedge that lost)
+
+        Only counts against the circuit if it was already slow.
+        """
+        if elapsed >= self.breaker.slow_seconds:
+            self.breaker.record(False)
+        else:
+            self.breaker.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "loaded_models": sorted(self.loaded_models),
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "circuit": self.breaker.stats()
+        }
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every Ollama node has been tried or is down"""
+
+
+class BackendPool:
+    """
+    Set of Ollama nodes with health checks and load balancing
+
+    Requests go to the healthy node with the fewest outstanding requests,
+    preferring nodes that already have the model loaded (from /api/ps) so
+    we avoid paying model load time on a cold node. Nodes whose circuit
+    breaker is open get no requests.
+    """
+
+    def __init__(self, hosts: Iterable[str], health_interval: float = 10.0):
+        self.backends: List[Backend] = [Backend(host) for host in hosts]
+        if not self.backends:
+            raise ValueError("At least one Ollama host is required")
+        self.health_interval = health_interval
+        self._health_task: Optional[asyncio.Task] = None
+        self._round_robin = itertools.count()
+
+    async def startup(self):
+        """Open connections, check every node and start periodic health checks"""
+        for backend in self.backends:
+            backend.client
+        # Start periodic checks first so a slow first check cannot prevent them
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+        await self.refresh()
+
+    async def shutdown(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for backend in self.backends:
+            await backend.aclose()
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Backend health check failed: %s", e)
+
+    async def _check(self, backend: Backend):
+        try:
+            response = await backend.client.get("/api/ps", timeout=settings.ollama_connect_timeout)
+            response.raise_for_status()
+            backend.loaded_models = {
+                m.get("name") or m.get("model") for m in response.json().get("models", [])
+            }
+            backend.healthy = True
+        except Exception as e:
+            backend.healthy = False
+            backend.last_error = str(e)
+        backend.last_check = time.monotonic()
+
+    async def refresh(self):
+        """Check every node's health and loaded models concurrently"""
+        await asyncio.gather(*[self._check(backend) for backend in self.backends])
+
+    def pick(self, model: Optional[str] = None, exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        Choose a node for a request that is about to be sent
+
+        Takes the half-open probe slot of the chosen node's breaker; the
+        request's outcome (``mark_success``/``mark_failure``/``mark_abandoned``)
+        gives it back. See ``choose`` for the arguments.
+        """
+        chosen = self.choose(model, exclude)
+        chosen.breaker.acquire()
+        return chosen
+
+    def choose(self, model: Optional[str] = None, exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        The node the balancer would send a request to, without reserving it
+
+        Args:
+            model: Model the request needs
+            exclude: Nodes already tried for this request
+
+        Returns:
+            The chosen backend
+
+        Raises:
+            NoBackendAvailable: No untried node is left, or all of them have an open circuit
+        """
+        excluded = set(id(b) for b in exclude)
+        candidates = [b for b in self.backends if id(b) not in excluded]
+        if not candidates:
+            raise NoBackendAvailable("All Ollama backends failed")
+        candidates = [b for b in candidates if b.breaker.allow()]
+        if not candidates:
+            raise NoBackendAvailable("Circuit open for every remaining Ollama backend")
+        # Down nodes are only tried when nothing healthy is left
+        healthy = [b for b in candidates if b.healthy] or candidates
+        offset = next(self._round_robin)
+        count = len(healthy)
+        chosen = min(
+            (healthy[(offset + i) % count] for i in range(count)),
+            key=lambda b: (model not in b.loaded_models, b.outstanding)
+        )
+        return chosen
+
+    @asynccontextmanager
+    async def lease(self, backend: Backend):
+        """Count a request as outstanding on ``backend`` for the block"""
+        backend.outstanding += 1
+        backend.requests += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backends": [backend.stats() for backend in self.backends]}
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from app.core.config import settings
+from .conversation_store import Turn, conversation_store
+from .ollama_service import ollama_service
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+Estimator = Callable[[str], int]
+Summarizer = Callable[[str, List[Turn], str], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast token estimate (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class _ContextState:
+    """Prompt window of a session as last seen by this process, and its summary job"""
+
+    __slots__ = ("start", "summary", "pending")
+
+    def __init__(self):
+        self.start = 0  # absolute index of the first turn sent verbatim
+        self.summary = ""
+        self.pending: Optional[asyncio.Task] = None
+
+
+class ContextManager:
+    """
+    Keep conversation prompts within a per-model token budget
+
+    When the history outgrows the budget, the window start jumps forward so
+    that only ``trim_ratio`` of the budget is used, and the dropped turns are
+    folded into a running summary in the background. Between jumps the
+    prompt prefix (summary plus kept turns) is byte-for-byte identical from
+    turn to turn, so Ollama can reuse its KV cache, and prompt size stays
+    bounded however long the conversation gets. The window start and the
+    summary are saved with the session in the store, so they survive
+    restarts and are shared between workers.
+    """
+
+    def __init__(
+        self,
+        store,
+        default_budget: int,
+        model_budgets: Optional[Dict[str, int]] = None,
+        trim_ratio: float = 0.6,
+        estimator: Estimator = estimate_tokens,
+        summarizer: Optional[Summarizer] = None,
+        max_sessions: int = 10000
+    ):
+        self.store = store
+        self.default_budget = default_budget
+        self.model_budgets = model_budgets or {}
+        self.trim_ratio = trim_ratio
+        self.estimator = estimator
+        self.summarizer = summarizer
+        self.max_sessions = max_sessions
+        self._states: "OrderedDict[str, _ContextState]" = OrderedDict()
+        self._tasks: Set[asyncio.Task] = set()
+        self.trims = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def budget_for(self, model: str) -> int:
+        return self.model_budgets.get(model, self.default_budget)
+
+    def _state(self, session_id: str) -> _ContextState:
+        state = self._states.get(session_id)
+        if state is None:
+            state = self._states[session_id] = _ContextState()
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+        else:
+            self._states.move_to_end(session_id)
+        return state
+
+    async def prepare(self, session_id: str, message: str, model: str) -> List[Turn]:
+        """
+        Build the history to send with ``message``
+
+        Args:
+            session_id: Conversation session
+            message: New user message
+            model: Resolved model name (selects the budget)
+
+        Returns:
+            Turns to send before the message, starting with the summary
+        """
+        offset, turns = await self.store.window(session_id)
+        state = self._state(session_id)
+        state.start, state.summary = await self.store.context(session_id)
+        start = max(state.start - offset, 0)
+        window = turns[start:]
+
+        fixed = self.estimator(message) + (self.estimator(state.summary) if state.summary else 0)
+        costs = [self.estimator(content) for _, content in window]
+        budget = self.budget_for(model)
+
+        if fixed + sum(costs) > budget:
+            target = budget * self.trim_ratio - fixed
+            used = sum(costs)
+            drop = 0
+            # Drop whole user/assistant exchanges until the window fits the target
+            while drop < len(window) and used > target:
+                used -= costs[drop]
+                drop += 1
+                while drop < len(window) and window[drop][0] != "user":
+                    used -= costs[drop]
+                    drop += 1
+            dropped, window = window[:drop], window[drop:]
+            state.start = offset + start + drop
+            self.trims += 1
+            await self.store.set_context(session_id, state.start, state.summary)
+            self._schedule_summary(session_id, state, dropped, model)
+
+        prefix = [("system", SUMMARY_PREFIX + state.summary)] if state.summary else []
+        return prefix + window
+
+    def _schedule_summary(self, session_id: str, state: _ContextState, dropped: List[Turn], model: str):
+        if not self.summarizer or not dropped:
+            return
+        previous = state.pending
+
+        async def run():
+            # Fold summaries in order when trims happen back to back
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            try:
+                state.summary = await self.summarizer(state.summary, dropped, model)
+                await self.store.set_context(session_id, state.start, state.summary)
+                self.summaries += 1
+            except Exception as e:
+                self.summary_failures += 1
+                logger.warning("Context summarization failed: %s", e)
+
+        task = asyncio.create_task(run())
+        state.pending = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def drain(self):
+        """Wait for background summaries (used on shutdown and in tests)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._states),
+            "trims": self.trims,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "summaries_pending": len(self._tasks)
+        }
+
+
+async def summarize_with_ollama(summary: str, dropped: List[Turn], model: str) -> str:
+    """Ask the model to fold dropped turns into the running summary"""
+    transcript = "\n".join(f"{role}: {content}" for role, content in dropped)
+    prompt = (
+        "Update the summary of a conversation with the new exchanges below. "
+        "Keep facts, names and decisions; reply with the summary only.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\nNew exchanges:\n{transcript}"
+    )
+    model = settings.context_summary_model or model
+    # Summaries are background work and must not delay user requests
+    async with scheduler.slot(model, client="context-summary", lane="batch"):
+        result = await ollama_service.generate_response(
+            message=prompt,
+            model=model,
+            options={"num_predict": settings.context_summary_max_tokens}
+        )
+    if not result["success"]:
+        raise RuntimeError(result.get("error", "Unknown error"))
+    return result["response"].strip()
+
+
+def create_context_manager(store) -> ContextManager:
+    """Build the context manager from settings"""
+    return ContextManager(
+        store,
+        default_budget=settings.context_default_budget,
+        model_budgets=settings.context_model_budgets,
+        trim_ratio=settings.context_trim_ratio,
+        summarizer=summarize_with_ollama if settings.context_summarize else None,
+        max_sessions=settings.session_max_sessions
+    )
+
+
+# Global context manager instance
+context_manager = create_context_manager(conversation_store)
@@ -0,0 +1,470 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.core.config import settings
+from .shared_state import SharedState, shared_state
+
+# A turn is stored as a plain (role, content) tuple to keep sessions compact
+Turn = Tuple[str, str]
+
+# Where the prompt window of a session starts (absolute turn index) and the
+# summary of the turns before it
+Context = Tuple[int, str]
+NO_CONTEXT: Context = (0, "")
+
+
+class Session:
+    """Conversation history for one session"""
+
+    __slots__ = ("id", "turns", "offset", "context", "bytes", "touched")
+
+    def __init__(self, session_id: str, turns: Optional[List[Turn]] = None, offset: int = 0,
+                 context: Context = NO_CONTEXT):
+        self.id = session_id
+        self.turns: List[Turn] = turns or []
+        self.offset = offset  # number of turns dropped from the front so far
+        self.context = context  # prompt window kept by the context manager
+        self.bytes = sum(len(content) for _, content in self.turns) + len(context[1])
+        self.touched = time.monotonic()
+
+
+class MemoryConversationStore:
+    """
+    In-memory conversation store
+
+    Sessions are kept in LRU order and evicted when idle longer than the TTL
+    or when the session count or total byte cap is exceeded. Turns are
+    appended to the session in place; histories are never re-serialized.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int, max_turns: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+
+    def _get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if session.touched + self.ttl < time.monotonic():
+            self._drop(session_id)
+            self.evictions += 1
+            return None
+        session.touched = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _put(self, session: Session):
+        self._sessions[session.id] = session
+        self._bytes += session.bytes
+        self._evict()
+
+    def _drop(self, session_id: str) -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self._bytes -= session.bytes
+        return True
+
+    def _evict(self):
+        # Oldest sessions sit at the front of the OrderedDict
+        now = time.monotonic()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            over_cap = len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes
+            if not over_cap and oldest.touched + self.ttl >= now:
+                break
+            self._drop(oldest_id)
+            self.evictions += 1
+
+    def _append(self, session: Session, turns: List[Turn]):
+        for role, content in turns:
+            session.turns.append((role, content))
+            session.bytes += len(content)
+            self._bytes += len(content)
+        # Keep at most max_turns per session, dropping the oldest
+        excess = len(session.turns) - self.max_turns
+        if excess > 0:
+            dropped = sum(len(content) for _, content in session.turns[:excess])
+            del session.turns[:excess]
+            session.offset += excess
+            session.bytes -= dropped
+            self._bytes -= dropped
+        self._evict()
+
+    async def create(self, session_id: Optional[str] = None) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        if self._get(session_id) is None:
+            self._put(Session(session_id))
+        return session_id
+
+    async def history(self, session_id: str) -> List[Turn]:
+        """Return the turns of a session (empty for unknown sessions)"""
+        session = self._get(session_id)
+        return list(session.turns) if session else []
+
+    async def window(self, session_id: str) -> Tuple[int, List[Turn]]:
+        """
+        Return the stored turns with their absolute position
+
+        Returns:
+            Tuple of (offset, turns) where offset is the absolute index of
+            the first returned turn in the conversation
+        """
+        session = self._get(session_id)
+        return (session.offset, list(session.turns)) if session else (0, [])
+
+    async def append(self, session_id: str, turns: List[Turn]):
+        """Append turns to a session, creating it if needed"""
+        session = self._get(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._put(session)
+        self._append(session, turns)
+
+    def _drop_last(self, session: Session, count: int) -> int:
+        count = min(count, len(session.turns))
+        if count:
+            dropped = sum(len(content) for _, content in session.turns[-count:])
+            del session.turns[-count:]
+            session.bytes -= dropped
+            self._bytes -= dropped
+        return count
+
+    async def drop_last(self, session_id: str, count: int) -> int:
+        """
+        Remove the newest ``count`` turns (e.g. an answer being regenerated)
+
+        Returns:
+            Number of turns removed
+        """
+        session = self._get(session_id)
+        return self._drop_last(session, count) if session else 0
+
+    async def delete(self, session_id: str) -> bool:
+        return self._drop(session_id)
+
+    async def context(self, session_id: str) -> Context:
+        """
+        Return the prompt window saved for a session
+
+        Returns:
+            Tuple of (start, summary): the absolute index of the first turn
+            sent verbatim and the summary of the turns before it
+        """
+        session = self._get(session_id)
+        return session.context if session else NO_CONTEXT
+
+    def _set_context(self, session: Session, context: Context):
+        change = len(context[1]) - len(session.context[1])
+        session.context = context
+        session.bytes += change
+        self._bytes += change
+
+    async def set_context(self, session_id: str, start: int, summary: str):
+        """Save the prompt window of a session (ignored for unknown sessions)"""
+        session = self._get(session_id)
+        if session is not None:
+            self._set_context(session, (start, summary))
+
+    async def warm(self):
+        """Open the storage ahead of the first request (run as a startup warm-up step)"""
+
+    async def record_stream(self, session_id: str, message: str,
+                            events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Pass stream events through and append the turn once it completes"""
+        async for event in events:
+            if event.get("done") and event.get("success"):
+                await self.append(session_id, [("user", message), ("assistant", event["response"])])
+                # Events may be shared between subscribers, so tag a copy
+                event = {**event, "session_id": session_id}
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "bytes": self._bytes,
+            "evictions": self.evictions
+        }
+
+
+class SQLiteConversationStore(MemoryConversationStore):
+    """
+    Conversation store persisted to SQLite
+
+    Each turn is one INSERT, so appending never rewrites earlier turns.
+    Recently used sessions are kept in memory; others are loaded on demand.
+    The database is opened on first use (or by ``warm``).
+    """
+
+    def __init__(self, path: str, ttl: float, max_sessions: int, max_turns: int, max_bytes: int):
+        super().__init__(ttl, max_sessions, max_turns, max_bytes)
+        self.path = path
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, touched REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "session_id TEXT NOT NULL, seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "role TEXT NOT NULL, content TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, seq)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS contexts ("
+                "session_id TEXT PRIMARY KEY, start INTEGER NOT NULL, summary TEXT NOT NULL)"
+            )
+            self._db = conn
+        return self._db
+
+    def _open(self):
+        with self._lock:
+            self._conn  # opens the database
+
+    async def warm(self):
+        await asyncio.to_thread(self._open)
+
+    def _load(self, session_id: str) -> Optional[Tuple[int, List[Turn], Context]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT touched FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None or row[0] + self.ttl < time.time():
+                return None
+            (total,) = self._conn.execute(
+                "SELECT COUNT(*) FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT role, content FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, self.max_turns)
+            ).fetchall()
+            context = self._conn.execute(
+                "SELECT start, summary FROM contexts WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        turns = [(role, content) for role, content in reversed(rows)]
+        return total - len(rows), turns, tuple(context) if context else NO_CONTEXT
+
+    def _write(self, session_id: str, turns: List[Turn]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, touched) VALUES (?, ?)", (session_id, now)
+            )
+            self._conn.executemany(
+                "INSERT INTO turns (session_id, role, content) VALUES (?, ?, ?)",
+                [(session_id, role, content) for role, content in turns]
+            )
+            self._conn.execute("COMMIT")
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._purge(now)
+
+    def _write_context(self, session_id: str, context: Context):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contexts (session_id, start, summary) VALUES (?, ?, ?)",
+                (session_id, *context)
+            )
+
+    def _purge(self, now: float):
+        expired = "SELECT id FROM sessions WHERE touched < ?"
+        self._conn.execute(f"DELETE FROM turns WHERE session_id IN ({expired})", (now - self.ttl,))
+        self._conn.execute(f"DELETE FROM contexts WHERE session_id IN ({expired})", (now - self.ttl,))
+        self._conn.execute("DELETE FROM sessions WHERE touched < ?", (now - self.ttl,))
+
+    def _remove_last(self, session_id: str, count: int):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM turns WHERE seq IN "
+                "(SELECT seq FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?)",
+                (session_id, count)
+            )
+
+    def _remove(self, session_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM contexts WHERE session_id = ?", (session_id,))
+            cursor = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    async def _session(self, session_id: str) -> Optional[Session]:
+        session = self._get(session_id)
+        if session is None:
+            loaded = await asyncio.to_thread(self._load, session_id)
+            if loaded is not None:
+                offset, turns, context = loaded
+                session = Session(session_id, turns, offset, context)
+                self._put(session)
+        return session
+
+    async def create(self, session_id: Optional[str] = None) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        if await self._session(session_id) is None:
+            self._put(Session(session_id))
+            await asyncio.to_thread(self._write, session_id, [])
+        return session_id
+
+    async def history(self, session_id: str) -> List[Turn]:
+        session = await self._session(session_id)
+        return list(session.turns) if session else []
+
+    async def window(self, session_id: str) -> Tuple[int, List[Turn]]:
+        session = await self._session(session_id)
+        return (session.offset, list(session.turns)) if session else (0, [])
+
+    async def append(self, session_id: str, turns: List[Turn]):
+        session = await self._session(session_id)
+        if session is None:
+            session = Session(session_id)
+            self._put(session)
+        self._append(session, turns)
+        await asyncio.to_thread(self._write, session_id, turns)
+
+    async def drop_last(self, session_id: str, count: int) -> int:
+        session = await self._session(session_id)
+        if session is None:
+            return 0
+        count = self._drop_last(session, count)
+        if count:
+            await asyncio.to_thread(self._remove_last, session_id, count)
+        return count
+
+    async def delete(self, session_id: str) -> bool:
+        in_memory = self._drop(session_id)
+        on_disk = await asyncio.to_thread(self._remove, session_id)
+        return in_memory or on_disk
+
+    async def context(self, session_id: str) -> Context:
+        session = await self._session(session_id)
+        return session.context if session else NO_CONTEXT
+
+    async def set_context(self, session_id: str, start: int, summary: str):
+        session = await self._session(session_id)
+        if session is not None:
+            self._set_context(session, (start, summary))
+            await asyncio.to_thread(self._write_context, session_id, session.context)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats.update({"backend": "sqlite", "path": self.path})
+        return stats
+
+
+class SharedConversationStore(MemoryConversationStore):
+    """
+    Conversation store in the shared state, so any worker can serve a session
+
+    A session is a list of JSON-encoded turns, trimmed to ``max_turns`` on
+    append, a counter of the turns trimmed so far and, once the context
+    manager has trimmed the prompt, its window as JSON. All expire ``ttl``
+    seconds after the last write. Session and byte caps are left to
+    the state server's memory policy.
+    """
+
+    def __init__(self, state: SharedState, ttl: float, max_sessions: int, max_turns: int, max_bytes: int):
+        super().__init__(ttl, max_sessions, max_turns, max_bytes)
+        self.state = state
+
+    @staticmethod
+    def _keys(session_id: str) -> Tuple[str, str]:
+        return f"session:{session_id}", f"session:{session_id}:offset"
+
+    @staticmethod
+    def _context_key(session_id: str) -> str:
+        return f"session:{session_id}:context"
+
+    async def _load(self, session_id: str) -> Optional[Tuple[int, List[Turn]]]:
+        turns_key, offset_key = self._keys(session_id)
+        offset = await self.state.get(offset_key)
+        if offset is None:
+            return None
+        items = await self.state.items(turns_key)
+        return int(offset), [tuple(json.loads(item)) for item in items]
+
+    async def create(self, session_id: Optional[str] = None) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        # Adding 0 creates the offset counter (and so the session) only if missing
+        await self.state.incr(self._keys(session_id)[1], 0, ttl=self.ttl)
+        return session_id
+
+    async def history(self, session_id: str) -> List[Turn]:
+        loaded = await self._load(session_id)
+        return loaded[1] if loaded else []
+
+    async def window(self, session_id: str) -> Tuple[int, List[Turn]]:
+        return await self._load(session_id) or (0, [])
+
+    async def append(self, session_id: str, turns: List[Turn]):
+        turns_key, offset_key = self._keys(session_id)
+        length = await self.state.push(
+            turns_key, [json.dumps(list(turn)) for turn in turns], max_len=self.max_turns, ttl=self.ttl
+        )
+        await self.state.incr(offset_key, max(length - self.max_turns, 0), ttl=self.ttl)
+        await self.state.expire(offset_key, self.ttl)
+        await self.state.expire(self._context_key(session_id), self.ttl)
+
+    async def drop_last(self, session_id: str, count: int) -> int:
+        turns_key, _ = self._keys(session_id)
+        count = min(count, len(await self.state.items(turns_key)))
+        await self.state.drop_last(turns_key, count)
+        return count
+
+    async def delete(self, session_id: str) -> bool:
+        turns_key, offset_key = self._keys(session_id)
+        await self.state.delete(turns_key)
+        await self.state.delete(self._context_key(session_id))
+        return await self.state.delete(offset_key)
+
+    async def context(self, session_id: str) -> Context:
+        value = await self.state.get(self._context_key(session_id))
+        if value is None:
+            return NO_CONTEXT
+        start, summary = json.loads(value)
+        return start, summary
+
+    async def set_context(self, session_id: str, start: int, summary: str):
+        if await self.state.get(self._keys(session_id)[1]) is None:
+            return
+        await self.state.set(self._context_key(session_id), json.dumps([start, summary]), ttl=self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "shared", "state": self.state.stats()}
+
+
+def create_conversation_store() -> MemoryConversationStore:
+    """Build the conversation store from settings"""
+    limits = dict(
+        ttl=settings.session_ttl,
+        max_sessions=settings.session_max_sessions,
+        max_turns=settings.session_max_turns,
+        max_bytes=settings.session_max_bytes
+    )
+    if settings.shared_state_url:
+        return SharedConversationStore(shared_state, **limits)
+    if settings.session_db_path:
+        return SQLiteConversationStore(settings.session_db_path, **limits)
+    return MemoryConversationStore(**limits)
+
+
+# Global store instance
+conversation_store = create_conversation_store()
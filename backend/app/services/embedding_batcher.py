@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Set, Tuple
+import httpx
+from app.core.config import settings
+from .ollama_service import OllamaService, ollama_service
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embedding requests into batched /api/embed calls
+
+    Texts for the same model that arrive within ``max_wait`` seconds of the
+    first waiting one go upstream together, up to ``max_batch`` texts per
+    call; a full batch is sent at once without waiting. Each caller gets
+    the vectors of its own texts back. Identical texts in one batch are
+    embedded once. With ``max_batch`` of 1 every request is sent as is.
+    If Ollama refuses a batch (4xx), its callers are split in half and each
+    half is sent again, so only the caller with the offending input fails.
+    """
+
+    def __init__(self, service: OllamaService, max_batch: int = 64, max_wait: float = 0.005):
+        self.service = service
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future, int]]] = {}  # model -> (text, future, caller)
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.upstream_texts = 0  # after removing duplicates
+        self.errors = 0
+        self.splits = 0
+        self.upstream_seconds = 0.0
+
+    async def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        Embed ``texts``, batched with other requests for ``model``
+
+        Returns:
+            One vector per text, in order
+
+        Raises:
+            Exception: The upstream call for a batch holding these texts failed
+                (when refused, one holding only this caller's texts)
+        """
+        self.requests += 1
+        self.texts += len(texts)
+        if self.max_batch <= 1:
+            return await self._call(model, texts)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            pending = self._pending.setdefault(model, [])
+            pending.append((text, future, self.requests))
+            futures.append(future)
+            if len(pending) >= self.max_batch:
+                self._flush(model)
+            elif len(pending) == 1:
+                self._timers[model] = loop.call_later(self.max_wait, self._flush, model)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self, model: str):
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(model, None)
+        if items:
+            task = asyncio.get_running_loop().create_task(self._send(model, items))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, model: str, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        try:
+            return await self.service.embed(texts, model)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.batches += 1
+            self.upstream_texts += len(texts)
+            self.upstream_seconds += time.perf_counter() - start
+
+    async def _send(self, model: str, items: List[Tuple[str, asyncio.Future, int]]):
+        """Embed one batch and hand each waiting caller its vector"""
+        unique = list(dict.fromkeys(text for text, _, _ in items))
+        try:
+            vectors = dict(zip(unique, await self._call(model, unique)))
+        except Exception as e:
+            callers = list(dict.fromkeys(caller for _, _, caller in items))
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500 and len(callers) > 1:
+                # Refused input: retry each half of the callers so one bad text fails only its own request
+                self.splits += 1
+                first = set(callers[:len(callers) // 2])
+                await asyncio.gather(
+                    self._send(model, [item for item in items if item[2] in first]),
+                    self._send(model, [item for item in items if item[2] not in first])
+                )
+                return
+            logger.warning("Embedding batch of %d texts for %s failed: %s", len(unique), model, e)
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future, _ in items:
+            # Callers that went away have cancelled their futures
+            if not future.done():
+                future.set_result(vectors[text])
+
+    async def shutdown(self):
+        """Send what is still waiting and let in-flight batches finish"""
+        for model in list(self._pending):
+            self._flush(model)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "requests": self.requests,
+            "texts": self.texts,
+            "batches": self.batches,
+            "upstream_texts": self.upstream_texts,
+            "avg_batch_size": self.upstream_texts / self.batches if self.batches else 0.0,
+            "errors": self.errors,
+            "splits": self.splits,
+            "upstream_ms_avg": 1000 * self.upstream_seconds / self.batches if self.batches else 0.0
+        }
+
+
+# Global embedding batcher instance
+embedding_batcher = EmbeddingBatcher(
+    ollama_service,
+    max_batch=settings.embed_batch_size,
+    max_wait=settings.embed_batch_wait_ms / 1000
+)
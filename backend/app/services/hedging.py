@@ -0,0 +1,98 @@
+import math
+from collections import deque
+from typing import Any, Deque, Dict
+from app.core.config import settings
+
+
+class HedgePolicy:
+    """
+    When a request gets a second copy on another Ollama node
+
+    The hedge delay for a model is the 95th percentile of its recent
+    first-token latencies (at least ``min_delay``; ``default_delay`` until
+    ``min_samples`` are known), so about one request in twenty is hedged
+    when nodes behave normally. Hedges are paid from a budget that gains
+    ``budget_ratio`` for every request and holds at most ``budget_burst``:
+    however slow the nodes get, hedging adds no more than that share of
+    extra requests.
+    """
+
+    def __init__(self, enabled: bool = True, min_delay: float = 0.1, default_delay: float = 2.0,
+                 budget_ratio: float = 0.05, budget_burst: float = 10.0,
+                 min_samples: int = 20, samples: int = 256):
+        self.enabled = enabled
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.min_samples = min_samples
+        self.samples = samples
+        self.budget = budget_burst
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._delays: Dict[str, float] = {}  # model -> p95, recomputed every few samples
+        self._stale: Dict[str, int] = {}  # samples since the p95 was computed
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.denied = 0
+
+    def observe(self, model: str, seconds: float):
+        """Record the first-token latency of an answer that was used"""
+        latencies = self._latencies.get(model)
+        if latencies is None:
+            latencies = self._latencies[model] = deque(maxlen=self.samples)
+        latencies.append(seconds)
+        if len(latencies) >= self.min_samples:
+            # Sorting on every answer is wasted work: refresh after a few new samples
+            self._stale[model] = self._stale.get(model, 0) + 1
+            if model not in self._delays or self._stale[model] >= 8:
+                ordered = sorted(latencies)
+                self._delays[model] = ordered[math.ceil(len(ordered) * 0.95) - 1]
+                self._stale[model] = 0
+
+    def delay(self, model: str) -> float:
+        """Seconds to wait for a first token before hedging"""
+        if len(self._latencies.get(model, ())) < self.min_samples:
+            return self.default_delay
+        return max(self._delays[model], self.min_delay)
+
+    def record_request(self):
+        """Add one request's share to the hedge budget"""
+        self.requests += 1
+        self.budget = min(self.budget + self.budget_ratio, self.budget_burst)
+
+    def try_spend(self) -> bool:
+        """Take one hedge from the budget, if there is one left"""
+        if self.budget >= 1.0:
+            self.budget -= 1.0
+            self.hedged += 1
+            return True
+        self.denied += 1
+        return False
+
+    def refund(self):
+        """Return a hedge that could not be sent"""
+        self.budget = min(self.budget + 1.0, self.budget_burst)
+        self.hedged -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedges_won": self.won,
+            "denied_by_budget": self.denied,
+            "budget": round(self.budget, 2),
+            "delay_seconds": {model: self.delay(model) for model in self._latencies}
+        }
+
+
+def create_hedge_policy() -> HedgePolicy:
+    """Build the hedging policy from settings"""
+    return HedgePolicy(
+        enabled=settings.hedge_enabled,
+        min_delay=settings.hedge_min_delay,
+        default_delay=settings.hedge_default_delay,
+        budget_ratio=settings.hedge_budget_ratio,
+        budget_burst=settings.hedge_budget_burst
+    )
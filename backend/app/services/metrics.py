@@ -0,0 +1,341 @@
+import time
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+# Latency buckets in seconds, from a single token gap up to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500)
+
+# Ollama reports durations in nanoseconds in its final chunk
+OLLAMA_DURATIONS = ("load_duration", "prompt_eval_duration", "eval_duration", "total_duration")
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str):
+        """Return the child for one label combination (cache it on hot paths)"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values: Tuple[str, ...], child: _HistogramValue) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Metrics:
+    """
+    In-process metrics registry rendered in the Prometheus text format
+
+    Updates are plain attribute increments on pre-resolved label children,
+    so recording a token costs one clock read and one bucket lookup.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+        self.http_requests = self._add(Counter(
+            "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+        self.http_latency = self._add(Histogram(
+            "http_request_duration_seconds", "HTTP request latency until the last byte is sent",
+            ("method", "route")))
+        self.http_in_flight = self._add(Gauge(
+            "http_requests_in_flight", "HTTP requests currently being served")).labels()
+
+        self.ws_connections = self._add(Gauge(
+            "ws_connections", "Open chat WebSocket connections")).labels()
+        self.streams_in_flight = self._add(Gauge(
+            "chat_streams_in_flight", "Chat streams currently being sent")).labels()
+        # source: generated, coalesced (joined another request's generation) or cached (replayed)
+        self.ttft = self._add(Histogram(
+            "chat_time_to_first_token_seconds", "Time from stream start to the first token", ("model", "source")))
+        self.inter_token = self._add(Histogram(
+            "chat_inter_token_latency_seconds", "Gap between consecutive streamed tokens", ("model", "source")))
+        self.tokens_per_second = self._add(Histogram(
+            "chat_tokens_per_second", "Streamed tokens per second after the first token", ("model", "source"),
+            buckets=RATE_BUCKETS))
+        self.tokens = self._add(Counter(
+            "chat_tokens_total", "Streamed tokens", ("model", "source")))
+        self.streams_stopped = self._add(Counter(
+            "chat_streams_stopped_total", "Streams stopped before completion", ("model", "reason")))
+        self.tokens_saved = self._add(Counter(
+            "chat_tokens_saved_total", "Estimated tokens not generated thanks to early stops", ("model",)))
+
+        self.ollama_durations = {
+            key: self._add(Histogram(
+                f"ollama_{key}_seconds", f"Ollama-reported {key.replace('_', ' ')}", ("model",)))
+            for key in OLLAMA_DURATIONS
+        }
+        self.ollama_prompt_tokens = self._add(Counter(
+            "ollama_prompt_tokens_total", "Prompt tokens evaluated by Ollama", ("model",)))
+        self.ollama_eval_tokens = self._add(Counter(
+            "ollama_eval_tokens_total", "Tokens generated by Ollama", ("model",)))
+
+        self.scheduler_active = self._add(Gauge(
+            "scheduler_active_requests", "Generations holding a scheduler slot", ("model",)))
+        self.scheduler_queued = self._add(Gauge(
+            "scheduler_queued_requests", "Requests waiting for a scheduler slot", ("model", "lane")))
+        self.scheduler_admitted = self._add(Counter(
+            "scheduler_admitted_total", "Requests given a generation slot", ("model", "lane")))
+        self.scheduler_rejected = self._add(Counter(
+            "scheduler_rejected_total", "Requests rejected by admission control", ("model", "reason")))
+        self.scheduler_wait = self._add(Histogram(
+            "scheduler_queue_wait_seconds", "Time from arrival to getting a generation slot", ("model", "lane")))
+
+        self.circuit_opens = self._add(Counter(
+            "ollama_circuit_opens_total", "Times a node's circuit breaker opened", ("host",)))
+        self.hedges = self._add(Counter(
+            "ollama_hedges_total", "Second requests sent to another node because the first token was late",
+            ("model", "result")))
+
+        self.router_decisions = self._add(Counter(
+            "router_decisions_total", "Models chosen for model=auto requests", ("model", "reason")))
+        self.router_downgrades = self._add(Counter(
+            "router_downgrades_total", "Auto requests moved to a lighter model because of queue wait",
+            ("from_model", "to_model")))
+        self.router_wait_saved = self._add(Histogram(
+            "router_downgrade_wait_saved_seconds", "Expected queue wait avoided by a downgrade", ("model",)))
+        self.router_escalations = self._add(Counter(
+            "router_escalations_total", "Auto answers regenerated on a larger model", ("from_model", "to_model")))
+        self.router_escalation_cost = self._add(Histogram(
+            "router_escalation_overhead_seconds", "Time spent on an answer that was then escalated",
+            ("model",)))
+        self.router_latency = self._add(Histogram(
+            "router_request_duration_seconds", "End-to-end latency of auto requests by final model and route",
+            ("model", "route")))
+
+    def _add(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, callback: Callable[[], None]):
+        """Run ``callback`` before each render, to set gauges from live state"""
+        self._collectors.append(callback)
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        self.http_requests.labels(method, route, str(status)).inc()
+        self.http_latency.labels(method, route).observe(seconds)
+
+    def observe_ollama(self, model: str, chunk: Dict[str, Any]):
+        """
+        Record the timings Ollama returns in its final chunk
+
+        Args:
+            model: Model that served the request
+            chunk: Final (``done``) chunk or non-streaming response body
+        """
+        if not self.enabled:
+            return
+        for key, histogram in self.ollama_durations.items():
+            value = chunk.get(key)
+            if value is not None:
+                histogram.labels(model).observe(value / 1e9)
+        if chunk.get("prompt_eval_count") is not None:
+            self.ollama_prompt_tokens.labels(model).inc(chunk["prompt_eval_count"])
+        if chunk.get("eval_count") is not None:
+            self.ollama_eval_tokens.labels(model).inc(chunk["eval_count"])
+
+    def observe_admitted(self, model: str, lane: str, wait: float):
+        if not self.enabled:
+            return
+        self.scheduler_admitted.labels(model, lane).inc()
+        self.scheduler_wait.labels(model, lane).observe(wait)
+
+    def observe_rejected(self, model: str, reason: str):
+        """Count a rejection by ``reason``: queue_full or wait_too_long"""
+        if self.enabled:
+            self.scheduler_rejected.labels(model, reason).inc()
+
+    def observe_circuit_open(self, host: str):
+        if self.enabled:
+            self.circuit_opens.labels(host).inc()
+
+    def observe_hedge(self, model: str, result: str):
+        """Count a hedge by ``result``: won, lost or denied (by the budget)"""
+        if self.enabled:
+            self.hedges.labels(model, result).inc()
+
+    def observe_route(self, model: str, reason: str):
+        if self.enabled:
+            self.router_decisions.labels(model, reason).inc()
+
+    def observe_downgrade(self, wanted: str, model: str, wait_saved: float):
+        if not self.enabled:
+            return
+        self.router_downgrades.labels(wanted, model).inc()
+        self.router_wait_saved.labels(model).observe(wait_saved)
+
+    def observe_escalation(self, model: str, larger: str, seconds: float):
+        if not self.enabled:
+            return
+        self.router_escalations.labels(model, larger).inc()
+        self.router_escalation_cost.labels(model).observe(seconds)
+
+    def observe_routed(self, model: str, route: str, seconds: float):
+        if self.enabled:
+            self.router_latency.labels(model, route).observe(seconds)
+
+    def observe_stream_stopped(self, model: str, reason: str, tokens_saved: int):
+        if not self.enabled:
+            return
+        self.streams_stopped.labels(model, reason).inc()
+        self.tokens_saved.labels(model).inc(tokens_saved)
+
+    async def track_stream(self, model: str, events: AsyncIterator[Dict[str, Any]],
+                           source: str = "generated") -> AsyncIterator[Dict[str, Any]]:
+        """
+        Pass stream events through, timing the first token and the gaps between tokens
+
+        Args:
+            model: Model that serves the stream
+            events: Service stream events
+            source: ``generated``, ``coalesced`` or ``cached``; replays are
+                labelled apart so they do not pull generation latencies down
+        """
+        if not self.enabled:
+            async for event in events:
+                yield event
+            return
+
+        # Resolve label children once so the per-token path is cheap
+        inter_token = self.inter_token.labels(model, source)
+        start = last = time.perf_counter()
+        first: Optional[float] = None
+        count = 0
+        self.streams_in_flight.inc()
+        try:
+            async for event in events:
+                if event.get("chunk"):
+                    now = time.perf_counter()
+                    if first is None:
+                        first = now
+                    else:
+                        inter_token.observe(now - last)
+                    last = now
+                    count += 1
+                yield event
+        finally:
+            self.streams_in_flight.dec()
+            if first is not None:
+                self.ttft.labels(model, source).observe(first - start)
+                self.tokens.labels(model, source).inc(count)
+                if count > 1 and last > first:
+                    self.tokens_per_second.labels(model, source).observe((count - 1) / (last - first))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        for collect in self._collectors:
+            collect()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+metrics = Metrics(enabled=settings.metrics_enabled)
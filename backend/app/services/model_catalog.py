@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+import httpx
+from app.core.config import settings
+from .ollama_service import OllamaService, ollama_service
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownModel(Exception):
+    """Raised for a model no Ollama node reports"""
+
+    def __init__(self, model: str):
+        super().__init__(f"Model {model} is not available")
+        self.model = model
+
+
+class ModelCatalog:
+    """
+    Models available on the Ollama nodes, kept in memory
+
+    The catalog asks every node for its models (``/api/tags``) at startup
+    and every ``interval`` seconds after that, so request handlers never
+    wait on Ollama to list models or report health. ``version`` is a digest
+    of the merged list and changes only when the list does. If no node
+    answers a refresh, the last good list is kept and health reports the
+    failure. Requests are checked against the list before their model name
+    reaches the scheduler, metrics or residency, which keep state per name.
+    """
+
+    def __init__(self, service: OllamaService, interval: float = 30.0):
+        self.service = service
+        self.interval = interval
+        self.models: Optional[List[Dict[str, Any]]] = None  # None until a node has answered
+        self._names: frozenset = frozenset()
+        self.version: Optional[str] = None
+        self.nodes: Dict[str, Dict[str, Any]] = {}  # host -> result of the last refresh
+        self.updated: Optional[float] = None
+        self.refreshes = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> bool:
+        """
+        Reload the model list from every node
+
+        Returns:
+            True if the list changed
+        """
+        backends = self.service.pool.backends
+        results = await asyncio.gather(
+            *[self.service.tags(b, settings.ollama_connect_timeout) for b in backends], return_exceptions=True
+        )
+        merged: Dict[str, Dict[str, Any]] = {}
+        nodes: Dict[str, Dict[str, Any]] = {}
+        for backend, result in zip(backends, results):
+            if isinstance(result, Exception):
+                backend.mark_failure(result)
+                http = isinstance(result, httpx.HTTPStatusError)
+                nodes[backend.host] = {
+                    "ok": False,
+                    "status": "unhealthy" if http else "unreachable",
+                    "error": f"HTTP {result.response.status_code}" if http else str(result)
+                }
+                continue
+            nodes[backend.host] = {"ok": True, "models": len(result)}
+            for model in result:
+                name = model.get("name") or model.get("model")
+                entry = merged.setdefault(name, {"name": name, "size": model.get("size", 0), "nodes": []})
+                entry["nodes"].append(backend.host)
+
+        self.nodes = nodes
+        self.updated = time.time()
+        self.refreshes += 1
+        if not any(node["ok"] for node in nodes.values()):
+            self.failures += 1
+            return False
+        models = list(merged.values())
+        version = hashlib.sha1(json.dumps(models, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        changed = version != self.version
+        self.models, self.version = models, version
+        self._names = frozenset(model["name"] for model in models)
+        return changed
+
+    @property
+    def names(self) -> List[str]:
+        return [model["name"] for model in self.models or ()]
+
+    def known(self, model: str) -> bool:
+        """Whether a node reports ``model`` (only the default model before the first answer)"""
+        if self.models is None:
+            return model == self.service.default_model
+        return model in self._names
+
+    def check(self, model: str):
+        """
+        Refuse a model no node reports
+
+        Raises:
+            UnknownModel: ``model`` is not in the catalog
+        """
+        if not self.known(model):
+            raise UnknownModel(model)
+
+    def listing(self) -> Dict[str, Any]:
+        """Model list in the /models response format (memory only)"""
+        if self.models is None:
+            error = next((node["error"] for node in self.nodes.values() if not node["ok"]), None)
+            return {"success": False, "error": error or "Model list not loaded yet", "models": []}
+        return {
+            "success": True,
+            "models": self.names,
+            "updated": self.updated,
+            "stale": not any(node["ok"] for node in self.nodes.values())
+        }
+
+    def health(self) -> Dict[str, Any]:
+        """Ollama status from the last refresh (memory only)"""
+        if self.updated is None:
+            return {"status": "unknown", "error": "Not checked yet"}
+        healthy = sum(1 for node in self.nodes.values() if node["ok"])
+        if healthy:
+            return {
+                "status": "healthy",
+                "models_available": len(self.models or ()),
+                "models": self.names,
+                "backends_healthy": healthy,
+                "backends_total": len(self.nodes),
+                "age_seconds": round(time.time() - self.updated, 3)
+            }
+        first = next(iter(self.nodes.values()))
+        return {"status": first["status"], "error": first["error"]}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("Model catalog refresh failed: %s", e)
+
+    async def startup(self):
+        """Start periodic refreshes and load the list once"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+        await self.refresh()
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": len(self.models or ()),
+            "version": self.version,
+            "updated": self.updated,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "nodes": self.nodes
+        }
+
+
+# Global model catalog instance
+model_catalog = ModelCatalog(ollama_service, interval=settings.catalog_refresh_interval)
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from app.core.config import settings
+from .backend_pool import Backend, NoBackendAvailable
+from .ollama_service import OllamaService, ollama_service
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class _Rate:
+    """Exponentially decayed request count for one model"""
+    __slots__ = ("value", "updated", "requests")
+
+    def __init__(self):
+        self.value = 0.0
+        self.updated = time.monotonic()
+        self.requests = 0
+
+
+class ModelResidency:
+    """
+    Keeps the models that get traffic loaded on the Ollama nodes
+
+    Configured models are loaded on every node at startup. Every
+    ``interval`` seconds the manager ranks models by recent request rate,
+    keeps the busiest ones that fit in the per-node memory budget and sends
+    them a keep-alive ping (an empty chat request, which Ollama treats as a
+    load). With a budget set, models outside that set are unloaded. Ollama
+    keeps a model for ``keep_alive`` after its last request, so pings only
+    need to come more often than that.
+    """
+
+    def __init__(
+        self,
+        service: OllamaService,
+        preload: Iterable[str] = (),
+        keep_alive: str = "10m",
+        interval: float = 120.0,
+        memory_budget_mb: float = 0.0,
+        model_sizes_mb: Optional[Dict[str, float]] = None,
+        rate_window: float = 300.0,
+        min_rate: float = 0.1
+    ):
+        self.service = service
+        self.preload = list(preload)
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.memory_budget_mb = memory_budget_mb
+        self.model_sizes_mb = dict(model_sizes_mb or {})
+        self.rate_window = rate_window
+        self.min_rate = min_rate  # requests per minute
+        self.resident: Set[str] = set(self.preload)
+        self._rates: Dict[str, _Rate] = {}
+        self._reported_sizes: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.loads = 0
+        self.unloads = 0
+        self.pings = 0
+        self.failures = 0
+
+    def record(self, model: str):
+        """Count a request that needs ``model`` to generate"""
+        rate = self._rates.get(model)
+        if rate is None:
+            rate = self._rates[model] = _Rate()
+        now = time.monotonic()
+        rate.value = rate.value * math.exp(-(now - rate.updated) / self.rate_window) + 1.0
+        rate.updated = now
+        rate.requests += 1
+
+    def rate(self, model: str, now: Optional[float] = None) -> float:
+        """Recent requests per minute for ``model``"""
+        rate = self._rates.get(model)
+        if rate is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        decayed = rate.value * math.exp(-(now - rate.updated) / self.rate_window)
+        return decayed / self.rate_window * 60
+
+    def size_mb(self, model: str) -> Optional[float]:
+        """Configured size, else the size Ollama reports, else None"""
+        return self.model_sizes_mb.get(model, self._reported_sizes.get(model))
+
+    def plan(self) -> List[str]:
+        """
+        Choose the models to keep resident
+
+        Preloaded models are always kept. The rest are taken busiest first
+        while they fit in the memory budget (models of unknown size count
+        as zero) and stay above ``min_rate``.
+
+        Returns:
+            Model names, most important first
+        """
+        now = time.monotonic()
+        chosen = list(self.preload)
+        used = sum(self.size_mb(model) or 0.0 for model in chosen)
+        others = sorted((m for m in self._rates if m not in chosen), key=lambda m: -self.rate(m, now))
+        for model in others:
+            if self.rate(model, now) < self.min_rate:
+                break
+            size = self.size_mb(model) or 0.0
+            if self.memory_budget_mb and used + size > self.memory_budget_mb:
+                continue  # a smaller, less busy model may still fit
+            chosen.append(model)
+            used += size
+        return chosen
+
+    async def _send(self, backend: Backend, model: str, keep_alive: Any) -> bool:
+        try:
+            response = await backend.client.post(
+                "/api/chat", json={"model": model, "messages": [], "keep_alive": keep_alive}
+            )
+            response.raise_for_status()
+        except Exception as e:
+            self.failures += 1
+            logger.warning("Keep-alive request for %s on %s failed: %s", model, backend.host, e)
+            return False
+        if keep_alive == 0:
+            backend.loaded_models.discard(model)
+        else:
+            backend.loaded_models.add(model)
+        return True
+
+    async def _load(self, model: str, everywhere: bool = False):
+        pool = self.service.pool
+        # Nodes whose circuit is open get no keep-alives either
+        healthy = [b for b in pool.backends if b.healthy and b.breaker.allow()]
+        warm = [b for b in healthy if model in b.loaded_models]
+        if everywhere:
+            targets = healthy
+        elif warm:
+            targets = warm
+        else:
+            # Load it where the balancer would send the next request (a
+            # keep-alive is no breaker probe, so no slot is reserved)
+            try:
+                targets = [pool.choose(model)]
+            except NoBackendAvailable as e:
+                logger.warning("Not loading %s: %s", model, e)
+                return
+        results = await asyncio.gather(*[self._send(b, model, self.keep_alive) for b in targets])
+        for backend, ok in zip(targets, results):
+            if ok and backend in warm:
+                self.pings += 1
+            elif ok:
+                self.loads += 1
+
+    async def _refresh_sizes(self):
+        async def tags(backend: Backend):
+            try:
+                response = await backend.client.get("/api/tags", timeout=settings.ollama_connect_timeout)
+                response.raise_for_status()
+                for model in response.json().get("models", []):
+                    if model.get("size"):
+                        self._reported_sizes[model["name"]] = model["size"] / MB
+            except Exception as e:
+                logger.debug("Could not read model sizes from %s: %s", backend.host, e)
+
+        await asyncio.gather(*[tags(b) for b in self.service.pool.backends if b.healthy])
+
+    async def reconcile(self):
+        """Ping the planned models and, with a budget, unload the others"""
+        await self._refresh_sizes()
+        planned = self.plan()
+        self.resident = set(planned)
+        # One model failing must not stop the others from being pinged
+        results = await asyncio.gather(*[self._load(model) for model in planned], return_exceptions=True)
+        self._log_failures(planned, results)
+        if self.memory_budget_mb:
+            unloads = [
+                (backend, model)
+                for backend in self.service.pool.backends if backend.healthy
+                for model in list(backend.loaded_models) if model not in self.resident
+            ]
+            results = await asyncio.gather(*[self._send(b, m, 0) for b, m in unloads])
+            self.unloads += sum(results)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning("Model residency update failed: %s", e)
+
+    async def startup(self):
+        """Load the configured models on every node and start keep-alive rounds"""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+        results = await asyncio.gather(
+            *[self._load(model, everywhere=True) for model in self.preload], return_exceptions=True
+        )
+        self._log_failures(self.preload, results)
+
+    def _log_failures(self, models: List[str], results: List[Any]):
+        for model, result in zip(models, results):
+            if isinstance(result, Exception):
+                self.failures += 1
+                logger.warning("Loading %s failed: %s", model, result)
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        backends = self.service.pool.backends
+        names = set(self._rates) | set(self.preload)
+        for backend in backends:
+            names |= backend.loaded_models
+        models = {}
+        for model in sorted(names):
+            rate = self._rates.get(model)
+            models[model] = {
+                "rate_per_minute": round(self.rate(model, now), 3),
+                "requests": rate.requests if rate else 0,
+                "size_mb": self.size_mb(model),
+                "resident": model in self.resident,
+                "preloaded": model in self.preload,
+                "loaded_on": [b.host for b in backends if model in b.loaded_models]
+            }
+        return {
+            "keep_alive": self.keep_alive,
+            "interval": self.interval,
+            "memory_budget_mb": self.memory_budget_mb,
+            "resident_mb": sum(self.size_mb(model) or 0.0 for model in self.resident),
+            "loads": self.loads,
+            "unloads": self.unloads,
+            "pings": self.pings,
+            "failures": self.failures,
+            "models": models
+        }
+
+
+# Global residency manager
+model_residency = ModelResidency(
+    ollama_service,
+    preload=settings.residency_preload_models,
+    keep_alive=settings.residency_keep_alive,
+    interval=settings.residency_interval,
+    memory_budget_mb=settings.residency_memory_budget_mb,
+    model_sizes_mb=settings.residency_model_sizes_mb,
+    rate_window=settings.residency_rate_window,
+    min_rate=settings.residency_min_rate
+)
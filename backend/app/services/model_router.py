@@ -0,0 +1,190 @@
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+from app.core.config import settings
+from .metrics import Metrics, metrics
+from .scheduler import Scheduler, scheduler
+
+# Model name that asks the router to pick the model
+AUTO_MODEL = "auto"
+
+
+class Route:
+    """Where one ``model="auto"`` request is sent, and why"""
+
+    __slots__ = ("model", "tier", "reason", "start", "attempt_start", "escalations")
+
+    def __init__(self, model: str, tier: int, reason: str):
+        self.model = model
+        self.tier = tier
+        self.reason = reason  # short, complex, downgrade or single
+        self.start = self.attempt_start = time.perf_counter()
+        self.escalations = 0
+
+    @property
+    def outcome(self) -> str:
+        """Label for the latency metrics: direct, downgraded or escalated"""
+        if self.escalations:
+            return "escalated"
+        return "downgraded" if self.reason == "downgrade" else "direct"
+
+
+class ModelRouter:
+    """
+    Picks the model for ``model="auto"`` requests
+
+    Models are configured as tiers from cheapest to most capable. A prompt
+    starts on the first tier and moves up one tier for each sign of a hard
+    task: more than ``short_prompt_tokens`` tokens, or a match of one of the
+    ``escalate_patterns`` (code blocks, "step by step", ...). If the chosen
+    model's expected queue wait is over ``queue_slo`` seconds, the request
+    goes down to lighter tiers until one is within the SLO.
+
+    Non-streaming answers from a lower tier are checked before they are
+    returned (empty or cut-off answers, or phrases of uncertainty such as
+    "I'm not sure"); with ``cascade`` a failed answer is regenerated on the
+    next tier up, unless that model is itself over the SLO.
+    """
+
+    def __init__(
+        self,
+        tiers: Sequence[str],
+        queue: Scheduler,
+        registry: Metrics,
+        short_prompt_tokens: int = 200,
+        escalate_patterns: Sequence[str] = (),
+        uncertain_patterns: Sequence[str] = (),
+        min_answer_chars: int = 1,
+        cascade: bool = True,
+        queue_slo: float = 2.0
+    ):
+        self.tiers = list(tiers)
+        self.queue = queue
+        self.registry = registry
+        self.short_prompt_tokens = short_prompt_tokens
+        self.escalate = re.compile("|".join(f"(?:{p})" for p in escalate_patterns), re.I) if escalate_patterns else None
+        self.uncertain = re.compile("|".join(f"(?:{p})" for p in uncertain_patterns), re.I) if uncertain_patterns else None
+        self.min_answer_chars = min_answer_chars
+        self.cascade = cascade
+        self.queue_slo = queue_slo
+        self.decisions: Dict[str, Dict[str, int]] = {}  # model -> reason -> count
+        self.escalations = 0
+        self.escalations_shed = 0  # failed answers kept because the next tier was over the SLO
+        self.downgrades = 0
+        self._latency: Dict[str, List[float]] = {}  # outcome -> [count, total seconds]
+
+    def route(self, message: str, prompt_tokens: int, default_model: str) -> Route:
+        """
+        Choose the model for a prompt
+
+        Args:
+            message: User message (checked against the escalation patterns)
+            prompt_tokens: Estimated prompt size including history and passages
+            default_model: Model used when no tiers are configured
+
+        Returns:
+            Route with the chosen model and the reason for it
+        """
+        tiers = self.tiers or [default_model]
+        if len(tiers) == 1:
+            route = Route(tiers[0], 0, "single")
+        else:
+            tier = 0
+            if prompt_tokens > self.short_prompt_tokens:
+                tier += 1
+            if self.escalate is not None and self.escalate.search(message):
+                tier += 1
+            tier = min(tier, len(tiers) - 1)
+            route = Route(tiers[tier], tier, "short" if tier == 0 else "complex")
+
+            wanted = route.model
+            while route.tier > 0 and self.queue.estimated_wait(route.model) > self.queue_slo:
+                route.tier -= 1
+                route.model = tiers[route.tier]
+                route.reason = "downgrade"
+            if route.reason == "downgrade":
+                self.downgrades += 1
+                saved = self.queue.estimated_wait(wanted) - self.queue.estimated_wait(route.model)
+                self.registry.observe_downgrade(wanted, route.model, max(saved, 0.0))
+
+        counts = self.decisions.setdefault(route.model, {})
+        counts[route.reason] = counts.get(route.reason, 0) + 1
+        self.registry.observe_route(route.model, route.reason)
+        return route
+
+    def acceptable(self, result: Dict[str, Any]) -> bool:
+        """Whether a generated answer is good enough to return without escalating"""
+        if not result.get("success"):
+            return False
+        if result.get("done_reason") == "length":
+            return False
+        answer = result.get("response", "").strip()
+        if len(answer) < self.min_answer_chars:
+            return False
+        return self.uncertain is None or not self.uncertain.search(answer)
+
+    def next_model(self, route: Route, result: Dict[str, Any]) -> Optional[str]:
+        """
+        The model to retry on when ``result`` fails the answer check
+
+        Updates ``route`` to the next tier and records the escalation.
+
+        Returns:
+            Larger model name, or None to keep ``result``
+        """
+        if not self.cascade or route.tier + 1 >= len(self.tiers) or self.acceptable(result):
+            return None
+        larger = self.tiers[route.tier + 1]
+        if self.queue.estimated_wait(larger) > self.queue_slo:
+            self.escalations_shed += 1
+            return None
+        now = time.perf_counter()
+        self.registry.observe_escalation(route.model, larger, now - route.attempt_start)
+        self.escalations += 1
+        route.escalations += 1
+        route.tier += 1
+        route.model = larger
+        route.attempt_start = now
+        return larger
+
+    def finish(self, route: Route):
+        """Record the end-to-end latency of a routed request"""
+        seconds = time.perf_counter() - route.start
+        latency = self._latency.setdefault(route.outcome, [0, 0.0])
+        latency[0] += 1
+        latency[1] += seconds
+        self.registry.observe_routed(route.model, route.outcome, seconds)
+
+    async def record_stream(self, route: Route, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Pass stream events through, recording the latency once the stream is done"""
+        async for event in events:
+            if event.get("done"):
+                self.finish(route)
+            yield event
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tiers": self.tiers,
+            "queue_slo_seconds": self.queue_slo,
+            "decisions": self.decisions,
+            "downgrades": self.downgrades,
+            "escalations": self.escalations,
+            "escalations_shed": self.escalations_shed,
+            "latency_seconds_avg": {
+                outcome: total / count for outcome, (count, total) in self._latency.items()
+            }
+        }
+
+
+# Global model router instance
+model_router = ModelRouter(
+    settings.router_models,
+    scheduler,
+    metrics,
+    short_prompt_tokens=settings.router_short_prompt_tokens,
+    escalate_patterns=settings.router_escalate_patterns,
+    uncertain_patterns=settings.router_uncertain_patterns,
+    min_answer_chars=settings.router_min_answer_chars,
+    cascade=settings.router_cascade,
+    queue_slo=settings.router_queue_slo
+)
@@ -1,51 +1,355 @@
-import ollama
+import asyncio
+import json
+import math
+import time
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, AsyncIterator, Sequence, Set, Tuple
 from datetime import datetime
 from app.core.config import settings
+from .backend_pool import Backend, BackendPool, NoBackendAvailable
+from .hedging import HedgePolicy, create_hedge_policy
+from .metrics import metrics
+from .tracing import KIND_CLIENT, tracer
+
+
+class _Attempt:
+    """
+    One streaming /api/chat call to one node, run in its own task
+
+    Chunks are handed over through a queue, so attempts on several nodes
+    can be raced and the loser cancelled (closing its connection, which
+    stops the generation in Ollama). The queue is bounded: when the reader
+    falls behind, the node's response stops being read.
+    """
+
+    def __init__(self, service: "OllamaService", backend: Backend, payload: Dict[str, Any]):
+        self.backend = backend
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None  # seconds until the first chunk
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()  # first chunk or error
+        # Chunks, then None or an exception
+        self.chunks: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=settings.stream_read_ahead)  # 0 = unbounded
+        self.task = asyncio.create_task(self._run(service, payload))
+        service._attempts.add(self.task)
+        self.task.add_done_callback(service._attempts.discard)
+
+    async def _run(self, service: "OllamaService", payload: Dict[str, Any]):
+        try:
+            async with service.pool.lease(self.backend):
+                async for chunk in service._chat_stream(self.backend, payload):
+                    if not self.ready.done():
+                        self.first_token = time.perf_counter() - self.started
+                        self.ready.set_result(None)
+                    await self.chunks.put(chunk)
+        except Exception as e:
+            if self.ready.done():
+                await self.chunks.put(e)
+            else:
+                self.ready.set_exception(e)
+            return
+        if not self.ready.done():
+            self.first_token = time.perf_counter() - self.started
+            self.ready.set_result(None)
+        await self.chunks.put(None)
+
+    def cancel(self):
+        self.task.cancel()
+        if self.ready.done() and not self.ready.cancelled():
+            self.ready.exception()  # retrieved, so asyncio does not log it
 
 
 class OllamaService:
     """Service for interacting with Ollama LLM"""
-    
-    def __init__(self):
-        self.client = ollama.Client(host=settings.ollama_host)
+
+    def __init__(self, host: Optional[str] = None, hosts: Optional[List[str]] = None):
+        if not hosts:
+            hosts = [host] if host else (settings.ollama_hosts or [settings.ollama_host])
+        self.pool = BackendPool(hosts, health_interval=settings.ollama_health_interval)
         self.default_model = settings.default_model
-    
-    async def generate_response(self, message: str, model: str = None) -> Dict[str, Any]:
+        self.hedging: HedgePolicy = create_hedge_policy()
+        self.first_token_timeout = settings.ollama_first_token_timeout
+        self._attempts: Set[asyncio.Task] = set()
+
+    @property
+    def host(self) -> str:
+        """URL of the first configured Ollama node"""
+        return self.pool.backends[0].host
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Connection pool of the first Ollama node
+
+        Requests themselves are spread over every node by the backend pool.
+        """
+        return self.pool.backends[0].client
+
+    async def startup(self):
+        """Open the connection pools and start backend health checks"""
+        await self.pool.startup()
+
+    async def shutdown(self):
+        """Stop health checks, abandon hedged requests and close the connection pools"""
+        for task in list(self._attempts):
+            task.cancel()
+        await asyncio.gather(*self._attempts, return_exceptions=True)
+        await self.pool.shutdown()
+
+    async def aclose(self):
+        await self.shutdown()
+
+    @staticmethod
+    def _build_messages(message: str, history: Optional[Sequence[Tuple[str, str]]] = None,
+                        passages: Optional[Sequence[Tuple[str, str]]] = None) -> List[Dict[str, str]]:
+        messages = []
+        if passages:
+            # Retrieved documentation goes first, as instructions for the whole conversation
+            numbered = "\n\n".join(
+                f"[{i}] {source}\n{text}" for i, (source, text) in enumerate(passages, 1)
+            )
+            messages.append({
+                'role': 'system',
+                'content': "Answer using the following passages from our documentation where they are "
+                           "relevant. If they do not contain the answer, say so.\n\n" + numbered
+            })
+        messages.extend({'role': role, 'content': content} for role, content in history or ())
+        messages.append({
+            'role': 'user',
+            'content': message,
+        })
+        return messages
+
+    @staticmethod
+    def _build_payload(model: str, messages: List[Dict[str, str]], stream: bool,
+                       options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        payload = {"model": model, "messages": messages, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def _chat_stream(self, backend: Backend, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream raw chat chunks from one node's /api/chat endpoint
+
+        Args:
+            backend: Ollama node to call
+            payload: Request body for /api/chat
+
+        Yields:
+            Decoded NDJSON chunks as returned by Ollama
+        """
+        span = tracer.start_span("ollama.connect", KIND_CLIENT, host=backend.host, model=payload["model"])
+        try:
+            async with backend.client.stream("POST", "/api/chat", json=payload) as response:
+                span.set("http.response.status_code", response.status_code)
+                span.end()  # headers are in; the rest is generation
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise httpx.HTTPStatusError(
+                        f"HTTP {response.status_code}: {body.decode(errors='replace')}",
+                        request=response.request,
+                        response=response
+                    )
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(chunk["error"])
+                    yield chunk
+        except BaseException as e:
+            span.fail(e)  # connection errors; later failures belong to the stream span
+            raise
+        finally:
+            span.end()
+
+    async def _first_chunk(self, payload: Dict[str, Any], tried: List[Backend]) -> _Attempt:
+        """
+        Start a chat on the best node and wait until some node sends a first chunk
+
+        A node that fails, or sends nothing within ``first_token_timeout``,
+        is given up and the next node is tried. If the first token is later
+        than the model's hedge delay and the hedge budget allows, a copy of
+        the request goes to a second node; whichever answers first wins and
+        the other is cancelled.
+
+        Args:
+            payload: Request body for /api/chat
+            tried: Nodes already used for this request (extended in place)
+
+        Returns:
+            The winning attempt
+
+        Raises:
+            Exception: The error of the last node tried, once no node is left
+        """
+        model = payload["model"]
+        attempts: List[_Attempt] = []
+        started = len(tried)
+        error: Optional[Exception] = None
+        may_hedge = self.hedging.enabled and len(self.pool.backends) > 1
+        hedge_at = math.inf
+        hedge: Optional[_Attempt] = None
+        self.hedging.record_request()
+        try:
+            while True:
+                if not attempts:
+                    try:
+                        backend = self.pool.pick(model, exclude=tried)
+                    except NoBackendAvailable:
+                        if error is not None:
+                            raise error
+                        raise
+                    tried.append(backend)
+                    attempts.append(_Attempt(self, backend, payload))
+                    if may_hedge:
+                        hedge_at = attempts[0].started + self.hedging.delay(model)
+
+                deadline = math.inf
+                if self.first_token_timeout:
+                    deadline = min(a.started for a in attempts) + self.first_token_timeout
+                timeout = min(deadline, hedge_at) - time.perf_counter()
+                done, _ = await asyncio.wait(
+                    [a.ready for a in attempts],
+                    timeout=None if timeout == math.inf else max(timeout, 0.0),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for attempt in [a for a in attempts if a.ready in done]:
+                    if attempt.ready.exception() is None:
+                        attempts.remove(attempt)
+                        if hedge is not None:
+                            metrics.observe_hedge(model, "won" if attempt is hedge else "lost")
+                            self.hedging.won += attempt is hedge
+                        span = tracer.current_span()
+                        span.set("host", attempt.backend.host)
+                        span.set("nodes_tried", len(tried) - started)
+                        span.set("hedged", hedge is not None)
+                        return attempt
+                    attempts.remove(attempt)
+                    error = attempt.ready.exception()
+                    attempt.backend.mark_failure(error)
+
+                now = time.perf_counter()
+                for attempt in [a for a in attempts if now - a.started >= (self.first_token_timeout or math.inf)]:
+                    attempts.remove(attempt)
+                    attempt.cancel()
+                    error = TimeoutError(f"No response from {attempt.backend.host} within {self.first_token_timeout}s")
+                    attempt.backend.mark_failure(error)
+
+                if attempts and now >= hedge_at:
+                    may_hedge = False  # at most one hedge per request
+                    hedge_at = math.inf
+                    if not self.hedging.try_spend():
+                        metrics.observe_hedge(model, "denied")
+                        continue
+                    try:
+                        backend = self.pool.pick(model, exclude=tried)
+                    except NoBackendAvailable:
+                        self.hedging.refund()
+                        continue
+                    tried.append(backend)
+                    hedge = _Attempt(self, backend, payload)
+                    attempts.append(hedge)
+        finally:
+            # The losing attempt, or every attempt if the caller went away
+            for attempt in attempts:
+                attempt.cancel()
+                attempt.backend.mark_abandoned(time.perf_counter() - attempt.started)
+
+    async def _chat_chunks(self, payload: Dict[str, Any],
+                           tried: Optional[List[Backend]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming /api/chat call across the backend pool
+
+        Nodes that fail or stall before their first chunk are skipped, and
+        late first tokens are hedged on a second node (see ``_first_chunk``).
+        Failures after the first chunk are raised, since part of the answer
+        has already been sent.
+
+        Args:
+            payload: Request body for /api/chat
+            tried: Nodes already used for this request (extended in place)
+
+        Yields:
+            Decoded NDJSON chunks as returned by Ollama
+        """
+        with tracer.span("ollama.first_token", model=payload["model"]):
+            attempt = await self._first_chunk(payload, tried if tried is not None else [])
+        span = tracer.start_span("ollama.stream", host=attempt.backend.host, model=payload["model"])
+        chunks = 0
+        try:
+            while True:
+                item = await attempt.chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    attempt.backend.mark_failure(item)
+                    span.fail(item)
+                    raise item
+                chunks += 1
+                yield item
+        finally:
+            attempt.cancel()
+            span.set("chunks", chunks)
+            span.end()
+        self.hedging.observe(payload["model"], attempt.first_token)
+        attempt.backend.mark_success(payload["model"], attempt.first_token)
+
+    async def generate_response(self, message: str, model: str = None,
+                                options: Optional[Dict[str, Any]] = None,
+                                history: Optional[Sequence[Tuple[str, str]]] = None,
+                                passages: Optional[Sequence[Tuple[str, str]]] = None) -> Dict[str, Any]:
         """
         Generate a response from Ollama LLM
-        
+
         Args:
             message: User input message
             model: Model name to use (defaults to configured model)
-            
+            options: Ollama generation options
+            history: Earlier (role, content) turns of the conversation
+            passages: Retrieved (source, text) passages to ground the answer in
+
         Returns:
             Dictionary containing response and metadata
         """
         if not model:
             model = self.default_model
-            
+
         try:
-            # Generate response using Ollama
-            response = self.client.chat(
-                model=model,
-                messages=[
-                    {
-                        'role': 'user',
-                        'content': message,
-                    },
-                ],
-                stream=False
-            )
-            
-            return {
-                "response": response['message']['content'],
+            # Streamed from Ollama even here: the first token is what failover and hedging wait for
+            payload = self._build_payload(model, self._build_messages(message, history, passages), True, options)
+            tried: List[Backend] = []
+            while True:
+                parts = []
+                data: Dict[str, Any] = {}
+                started = False
+                try:
+                    async for chunk in self._chat_chunks(payload, tried):
+                        started = True
+                        parts.append(chunk.get('message', {}).get('content', ''))
+                        if chunk.get('done', False):
+                            data = chunk
+                    break
+                except Exception:
+                    # Nothing has reached the caller yet: a node that broke off can be replaced
+                    if not started or len(tried) >= len(self.pool.backends):
+                        raise
+            metrics.observe_ollama(model, data)
+
+            result = {
+                "response": "".join(parts),
                 "model": model,
                 "timestamp": datetime.now().isoformat(),
                 "success": True
             }
-            
+            if data.get("eval_count") is not None:
+                result["eval_count"] = data["eval_count"]
+            if data.get("done_reason"):
+                # "length" when the answer hit num_predict
+                result["done_reason"] = data["done_reason"]
+            return result
+
         except Exception as e:
             return {
                 "response": f"Error generating response: {str(e)}",
@@ -54,110 +358,128 @@ class OllamaService:
                 "success": False,
                 "error": str(e)
             }
-    
-    async def stream_response(self, message: str, model: str = None):
+
+    async def stream_response(self, message: str, model: str = None,
+                              options: Optional[Dict[str, Any]] = None,
+                              history: Optional[Sequence[Tuple[str, str]]] = None,
+                              passages: Optional[Sequence[Tuple[str, str]]] = None):
         """
         Generate a streaming response from Ollama LLM
-        
+
+        Each chunk event carries only the new text. The final event has
+        ``done`` set and carries the complete response once, so callers
+        never need to re-send accumulated text per chunk.
+
         Args:
             message: User input message
             model: Model name to use (defaults to configured model)
-            
+            options: Ollama generation options
+            history: Earlier (role, content) turns of the conversation
+            passages: Retrieved (source, text) passages to ground the answer in
+
         Yields:
             Dictionary containing response chunks and metadata
         """
         if not model:
             model = self.default_model
-            
+
         try:
             # Generate streaming response using Ollama
-            stream = self.client.chat(
-                model=model,
-                messages=[
-                    {
-                        'role': 'user',
-                        'content': message,
-                    },
-                ],
-                stream=True
-            )
-            
-            full_response = ""
-            for chunk in stream:
-                if 'message' in chunk and 'content' in chunk['message']:
-                    content = chunk['message']['content']
-                    full_response += content
-                    
+            parts = []
+            payload = self._build_payload(model, self._build_messages(message, history, passages), True, options)
+            async for chunk in self._chat_chunks(payload):
+                content = chunk.get('message', {}).get('content', '')
+                if content:
+                    parts.append(content)
+
+                if chunk.get('done', False):
+                    # Load / prompt-eval / eval timings only arrive in the final chunk
+                    metrics.observe_ollama(model, chunk)
                     yield {
                         "chunk": content,
-                        "full_response": full_response,
+                        "response": "".join(parts),
                         "model": model,
                         "timestamp": datetime.now().isoformat(),
                         "success": True,
-                        "done": chunk.get('done', False)
+                        "done": True
+                    }
+                    return
+
+                if content:
+                    yield {
+                        "chunk": content,
+                        "model": model,
+                        "success": True,
+                        "done": False
                     }
-                    
+
         except Exception as e:
             yield {
                 "chunk": "",
-                "full_response": f"Error generating response: {str(e)}",
+                "response": f"Error generating response: {str(e)}",
                 "model": model,
                 "timestamp": datetime.now().isoformat(),
                 "success": False,
                 "error": str(e),
                 "done": True
             }
-    
-    async def check_ollama_status(self) -> Dict[str, Any]:
+
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
         """
-        Check if Ollama is running and accessible
-        
+        Embed texts with one /api/embed call
+
+        Connection errors and 5xx answers are retried on the next node; a
+        4xx answer is raised at once and does not count against the node.
+
+        Args:
+            texts: Texts to embed
+            model: Embedding model (defaults to the configured embedding model)
+
         Returns:
-            Dictionary containing status information
+            One vector per text, in order
+
+        Raises:
+            httpx.HTTPStatusError: Ollama refused the request (4xx)
+            httpx.HTTPError: Every node failed
+            ValueError: Ollama returned a different number of vectors
         """
-        try:
-            # Try to connect to Ollama
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{settings.ollama_host}/api/tags")
-                
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return {
-                    "status": "healthy",
-                    "models_available": len(models),
-                    "models": [model["name"] for model in models]
-                }
+        model = model or settings.embed_default_model
+        tried: List[Backend] = []
+        while True:
+            backend = self.pool.pick(model, exclude=tried)
+            try:
+                async with self.pool.lease(backend):
+                    response = await backend.client.post("/api/embed", json={"model": model, "input": texts})
+                    response.raise_for_status()
+                    embeddings = response.json()["embeddings"]
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code < 500:
+                    # The request itself was refused (e.g. not an embedding model): every node
+                    # would refuse it too, and it says nothing about this one
+                    backend.breaker.release()
+                    raise
+                error = e
+            except httpx.TransportError as e:
+                error = e
+            except Exception as e:
+                backend.mark_failure(e)
+                raise
             else:
-                return {
-                    "status": "unhealthy",
-                    "error": f"HTTP {response.status_code}"
-                }
-                
-        except Exception as e:
-            return {
-                "status": "unreachable",
-                "error": str(e)
-            }
-    
-    def list_models(self) -> Dict[str, Any]:
-        """
-        List available models in Ollama
-        
-        Returns:
-            Dictionary containing available models
-        """
-        try:
-            models = self.client.list()
-            return {
-                "success": True,
-                "models": [model["name"] for model in models["models"]]
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "models": []
-            }
+                backend.mark_success(model)
+                if len(embeddings) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+                return embeddings
+            backend.mark_failure(error)
+            tried.append(backend)
+            if len(tried) >= len(self.pool.backends):
+                raise error
+
+    async def tags(self, backend: Backend, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Models reported by one node's ``/api/tags``"""
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        response = await backend.client.get("/api/tags", **kwargs)
+        response.raise_for_status()
+        return response.json().get("models", [])
 
 
 # Global service instance
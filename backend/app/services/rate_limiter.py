@@ -0,0 +1,312 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from .context_manager import estimate_tokens
+from .shared_state import STATE_ERRORS, SharedState, shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class Decision:
+    """Outcome of a rate-limit check, in the units of the limit"""
+
+    __slots__ = ("allowed", "limit", "remaining", "reset", "retry_after")
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, reset: float, retry_after: float = 0.0):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset  # seconds until the full limit is available again
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a client is over its request rate or token quota"""
+
+    def __init__(self, client: str, limit_name: str, decision: Decision, headers: Dict[str, str]):
+        super().__init__(f"{limit_name} limit exceeded for {client}")
+        self.limit_name = limit_name
+        self.retry_after = decision.retry_after
+        self.headers = headers
+
+
+class TokenBuckets:
+    """
+    In-process token buckets, one per client
+
+    Uses the generic cell rate algorithm: each client is stored as a single
+    float, the time at which its bucket is full again, so a check is a dict
+    lookup and a little arithmetic. Clients whose bucket has refilled need
+    no state and are dropped as they reach the front of the LRU order; past
+    ``max_keys`` the least recently seen client is forgotten (which forgives
+    any debt it had). Charges may push a bucket into debt, e.g. when a
+    generation produces more tokens than remain.
+    """
+
+    name = "memory"
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 1000000):
+        self.rate = rate  # units per second
+        self.burst = burst
+        self.max_keys = max_keys
+        self._full_at: "OrderedDict[str, float]" = OrderedDict()
+        self.evictions = 0
+
+    def _update(self, key: str, full_at: float, now: float):
+        self._full_at[key] = full_at
+        self._full_at.move_to_end(key)
+        # Drop refilled buckets from the front, then enforce the key limit
+        for _ in range(2):
+            oldest = next(iter(self._full_at))
+            if oldest == key or self._full_at[oldest] > now:
+                break
+            del self._full_at[oldest]
+        while len(self._full_at) > self.max_keys:
+            self._full_at.popitem(last=False)
+            self.evictions += 1
+
+    async def acquire(self, key: str, cost: float = 1.0, debit: bool = True) -> Decision:
+        """
+        Take ``cost`` units if the bucket holds them
+
+        Args:
+            key: Client identity
+            cost: Units needed
+            debit: False only checks that ``cost`` units are available
+
+        Returns:
+            Decision; a denied request takes nothing
+        """
+        now = time.monotonic()
+        full_at = max(self._full_at.get(key, now), now)
+        available = self.burst - (full_at - now) * self.rate
+        if available < cost:
+            retry_after = (cost - available) / self.rate
+            return Decision(False, self.burst, max(math.floor(available), 0), full_at - now, retry_after)
+        if debit:
+            full_at += cost / self.rate
+            self._update(key, full_at, now)
+        return Decision(True, self.burst, math.floor(available - cost if debit else available), full_at - now)
+
+    async def charge(self, key: str, amount: float):
+        """Take ``amount`` units unconditionally (the bucket may go into debt)"""
+        now = time.monotonic()
+        self._update(key, max(self._full_at.get(key, now), now) + amount / self.rate, now)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "rate": self.rate, "burst": self.burst,
+                "clients": len(self._full_at), "evictions": self.evictions}
+
+
+class SharedWindows:
+    """
+    Fixed-window counters in the shared state, for several worker processes
+
+    Each client gets ``burst`` units per window of ``burst / rate`` seconds,
+    counted with ``incr`` on a key that expires with its window, so memory
+    in the store is bounded by the clients active in the last window.
+    Coarser than a token bucket (a client can use up to twice the burst
+    across a window boundary) but needs no server-side scripting. When the
+    store is unreachable requests are allowed rather than failed.
+    """
+
+    name = "shared"
+
+    def __init__(self, state: SharedState, limit_name: str, rate: float, burst: int):
+        self.state = state
+        self.limit_name = limit_name
+        self.rate = rate
+        self.burst = burst
+        self.window = burst / rate
+        self.errors = 0
+
+    def _key(self, key: str, now: float) -> str:
+        return f"ratelimit:{self.limit_name}:{key}:{int(now // self.window)}"
+
+    async def acquire(self, key: str, cost: float = 1.0, debit: bool = True) -> Decision:
+        now = time.time()
+        reset = self.window - now % self.window
+        try:
+            if debit:
+                # Denied requests are counted too: hammering does not help
+                used = await self.state.incr(self._key(key, now), math.ceil(cost), ttl=self.window + 1)
+            else:
+                used = int(await self.state.get(self._key(key, now)) or 0)
+        except STATE_ERRORS as e:
+            self.errors += 1
+            logger.warning("Rate limit check failed, allowing request: %s", e)
+            return Decision(True, self.burst, self.burst, reset)
+        remaining = self.burst - used
+        allowed = remaining >= (0 if debit else cost)
+        return Decision(allowed, self.burst, max(math.floor(remaining), 0), reset, 0.0 if allowed else reset)
+
+    async def charge(self, key: str, amount: float):
+        if amount <= 0:
+            return
+        now = time.time()
+        try:
+            await self.state.incr(self._key(key, now), math.ceil(amount), ttl=self.window + 1)
+        except STATE_ERRORS as e:
+            self.errors += 1
+            logger.warning("Rate limit charge failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "rate": self.rate, "burst": self.burst,
+                "window_seconds": self.window, "errors": self.errors}
+
+
+class RateLimiter:
+    """
+    Per-client limits on requests and on generated tokens
+
+    ``requests`` is charged one unit per chat request when it is admitted.
+    ``tokens`` cannot be charged up front since the answer length is not
+    known: a request is admitted while the client has any token quota
+    left and the tokens actually generated are charged afterwards. Cached
+    answers use no tokens. Either limit may be None (unlimited).
+    """
+
+    def __init__(self, requests=None, tokens=None):
+        self.requests = requests
+        self.tokens = tokens
+        self.allowed = 0
+        self.limited: Dict[str, int] = {"requests": 0, "tokens": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    @staticmethod
+    def headers(decisions: List[Decision], policies: List[str]) -> Dict[str, str]:
+        """RateLimit-* headers for the decision closest to its limit"""
+        decision = min(decisions, key=lambda d: d.remaining / d.limit if d.limit else 0)
+        headers = {
+            "RateLimit-Limit": str(decision.limit),
+            "RateLimit-Remaining": str(decision.remaining),
+            "RateLimit-Reset": str(math.ceil(decision.reset)),
+            "RateLimit-Policy": ", ".join(policies)
+        }
+        if not decision.allowed:
+            headers["Retry-After"] = str(max(math.ceil(decision.retry_after), 1))
+        return headers
+
+    @staticmethod
+    def _policy(limit, unit: str) -> str:
+        return f'{limit.burst};w={math.ceil(limit.burst / limit.rate)};comment="{unit}"'
+
+    async def check(self, client: str) -> Dict[str, str]:
+        """
+        Admit one request from ``client``
+
+        Returns:
+            Rate-limit headers for the response (empty when disabled)
+
+        Raises:
+            RateLimitExceeded: The client is over a limit; nothing was charged
+        """
+        decisions, policies = [], []
+        decision = await self.check_tokens(client)
+        if decision is not None:
+            decisions.append(decision)
+            policies.append(self._policy(self.tokens, "tokens"))
+        if self.requests is not None:
+            decision = await self.requests.acquire(client, 1)
+            decisions.insert(0, decision)
+            policies.insert(0, self._policy(self.requests, "requests"))
+            if not decision.allowed:
+                self.limited["requests"] += 1
+                raise RateLimitExceeded(client, "requests", decision, self.headers([decision], policies))
+        self.allowed += 1
+        return self.headers(decisions, policies) if decisions else {}
+
+    async def check_tokens(self, client: str) -> Optional[Decision]:
+        """
+        Check that ``client`` has token quota left, charging nothing
+
+        Also used before each answer of work admitted as one request (batch
+        items), so one admission cannot run up unbounded token debt.
+
+        Returns:
+            The decision, or None when tokens are unlimited
+
+        Raises:
+            RateLimitExceeded: The client has no token quota left
+        """
+        if self.tokens is None:
+            return None
+        # Any quota left admits the request; the answer is charged later
+        decision = await self.tokens.acquire(client, 1, debit=False)
+        if not decision.allowed:
+            self.limited["tokens"] += 1
+            headers = self.headers([decision], [self._policy(self.tokens, "tokens")])
+            raise RateLimitExceeded(client, "tokens", decision, headers)
+        return decision
+
+    async def charge(self, client: str, tokens: int):
+        """Charge ``tokens`` generated tokens to ``client``"""
+        if self.tokens is not None and tokens > 0:
+            await self.tokens.charge(client, tokens)
+
+    async def record_stream(self, client: str, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Pass stream events through and charge the generated tokens
+
+        Tokens are charged when the stream ends, also when the client
+        disconnected part-way (for the text sent so far).
+        """
+        if self.tokens is None:
+            async for event in events:
+                yield event
+            return
+        sent = 0
+        charged = False
+        try:
+            async for event in events:
+                if event.get("done"):
+                    if event.get("success") and not event.get("cached"):
+                        await self.charge(client, estimate_tokens(event["response"]))
+                    charged = True
+                elif event.get("chunk"):
+                    sent += len(event["chunk"])
+                yield event
+        finally:
+            if not charged and sent:
+                await self.charge(client, sent // 4 + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "requests": self.requests.stats() if self.requests is not None else None,
+            "tokens": self.tokens.stats() if self.tokens is not None else None
+        }
+
+
+def create_rate_limiter() -> RateLimiter:
+    """
+    Build the rate limiter from settings
+
+    With a shared state URL the counters live in the shared store so every
+    worker process enforces the same limits; otherwise each process keeps
+    its own buckets.
+    """
+    def make(name: str, per_minute: float, burst: int):
+        if per_minute <= 0:
+            return None
+        burst = burst or max(math.ceil(per_minute), 1)
+        if settings.shared_state_url:
+            return SharedWindows(shared_state, name, per_minute / 60, burst)
+        return TokenBuckets(per_minute / 60, burst, settings.rate_limit_max_clients)
+
+    return RateLimiter(
+        requests=make("requests", settings.rate_limit_requests_per_minute, settings.rate_limit_request_burst),
+        tokens=make("tokens", settings.rate_limit_tokens_per_minute, settings.rate_limit_token_burst)
+    )
+
+
+# Global rate limiter instance
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,178 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings
+
+
+class _Call:
+    """One in-flight upstream call shared by several waiters"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Broadcast:
+    """
+    One in-flight upstream stream fanned out to several subscribers
+
+    Events are appended to a shared log and each subscriber reads it with its
+    own cursor, so a slow subscriber only delays itself and never the other
+    subscribers. The upstream stream is read at most ``read_ahead`` events
+    past the fastest subscriber (0 = no limit).
+    """
+
+    def __init__(self, source: AsyncIterator[Dict[str, Any]], read_ahead: int = 0):
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.subscribers = 0
+        self.read_ahead = read_ahead
+        self.read = 0  # events taken by the fastest subscriber
+        self._reader: Optional[asyncio.Future] = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+                while self.read_ahead and len(self.events) - self.read >= self.read_ahead:
+                    self._reader = asyncio.get_running_loop().create_future()
+                    try:
+                        await self._reader
+                    except asyncio.CancelledError:
+                        # Not suspended inside ``source``: close it here so the upstream request ends
+                        aclose = getattr(source, "aclose", None)
+                        if aclose is not None:
+                            await aclose()
+                        raise
+        except Exception as e:
+            self.events.append({"chunk": "", "success": False, "error": str(e), "done": True})
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(self.events):
+                    yield self.events[index]
+                    index += 1
+                    if index > self.read:
+                        self.read = index
+                        if self._reader is not None and not self._reader.done():
+                            self._reader.set_result(None)
+                elif self.done:
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            # Last subscriber gone: nobody needs the rest of the answer
+            if self.subscribers == 0 and not self.task.done():
+                self.task.cancel()
+
+
+class RequestCoalescer:
+    """
+    Single-flight layer for identical concurrent requests
+
+    Concurrent calls with the same key share one upstream generation.
+    The upstream call runs in its own task and is cancelled only when every
+    caller has gone away.
+    """
+
+    def __init__(self, enabled: bool = True, read_ahead: int = 0):
+        self.enabled = enabled
+        self.read_ahead = read_ahead
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.stream_leaders = 0
+        self.stream_coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn`` once for all concurrent callers with the same key
+
+        Args:
+            key: Request identity (e.g. the response cache key)
+            fn: Factory for the upstream coroutine
+
+        Returns:
+            The upstream result, shared by all callers
+        """
+        if not self.enabled:
+            return await fn()
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(self._calls, key, call))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def stream(self, key: str, factory: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Subscribe to the upstream stream for ``key``, starting it if needed
+
+        Args:
+            key: Request identity (e.g. the response cache key)
+            factory: Builds the upstream event stream
+
+        Returns:
+            Async iterator of events; late subscribers replay from the start
+        """
+        if not self.enabled:
+            return factory()
+
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast(factory(), self.read_ahead)
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._forget(self._streams, key, broadcast))
+            self.stream_leaders += 1
+        else:
+            self.stream_coalesced += 1
+        return broadcast.subscribe()
+
+    def is_streaming(self, key: str) -> bool:
+        """True if an upstream stream for ``key`` is already running"""
+        return self.enabled and key in self._streams
+
+    @staticmethod
+    def _forget(registry: Dict[str, Any], key: str, entry: Any):
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._calls),
+            "streams_in_flight": len(self._streams),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "stream_leaders": self.stream_leaders,
+            "stream_coalesced": self.stream_coalesced
+        }
+
+
+# Global coalescer instance
+request_coalescer = RequestCoalescer(enabled=settings.coalesce_requests, read_ahead=settings.stream_read_ahead)
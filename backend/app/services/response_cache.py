@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from app.core.config import settings
+from .shared_state import STATE_ERRORS, SharedState, shared_state
+
+
+class CacheTier:
+    """Base class for response cache storage tiers"""
+
+    name = "tier"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def clear(self):
+        raise NotImplementedError
+
+    async def warm(self):
+        """Open the storage ahead of the first request"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryCacheTier(CacheTier):
+    """In-memory LRU tier with TTL, entry and byte caps"""
+
+    name = "memory"
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires, size, value)
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, _, value = entry
+        if expires < time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class SQLiteCacheTier(CacheTier):
+    """
+    On-disk tier that survives restarts
+
+    SQLite with memory-mapped I/O enabled; calls run in a worker thread so
+    disk access never blocks the event loop. The database is opened on
+    first use (or by ``warm``), not when the tier is built.
+    """
+
+    name = "disk"
+
+    def __init__(self, path: str, ttl: float, max_entries: int, mmap_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._writes = 0
+        self.mmap_size = mmap_size
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._rows = 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS response_cache_accessed ON response_cache (accessed)"
+            )
+            # Kept up to date on every write, so stats never scan the table
+            (self._rows,) = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()
+            self._db = conn
+        return self._db
+
+    def _open(self):
+        with self._lock:
+            self._conn  # opens the database
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._rows -= self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,)).rowcount
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM response_cache WHERE key = ?", (key,)).fetchone()
+            self._rows += exists is None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now)
+            )
+            self._writes += 1
+            # Purge expired rows and trim to size every so often, not on each write
+            if self._writes % 100 == 0:
+                self._trim(now)
+
+    def _trim(self, now: float):
+        self._rows -= self._conn.execute("DELETE FROM response_cache WHERE expires < ?", (now,)).rowcount
+        excess = self._rows - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY accessed LIMIT ?)",
+                (excess,)
+            )
+            self._rows -= excess
+            self.evictions += excess
+
+    def _clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+            self._rows = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        await asyncio.to_thread(self._set, key, value)
+
+    async def clear(self):
+        await asyncio.to_thread(self._clear)
+
+    async def warm(self):
+        await asyncio.to_thread(self._open)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": self._rows,
+            "path": self.path,
+            "evictions": self.evictions
+        }
+
+
+class SharedCacheTier(CacheTier):
+    """
+    Tier in the shared state, visible to every worker process
+
+    Entries expire after the TTL on the state server itself. Clearing only
+    empties this worker's tiers; shared entries age out.
+    """
+
+    name = "shared"
+
+    def __init__(self, state: SharedState, ttl: float):
+        self.state = state
+        self.ttl = ttl
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = await self.state.get(f"cache:{key}")
+        except STATE_ERRORS:
+            # A lost state server costs cache hits, not requests
+            self.errors += 1
+            return None
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        try:
+            await self.state.set(f"cache:{key}", json.dumps(value), ttl=self.ttl)
+        except STATE_ERRORS:
+            self.errors += 1
+
+    async def clear(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.state.name, "errors": self.errors}
+
+
+class ResponseCache:
+    """
+    Multi-tier cache of generated answers
+
+    Keys combine the normalized message, model and generation options.
+    Lookups go through tiers in order; a hit in a slower tier is copied into
+    the faster ones.
+    """
+
+    def __init__(self, tiers: List[CacheTier], enabled: bool = True):
+        self.tiers = tiers
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.tier_hits = {tier.name: 0 for tier in tiers}
+
+    @staticmethod
+    def normalize_message(message: str) -> str:
+        """Collapse whitespace and unicode variants so trivial edits still hit"""
+        return " ".join(unicodedata.normalize("NFKC", message).split())
+
+    @classmethod
+    def make_key(cls, message: str, model: str, options: Optional[Dict[str, Any]] = None,
+                 history: Optional[Sequence[Tuple[str, str]]] = None,
+                 passages: Optional[Sequence[Tuple[str, str]]] = None) -> str:
+        """
+        Build a cache key
+
+        Args:
+            message: User input message
+            model: Resolved model name
+            options: Ollama generation options
+            history: Earlier conversation turns the answer depends on
+            passages: Retrieved passages the answer is grounded in
+
+        Returns:
+            Hex digest identifying the request
+        """
+        parts = [cls.normalize_message(message), model, options or {}, list(history or ())]
+        if passages:
+            parts.append(list(passages))
+        material = json.dumps(
+            parts,
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        for index, tier in enumerate(self.tiers):
+            value = await tier.get(key)
+            if value is not None:
+                self.hits += 1
+                self.tier_hits[tier.name] += 1
+                for faster in self.tiers[:index]:
+                    await faster.set(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        if not self.enabled:
+            return
+        for tier in self.tiers:
+            await tier.set(key, value)
+
+    async def clear(self):
+        for tier in self.tiers:
+            await tier.clear()
+
+    async def warm(self):
+        """Open the tiers' storage (run as a startup warm-up step)"""
+        for tier in self.tiers:
+            await tier.warm()
+
+    def record_bypass(self):
+        self.bypassed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tiers": {
+                tier.name: {"hits": self.tier_hits[tier.name], **tier.stats()}
+                for tier in self.tiers
+            }
+        }
+
+    async def replay(self, value: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Replay a cached answer as stream events
+
+        Yields:
+            Events shaped like OllamaService.stream_response output
+        """
+        yield {
+            "chunk": value["response"],
+            "model": value["model"],
+            "success": True,
+            "done": False,
+            "cached": True
+        }
+        yield {
+            "chunk": "",
+            "response": value["response"],
+            "model": value["model"],
+            "timestamp": datetime.now().isoformat(),
+            "success": True,
+            "done": True,
+            "cached": True
+        }
+
+    async def record_stream(self, key: str, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Pass stream events through and store the answer once it completes"""
+        async for event in events:
+            if event.get("done") and event.get("success"):
+                await self.set(key, {"response": event["response"], "model": event["model"]})
+            yield event
+
+
+def create_response_cache() -> ResponseCache:
+    """Build the response cache from settings"""
+    tiers: List[CacheTier] = [
+        MemoryCacheTier(
+            ttl=settings.cache_ttl,
+            max_entries=settings.cache_max_entries,
+            max_bytes=settings.cache_max_bytes
+        )
+    ]
+    if settings.cache_disk_path:
+        tiers.append(SQLiteCacheTier(
+            path=settings.cache_disk_path,
+            ttl=settings.cache_ttl,
+            max_entries=settings.cache_disk_max_entries
+        ))
+    if settings.shared_state_url:
+        tiers.append(SharedCacheTier(shared_state, ttl=settings.cache_ttl))
+    return ResponseCache(tiers, enabled=settings.cache_enabled)
+
+
+# Global cache instance
+response_cache = create_response_cache()
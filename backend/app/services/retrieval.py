@@ -0,0 +1,820 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter
+from typing import (TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence,
+                    Tuple)
+from app.core.config import settings
+from .ollama_service import ollama_service
+from .semantic_cache import Embedder, OllamaEmbedder
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# numpy is imported where it is used, as in the semantic cache: the index
+# is only built once documents are ingested or a persisted one is loaded
+
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have if in into is it its of on or so "
+    "that the their then there these they this to was were will with".split()
+)
+RRF_K = 60  # reciprocal rank fusion constant
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words, without stopwords"""
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS]
+
+
+def chunk_words(lines: Iterable[str], size: int, overlap: int) -> Iterator[str]:
+    """
+    Split streamed text into chunks of ``size`` words
+
+    Each chunk repeats the last ``overlap`` words of the previous one so a
+    sentence cut at a boundary is still found whole in one of them. Only
+    the current chunk is held in memory.
+
+    Yields:
+        Chunk texts (words joined by single spaces)
+    """
+    words: List[str] = []
+    emitted = False
+    for line in lines:
+        words.extend(line.split())
+        while len(words) >= size:
+            yield " ".join(words[:size])
+            emitted = True
+            words = words[size - overlap:]
+    if words and (not emitted or len(words) > overlap):
+        yield " ".join(words)
+
+
+def read_chunks(path: str, size: int, overlap: int) -> Iterator[str]:
+    """Chunks of a text file, read line by line"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        yield from chunk_words(f, size, overlap)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def kmeans(data: "np.ndarray", k: int, iterations: int = 8, seed: int = 0) -> "np.ndarray":
+    """
+    Spherical k-means: ``k`` unit centroids for unit vectors ``data``
+
+    Empty clusters keep their previous centroid.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(data @ centroids.T, axis=1)
+        order = np.argsort(labels, kind="stable")
+        present, starts = np.unique(labels[order], return_index=True)
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids[present] = sums / np.maximum(norms, 1e-12)
+    return centroids
+
+
+def nearest(vectors: "np.ndarray", centroids: "np.ndarray", batch: int = 65536) -> "np.ndarray":
+    """Index of the most similar centroid for each row of ``vectors``"""
+    import numpy as np
+
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        labels[start:start + batch] = np.argmax(vectors[start:start + batch] @ centroids.T, axis=1)
+    return labels
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an impact-ordered inverted index of chunk terms
+
+    Postings are flat numpy arrays with one slice per term. A merge stores
+    each posting's BM25 contribution (its impact) and sorts every slice by
+    impact, so a query reads at most ``depth`` postings per term: the
+    chunks where that term matters most. Very common terms therefore cost
+    no more than rare ones, at the price of approximate scores for chunks
+    that only match common terms. Chunks added since the last merge sit in
+    a small per-term ``delta`` of Python lists and are scored exactly; a
+    merge folds it into new arrays off the event loop while queries keep
+    using the old arrays plus the delta being merged.
+    """
+
+    def __init__(self, capacity: int, k1: float = 1.2, b: float = 0.75, depth: int = 1000):
+        import numpy as np
+
+        self.k1 = k1
+        self.b = b
+        self.depth = depth
+        self.vocab: Dict[str, int] = {}  # term -> slice number in ``offsets``
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.float32)
+        self.impacts = np.zeros(0, dtype=np.float32)
+        self.lengths = np.zeros(capacity, dtype=np.float32)
+        self.delta: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.merging: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.pending = 0  # postings in the delta
+        self.count = 0
+        self.total_length = 0
+        self._scores = np.zeros(capacity, dtype=np.float32)  # scratch, zero between queries
+
+    def add(self, chunk_id: int, terms: List[str]):
+        counts = Counter(terms)
+        for term, tf in counts.items():
+            ids, tfs = self.delta.setdefault(term, ([], []))
+            ids.append(chunk_id)
+            tfs.append(tf)
+        self.pending += len(counts)
+        self.lengths[chunk_id] = len(terms)
+        self.total_length += len(terms)
+        self.count += 1
+
+    def _impacts(self, tfs: "np.ndarray", lengths: "np.ndarray", df: Any, count: int, avgdl: float) -> "np.ndarray":
+        """BM25 contribution of each posting, for term document frequencies ``df``"""
+        import numpy as np
+
+        idf = np.log1p((count - df + 0.5) / (df + 0.5))
+        return idf * tfs * (self.k1 + 1) / (tfs + self.k1 * (1 - self.b + self.b * lengths / avgdl))
+
+    def search(self, terms: List[str], live: "np.ndarray", limit: int) -> List[int]:
+        """
+        Live chunks with the highest BM25 score for ``terms``
+
+        Returns:
+            Up to ``limit`` chunk IDs, best first
+        """
+        import numpy as np
+
+        if not self.count:
+            return []
+        avgdl = self.total_length / self.count
+        scores = self._scores
+        touched = []
+        for term in set(terms):
+            index = self.vocab.get(term)
+            df = 0
+            if index is not None:
+                start, end = self.offsets[index], self.offsets[index + 1]
+                df = int(end - start)
+                top = slice(start, min(end, start + self.depth))
+                # IDs are unique within a term, so fancy-index addition is safe
+                scores[self.ids[top]] += self.impacts[top]
+                touched.append(self.ids[top])
+            extras = [extra for extra in (self.merging.get(term), self.delta.get(term)) if extra]
+            if extras:
+                ids = np.concatenate([np.asarray(extra[0], dtype=np.int32) for extra in extras])
+                tfs = np.concatenate([np.asarray(extra[1], dtype=np.float32) for extra in extras])
+                scores[ids] += self._impacts(tfs, self.lengths[ids], df + len(ids), self.count, avgdl)
+                touched.append(ids)
+        if not touched:
+            return []
+        # Candidates may repeat (one entry per matching term): read, then reset the scratch
+        candidates = np.concatenate(touched)
+        values = np.where(live[candidates], scores[candidates], 0.0)
+        scores[candidates] = 0.0
+        keep = min(len(candidates), limit * len(touched))
+        top = np.argpartition(-values, keep - 1)[:keep]
+        top = top[np.argsort(-values[top])]
+        ranked = dict.fromkeys(int(candidates[i]) for i in top if values[i] > 0)
+        return list(ranked)[:limit]
+
+    def start_merge(self) -> Dict[str, Tuple[List[int], List[int]]]:
+        """Hand the delta to a merge; new chunks go to a fresh delta meanwhile"""
+        self.merging, self.delta = self.delta, {}
+        self.pending = 0
+        return self.merging
+
+    def merged(self, pending: Dict[str, Tuple[List[int], List[int]]]) -> Tuple[Dict[str, int], "np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """
+        New postings arrays with ``pending`` folded in (safe to run in a thread)
+
+        Impacts are recomputed for every posting with the current document
+        frequencies and average chunk length.
+
+        Returns:
+            (vocab, offsets, ids, tfs, impacts)
+        """
+        import numpy as np
+
+        count, avgdl = self.count, self.total_length / max(self.count, 1)
+        vocab = dict(self.vocab)
+        for term in pending:
+            vocab.setdefault(term, len(vocab))
+        sizes = np.zeros(len(vocab), dtype=np.int64)
+        sizes[:len(self.vocab)] = np.diff(self.offsets)
+        added = np.zeros(len(vocab), dtype=np.int64)
+        for term, (ids, _) in pending.items():
+            added[vocab[term]] = len(ids)
+        totals = sizes + added
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(totals, out=offsets[1:])
+
+        ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        # Existing postings move by how much earlier terms grew
+        shift = np.repeat(offsets[:len(self.vocab)] - self.offsets[:-1], sizes[:len(self.vocab)])
+        destination = np.arange(len(self.ids)) + shift
+        ids[destination] = self.ids
+        tfs[destination] = self.tfs
+        for term, (term_ids, term_tfs) in pending.items():
+            index = vocab[term]
+            start = offsets[index] + sizes[index]
+            ids[start:start + len(term_ids)] = term_ids
+            tfs[start:start + len(term_ids)] = term_tfs
+
+        term_of = np.repeat(np.arange(len(vocab)), totals)
+        impacts = self._impacts(tfs, self.lengths[ids], totals[term_of], count, avgdl).astype(np.float32)
+        order = np.lexsort((-impacts, term_of))
+        return vocab, offsets, ids[order], tfs[order], impacts[order]
+
+    def finish_merge(self, result: Tuple[Dict[str, int], "np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]):
+        self.vocab, self.offsets, self.ids, self.tfs, self.impacts = result
+        self.merging = {}
+
+    def merge(self):
+        """Fold the delta into the arrays now (on the calling thread)"""
+        self.finish_merge(self.merged(self.start_merge()))
+
+    def nbytes(self) -> int:
+        return (self.ids.nbytes + self.tfs.nbytes + self.impacts.nbytes + self.offsets.nbytes
+                + self.lengths.nbytes)
+
+
+class VectorStore:
+    """
+    Unit vectors in a fixed-capacity matrix with an inverted-file index
+
+    Below ``ivf_min_rows`` rows a query scans every vector. Past that the
+    rows are clustered with k-means (about ``4 * sqrt(rows)`` clusters) and
+    a query only scans the ``nprobe`` clusters nearest to it, which keeps
+    a search at 1M rows to a few thousand dot products. Clustering runs
+    off the event loop whenever the row count has doubled; rows added in
+    between join the nearest existing cluster. With a ``path`` the matrix
+    is a memory-mapped ``.npy`` file.
+    """
+
+    def __init__(self, capacity: int, path: Optional[str] = None, nprobe: int = 8,
+                 ivf_min_rows: int = 20000):
+        import numpy as np
+
+        self.capacity = capacity
+        self.path = path
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.vectors: Optional["np.ndarray"] = None  # created on first insert, when the dimension is known
+        self.count = 0
+        self.assign = np.full(capacity, -1, dtype=np.int32)  # cluster of each row
+        self.centroids: Optional["np.ndarray"] = None
+        self.lists: List["np.ndarray"] = []  # rows per cluster as of the last clustering
+        self.pending: Dict[int, List[int]] = {}  # rows added to each cluster since then
+        self.trained_rows = 0
+
+    def allocate(self, dim: int, existing: bool = False):
+        import numpy as np
+
+        if self.path:
+            if existing:
+                self.vectors = np.lib.format.open_memmap(self.path, mode="r+")
+            else:
+                self.vectors = np.lib.format.open_memmap(
+                    self.path, mode="w+", dtype=np.float32, shape=(self.capacity, dim)
+                )
+        else:
+            self.vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    def add(self, vectors: "np.ndarray"):
+        """Append unit ``vectors`` as the next rows"""
+        if self.vectors is None:
+            self.allocate(vectors.shape[1])
+        start = self.count
+        self.vectors[start:start + len(vectors)] = vectors
+        self.count += len(vectors)
+        if self.centroids is not None:
+            self._assign(start, self.count)
+
+    def _assign(self, start: int, end: int):
+        labels = nearest(self.vectors[start:end], self.centroids)
+        self.assign[start:end] = labels
+        for row, label in enumerate(labels.tolist(), start):
+            self.pending.setdefault(label, []).append(row)
+
+    def search(self, vector: "np.ndarray", live: "np.ndarray", limit: int) -> List[int]:
+        """
+        Live rows most similar to a unit ``vector``
+
+        Returns:
+            Up to ``limit`` row numbers, best first
+        """
+        import numpy as np
+
+        if not self.count or vector.shape[0] != self.dim:
+            return []
+        if self.centroids is None:
+            rows = np.arange(self.count)
+            scores = self.vectors[:self.count] @ vector
+        else:
+            nprobe = min(self.nprobe, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ vector), nprobe - 1)[:nprobe]
+            parts = [self.lists[p] for p in probe]
+            parts.extend(np.asarray(self.pending[p], dtype=np.int64) for p in probe if p in self.pending)
+            rows = np.concatenate(parts)
+            if not len(rows):
+                return []
+            scores = self.vectors[rows] @ vector
+        scores[~live[rows]] = -np.inf
+        keep = min(limit, len(rows))
+        top = np.argpartition(-scores, keep - 1)[:keep]
+        top = top[np.argsort(-scores[top])]
+        return [int(rows[i]) for i in top if scores[i] > -np.inf]
+
+    @property
+    def needs_clustering(self) -> bool:
+        return self.count >= self.ivf_min_rows and self.count >= 2 * self.trained_rows
+
+    def cluster(self, rows: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Cluster the first ``rows`` vectors (safe to run in a thread)
+
+        Returns:
+            (centroids, cluster of each row)
+        """
+        import numpy as np
+
+        data = self.vectors[:rows]
+        clusters = max(1, min(int(4 * math.sqrt(rows)), rows // 8))
+        sample = np.random.default_rng(rows).choice(rows, min(rows, 32 * clusters), replace=False)
+        centroids = kmeans(np.asarray(data[np.sort(sample)]), clusters)
+        return centroids, nearest(data, centroids)
+
+    def install(self, rows: int, centroids: "np.ndarray", labels: "np.ndarray"):
+        """Switch searches to a new clustering of the first ``rows`` rows"""
+        import numpy as np
+
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(centroids))]
+        self.centroids = centroids
+        self.assign[:rows] = labels
+        self.pending = {}
+        self.trained_rows = rows
+        if self.count > rows:
+            # Rows added while clustering ran
+            self._assign(rows, self.count)
+
+    def nbytes(self) -> int:
+        return 0 if self.vectors is None else self.vectors.nbytes
+
+
+class DocumentIndex:
+    """
+    Chunks of ingested documents with a hybrid lexical and vector index
+
+    Chunk IDs are rows of the vector matrix and documents of the BM25
+    index. Re-ingesting a document whose content changed adds the new
+    chunks first and then retires the old ones, so queries never see it
+    missing. Retired chunks stay in the matrix (counted against the
+    capacity) until the index is rebuilt from scratch. With a ``path`` the
+    vectors are memory mapped and everything else is saved next to them on
+    ``flush()``.
+    """
+
+    def __init__(self, capacity: int, path: Optional[str] = None, nprobe: int = 8,
+                 ivf_min_chunks: int = 20000):
+        import numpy as np
+
+        self.capacity = capacity
+        self.path = path
+        self.texts: List[Optional[str]] = []
+        self.sources: List[str] = []
+        self.docs: Dict[str, Dict[str, Any]] = {}  # source -> {"digest", "ids"}
+        self.live = np.zeros(capacity, dtype=bool)
+        self.bm25 = BM25Index(capacity)
+        self.vectors = VectorStore(capacity, f"{path}.npy" if path else None, nprobe, ivf_min_chunks)
+        if path:
+            self._load()
+
+    @property
+    def count(self) -> int:
+        return len(self.texts)
+
+    def add(self, source: str, texts: List[str], vectors: "np.ndarray") -> List[int]:
+        """
+        Add chunks of ``source`` with their unit embedding ``vectors``
+
+        Returns:
+            IDs of the new chunks
+
+        Raises:
+            ValueError: The index is full or the embedding size changed
+        """
+        if self.count + len(texts) > self.capacity:
+            raise ValueError(f"Document index is full ({self.capacity} chunks)")
+        if self.vectors.dim is not None and vectors.shape[1] != self.vectors.dim:
+            raise ValueError(f"Embedding size {vectors.shape[1]} does not match the index ({self.vectors.dim})")
+        start = self.count
+        self.vectors.add(vectors)
+        for chunk_id, text in enumerate(texts, start):
+            self.texts.append(text)
+            self.sources.append(source)
+            self.bm25.add(chunk_id, tokenize(text))
+        self.live[start:start + len(texts)] = True
+        return list(range(start, start + len(texts)))
+
+    def retire(self, ids: Sequence[int]):
+        """Hide chunks from searches and drop their text"""
+        for chunk_id in ids:
+            self.live[chunk_id] = False
+            self.texts[chunk_id] = None
+
+    def search(self, query: str, vector: Optional["np.ndarray"], k: int, candidates: int = 50) -> List[Tuple[int, float]]:
+        """
+        Top-``k`` chunks by reciprocal rank fusion of BM25 and vector rankings
+
+        Args:
+            query: Query text
+            vector: Unit query embedding (None searches by keywords only)
+            k: Chunks to return
+            candidates: Depth of each ranking that is fused
+
+        Returns:
+            (chunk ID, fused score) pairs, best first
+        """
+        rankings = [self.bm25.search(tokenize(query), self.live, candidates)]
+        if vector is not None:
+            rankings.append(self.vectors.search(vector, self.live, candidates))
+        fused: Dict[int, float] = {}
+        for ranking in rankings:
+            for rank, chunk_id in enumerate(ranking):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.items(), key=lambda item: -item[1])[:k]
+
+    def _files(self) -> Tuple[str, str]:
+        return f"{self.path}.npz", f"{self.path}.json"
+
+    def _load(self):
+        import numpy as np
+
+        arrays_path, meta_path = self._files()
+        if not all(os.path.exists(p) for p in (arrays_path, meta_path, self.vectors.path)):
+            return
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            arrays = np.load(arrays_path)
+            self.vectors.allocate(0, existing=True)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable document index at %s: %s", self.path, e)
+            return
+        if self.vectors.vectors.shape[0] != self.capacity:
+            logger.warning("Document index at %s has a different capacity; starting empty", self.path)
+            self.vectors.vectors = None
+            return
+        count = meta["count"]
+        self.texts, self.sources, self.docs = meta["texts"], meta["sources"], meta["docs"]
+        self.live[:count] = arrays["live"]
+        self.bm25.vocab = {term: i for i, term in enumerate(meta["vocab"])}
+        self.bm25.offsets, self.bm25.ids = arrays["offsets"], arrays["ids"]
+        self.bm25.tfs, self.bm25.impacts = arrays["tfs"], arrays["impacts"]
+        self.bm25.lengths[:count] = arrays["lengths"]
+        self.bm25.count, self.bm25.total_length = count, int(arrays["lengths"].sum())
+        self.vectors.count = count
+        if "centroids" in arrays:
+            rows = meta["clustered_rows"]
+            self.vectors.install(rows, arrays["centroids"], arrays["assign"][:rows])
+
+    def flush(self):
+        """Write the index to disk (pending postings are merged first)"""
+        import numpy as np
+
+        if not self.path or self.vectors.vectors is None:
+            return
+        self.bm25.merge()
+        self.vectors.vectors.flush()
+        count = self.count
+        arrays = {
+            "live": self.live[:count],
+            "lengths": self.bm25.lengths[:count],
+            "offsets": self.bm25.offsets,
+            "ids": self.bm25.ids,
+            "tfs": self.bm25.tfs,
+            "impacts": self.bm25.impacts
+        }
+        if self.vectors.centroids is not None:
+            arrays["centroids"] = self.vectors.centroids
+            arrays["assign"] = self.vectors.assign[:count]
+        meta = {
+            "count": count,
+            "texts": self.texts,
+            "sources": self.sources,
+            "docs": self.docs,
+            "vocab": list(self.bm25.vocab),
+            "clustered_rows": self.vectors.trained_rows
+        }
+        arrays_path, meta_path = self._files()
+        with open(arrays_path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(arrays_path + ".tmp", arrays_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": len(self.docs),
+            "chunks": int(self.live[:self.count].sum()),
+            "retired_chunks": self.count - int(self.live[:self.count].sum()),
+            "capacity": self.capacity,
+            "terms": len(self.bm25.vocab) + len(self.bm25.delta),
+            "pending_postings": self.bm25.pending,
+            "clusters": 0 if self.vectors.centroids is None else len(self.vectors.centroids),
+            "bytes": self.bm25.nbytes() + self.vectors.nbytes()
+        }
+
+
+class Retriever:
+    """
+    Ingests local documents and finds passages relevant to a prompt
+
+    Ingestion streams each file in, cuts it into overlapping chunks and
+    embeds them in batches, with at most ``concurrency`` embedding calls in
+    flight. Unchanged documents (same content digest) are skipped. After an
+    ingest the index is brought up to date in the background: postings are
+    merged once the delta grows past ``merge_threshold`` and the vectors
+    are re-clustered when their count has doubled. Searches keep running
+    on the previous structures until the new ones are swapped in.
+    """
+
+    def __init__(self, embed: Embedder, index: Optional[DocumentIndex] = None, top_k: int = 4,
+                 batch_size: int = 32, concurrency: int = 4, chunk_size: int = 200, chunk_overlap: int = 40,
+                 merge_threshold: int = 100000, make_index: Optional[Callable[[], DocumentIndex]] = None,
+                 load_on_start: bool = False):
+        self.embed = embed
+        self._index = index
+        self._make_index = make_index
+        self.load_on_start = load_on_start
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.merge_threshold = merge_threshold
+        self._maintenance: Optional[asyncio.Task] = None
+        self.searches = 0
+        self.search_seconds = 0.0
+        self.embed_errors = 0
+        self.merges = 0
+        self.clusterings = 0
+
+    @property
+    def index(self) -> DocumentIndex:
+        """The document index, built on first use when given as ``make_index``"""
+        if self._index is None:
+            self._index = self._make_index()
+        return self._index
+
+    async def warm(self):
+        """Read a persisted index off the event loop (otherwise it is built on first use)"""
+        if self.load_on_start and self._index is None:
+            self._index = await asyncio.to_thread(self._make_index)
+
+    async def _vectors(self, texts: List[str]) -> "np.ndarray":
+        import numpy as np
+
+        vectors = np.asarray(await self.embed(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def _ingest(self, source: str, digest: str, chunks: Iterator[str], slots: asyncio.Semaphore) -> Dict[str, Any]:
+        """
+        Embed and index the chunks of one document
+
+        Chunks are pulled from ``chunks`` in a worker thread (it may read a
+        file) one batch at a time; each batch takes an embedding slot.
+        """
+        old = self.index.docs.get(source)
+        if old is not None and old["digest"] == digest:
+            return {"source": source, "success": True, "chunks": 0, "skipped": True}
+
+        def next_batch() -> List[str]:
+            return [chunk for _, chunk in zip(range(self.batch_size), chunks)]
+
+        ids: List[int] = []
+
+        async def embed_batch(texts: List[str]):
+            try:
+                vectors = await self._vectors(texts)
+            finally:
+                slots.release()
+            ids.extend(self.index.add(source, texts, vectors))
+
+        tasks = []
+        try:
+            while True:
+                batch = await asyncio.to_thread(next_batch)
+                if not batch:
+                    break
+                await slots.acquire()
+                tasks.append(asyncio.create_task(embed_batch(batch)))
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            error = next((r for r in results if isinstance(r, BaseException)), None)
+        except (OSError, UnicodeError) as e:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            error = e
+        if error is not None:
+            self.embed_errors += 1
+            # Keep serving the previous version
+            self.index.retire(ids)
+            return {"source": source, "success": False, "error": str(error) or type(error).__name__}
+
+        if old is not None:
+            self.index.retire(old["ids"])
+        self.index.docs[source] = {"digest": digest, "ids": sorted(ids)}
+        return {"source": source, "success": True, "chunks": len(ids), "skipped": False}
+
+    async def _run(self, jobs: List[Callable[[asyncio.Semaphore], Any]]) -> Dict[str, Any]:
+        slots = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(job(slots) for job in jobs))
+        self.schedule_maintenance()
+        return {
+            "success": all(result["success"] for result in results),
+            "documents": results,
+            "chunks": sum(result.get("chunks", 0) for result in results),
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    async def ingest_texts(self, documents: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Index documents given as text
+
+        Args:
+            documents: Source name -> document text
+
+        Returns:
+            Per-document results and the number of chunks added
+        """
+        def job(source: str, text: str):
+            digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            chunks = chunk_words(text.splitlines(), self.chunk_size, self.chunk_overlap)
+            return lambda slots: self._ingest(source, digest, chunks, slots)
+
+        return await self._run([job(source, text) for source, text in documents.items()])
+
+    async def ingest_files(self, paths: List[str]) -> Dict[str, Any]:
+        """
+        Index text files, read in a streaming fashion
+
+        Args:
+            paths: File paths; each file is indexed under its path
+
+        Returns:
+            Per-document results and the number of chunks added
+        """
+        def job(path: str):
+            async def run(slots: asyncio.Semaphore):
+                try:
+                    digest = await asyncio.to_thread(file_digest, path)
+                except OSError as e:
+                    return {"source": path, "success": False, "error": str(e)}
+                return await self._ingest(path, digest, read_chunks(path, self.chunk_size, self.chunk_overlap), slots)
+            return run
+
+        return await self._run([job(path) for path in paths])
+
+    def remove(self, source: str) -> bool:
+        """Drop a document from the index"""
+        doc = self.index.docs.pop(source, None)
+        if doc is None:
+            return False
+        self.index.retire(doc["ids"])
+        return True
+
+    async def search(self, query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Passages most relevant to ``query``
+
+        The query is embedded for the vector ranking; if that fails the
+        search falls back to keywords only.
+
+        Returns:
+            Dicts with ``text``, ``source`` and ``score``, best first
+        """
+        index = self.index
+        if not index.docs:
+            return []
+        vector = None
+        try:
+            vector = (await self._vectors([query]))[0]
+        except Exception as e:
+            self.embed_errors += 1
+            logger.warning("Retrieval query embedding failed, using keywords only: %s", e)
+        start = time.perf_counter()
+        matches = index.search(query, vector, k or self.top_k)
+        self.search_seconds += time.perf_counter() - start
+        self.searches += 1
+        return [
+            {"text": index.texts[chunk_id], "source": index.sources[chunk_id], "score": round(score, 6)}
+            for chunk_id, score in matches
+        ]
+
+    async def passages(self, query: str, k: Optional[int] = None) -> List[Tuple[str, str]]:
+        """(source, text) of the passages to add to a prompt"""
+        return [(match["source"], match["text"]) for match in await self.search(query, k)]
+
+    def schedule_maintenance(self):
+        """Start a background merge/re-clustering if one is due and none is running"""
+        index = self._index
+        if index is None or (self._maintenance is not None and not self._maintenance.done()):
+            return
+        if index.bm25.pending >= self.merge_threshold or index.vectors.needs_clustering:
+            self._maintenance = asyncio.create_task(self.rebuild())
+
+    async def rebuild(self, force: bool = False):
+        """
+        Merge pending postings and re-cluster the vectors if due (or ``force``)
+
+        The heavy work runs in a worker thread on a snapshot; the results
+        are swapped in on the event loop, so searches never stop.
+        """
+        index = self.index
+        bm25, vectors = index.bm25, index.vectors
+        if bm25.delta:
+            result = await asyncio.to_thread(bm25.merged, bm25.start_merge())
+            bm25.finish_merge(result)
+            self.merges += 1
+        if vectors.needs_clustering or (force and vectors.count >= vectors.ivf_min_rows):
+            rows = vectors.count
+            centroids, labels = await asyncio.to_thread(vectors.cluster, rows)
+            vectors.install(rows, centroids, labels)
+            self.clusterings += 1
+
+    async def shutdown(self):
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            await asyncio.gather(self._maintenance, return_exceptions=True)
+            self._maintenance = None
+        # A cancelled merge leaves its postings in ``merging``: put them back
+        index = self._index
+        if index is not None and index.bm25.merging:
+            for term, (ids, tfs) in index.bm25.merging.items():
+                pending = index.bm25.delta.setdefault(term, ([], []))
+                pending[0][:0], pending[1][:0] = ids, tfs
+                index.bm25.pending += len(ids)
+            index.bm25.merging = {}
+
+    def flush(self):
+        if self._index is not None:
+            self._index.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        index = self._index
+        return {
+            **(index.stats() if index else {"documents": 0, "chunks": 0}),
+            "searches": self.searches,
+            "search_ms_avg": 1000 * self.search_seconds / self.searches if self.searches else 0.0,
+            "embed_errors": self.embed_errors,
+            "merges": self.merges,
+            "clusterings": self.clusterings
+        }
+
+
+def create_retriever() -> Retriever:
+    """Build the document retriever from settings"""
+    return Retriever(
+        embed=OllamaEmbedder(ollama_service, settings.retrieval_embed_model),
+        make_index=lambda: DocumentIndex(
+            settings.retrieval_max_chunks, settings.retrieval_index_path,
+            settings.retrieval_nprobe, settings.retrieval_ivf_min_chunks
+        ),
+        top_k=settings.retrieval_top_k,
+        batch_size=settings.retrieval_embed_batch,
+        concurrency=settings.retrieval_embed_concurrency,
+        chunk_size=settings.retrieval_chunk_words,
+        chunk_overlap=settings.retrieval_chunk_overlap,
+        load_on_start=settings.retrieval_index_path is not None
+    )
+
+
+# Global retriever instance
+retriever = create_retriever()
@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from app.core.config import settings
+from .metrics import Metrics, metrics
+from .shared_state import STATE_ERRORS, SharedState, shared_state
+from .tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Lanes in priority order: short interactive prompts, regular chats, bulk work
+LANES = ("interactive", "standard", "batch")
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request cannot be admitted within the queue-wait limit"""
+
+    def __init__(self, model: str, retry_after: float, reason: str):
+        super().__init__(f"{reason} for model {model}")
+        self.model = model
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("future", "client", "lane", "enqueued")
+
+    def __init__(self, client: str, lane: str):
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.client = client
+        self.lane = lane
+        self.enqueued = time.monotonic()
+
+
+class _ModelQueue:
+    """Concurrency slots and waiting requests for one model"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.queued = 0
+        # lane -> client -> waiters; clients are served round-robin per lane
+        self.lanes: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {lane: OrderedDict() for lane in LANES}
+        self.service_time = 1.0  # EWMA of seconds a slot is held
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=256)
+        self.published = (0, 0)  # (admitted, rejected) already added to the shared counters
+
+    def push(self, waiter: _Waiter):
+        self.lanes[waiter.lane].setdefault(waiter.client, deque()).append(waiter)
+        self.queued += 1
+
+    def remove(self, waiter: _Waiter):
+        clients = self.lanes[waiter.lane]
+        waiters = clients.get(waiter.client)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del clients[waiter.client]
+
+    def pop(self, aging: float) -> Optional[_Waiter]:
+        """Take the next waiter: highest lane first, unless a lower lane has aged out"""
+        now = time.monotonic()
+        heads = []
+        for lane in LANES:
+            clients = self.lanes[lane]
+            if clients:
+                heads.append((lane, next(iter(clients.values()))[0]))
+        if not heads:
+            return None
+        lane = heads[0][0]
+        for candidate, head in heads[1:]:
+            if now - head.enqueued > aging:
+                lane = candidate
+                break
+
+        clients = self.lanes[lane]
+        client, waiters = next(iter(clients.items()))
+        waiter = waiters.popleft()
+        del clients[client]
+        if waiters:
+            # Round-robin: this client goes to the back of its lane
+            clients[client] = waiters
+        self.queued -= 1
+        return waiter
+
+
+class Scheduler:
+    """
+    Admission control between the API and Ollama
+
+    Each model gets a fixed number of concurrent generation slots. Requests
+    that find no free slot wait in a bounded queue with priority lanes and
+    round-robin fairness across clients. Requests whose expected queue time
+    exceeds ``max_queue_wait`` are rejected up front with a retry hint
+    instead of piling up and timing out.
+
+    With several worker processes each gets ``1/workers`` of a model's
+    slots, so together they never overload Ollama. Admission counts are
+    added to counters in the shared state every ``publish_interval``
+    seconds for cluster-wide statistics. With a ``registry``, admissions,
+    rejections, queue waits and queue depths are exported as metrics.
+    """
+
+    def __init__(
+        self,
+        default_concurrency: int,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        max_queue: int = 100,
+        max_queue_wait: float = 30.0,
+        aging: float = 10.0,
+        enabled: bool = True,
+        workers: int = 1,
+        state: Optional[SharedState] = None,
+        publish_interval: float = 5.0,
+        registry: Optional[Metrics] = None
+    ):
+        self.default_concurrency = default_concurrency
+        self.model_concurrency = model_concurrency or {}
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.aging = aging
+        self.enabled = enabled
+        self.workers = max(workers, 1)
+        self.state = state
+        self.publish_interval = publish_interval
+        self.registry = registry
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._task: Optional[asyncio.Task] = None
+        if registry is not None:
+            registry.add_collector(self._collect)
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            limit = self.model_concurrency.get(model, self.default_concurrency)
+            # This worker's share of the model's slots
+            queue = self._queues[model] = _ModelQueue(max(limit // self.workers, 1))
+        return queue
+
+    @staticmethod
+    def classify(prompt_tokens: int, requested: Optional[str] = None) -> str:
+        """Pick a lane from an explicit priority or the prompt size"""
+        if requested in LANES:
+            return requested
+        return "interactive" if prompt_tokens <= settings.scheduler_short_prompt_tokens else "standard"
+
+    def limit(self, model: str) -> Optional[int]:
+        """Concurrent generation slots for ``model`` (None when disabled)"""
+        return self._queue(model).limit if self.enabled else None
+
+    def estimated_wait(self, model: str) -> float:
+        queue = self._queue(model)
+        if queue.active < queue.limit and queue.queued == 0:
+            return 0.0
+        return (queue.queued + 1) / queue.limit * queue.service_time
+
+    def check(self, model: str):
+        """
+        Reject early if a new request for ``model`` could not start in time
+
+        Raises:
+            SchedulerRejected: The queue is full or the wait is too long
+        """
+        if not self.enabled:
+            return
+        queue = self._queue(model)
+        if queue.active < queue.limit and queue.queued == 0:
+            return
+        wait = self.estimated_wait(model)
+        if queue.queued >= self.max_queue:
+            self._reject(queue, model, "queue_full")
+            raise SchedulerRejected(model, max(wait, 1.0), "Queue is full")
+        if wait > self.max_queue_wait:
+            self._reject(queue, model, "wait_too_long")
+            raise SchedulerRejected(model, wait, "Expected queue wait too long")
+
+    async def acquire(self, model: str, client: str = "anonymous", lane: str = "standard"):
+        """Wait for a generation slot for ``model``"""
+        if not self.enabled:
+            return
+        queue = self._queue(model)
+        if queue.active < queue.limit and queue.queued == 0:
+            queue.active += 1
+            self._record_wait(queue, model, lane, 0.0)
+            return
+
+        self.check(model)
+        waiter = _Waiter(client, lane)
+        queue.push(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted as we were cancelled: hand it on
+                self._release(queue)
+            else:
+                queue.remove(waiter)
+            raise
+        self._record_wait(queue, model, lane, time.monotonic() - waiter.enqueued)
+
+    def release(self, model: str, held: Optional[float] = None):
+        """Free a slot, updating the service-time estimate"""
+        if not self.enabled:
+            return
+        queue = self._queue(model)
+        if held is not None:
+            queue.service_time = 0.8 * queue.service_time + 0.2 * held
+        self._release(queue)
+
+    def _release(self, queue: _ModelQueue):
+        queue.active -= 1
+        while queue.active < queue.limit:
+            waiter = queue.pop(self.aging)
+            if waiter is None:
+                return
+            if not waiter.future.done():
+                queue.active += 1
+                waiter.future.set_result(None)
+
+    def _record_wait(self, queue: _ModelQueue, model: str, lane: str, wait: float):
+        queue.admitted += 1
+        queue.wait_total += wait
+        queue.wait_max = max(queue.wait_max, wait)
+        queue.recent_waits.append(wait)
+        if self.registry is not None:
+            self.registry.observe_admitted(model, lane, wait)
+
+    def _reject(self, queue: _ModelQueue, model: str, reason: str):
+        queue.rejected += 1
+        if self.registry is not None:
+            self.registry.observe_rejected(model, reason)
+
+    def _collect(self):
+        """Set the queue gauges from the live queues (called on each metrics scrape)"""
+        for model, queue in self._queues.items():
+            self.registry.scheduler_active.labels(model).set(queue.active)
+            for lane in LANES:
+                queued = sum(len(waiters) for waiters in queue.lanes[lane].values())
+                self.registry.scheduler_queued.labels(model, lane).set(queued)
+
+    @asynccontextmanager
+    async def slot(self, model: str, client: str = "anonymous", lane: str = "standard"):
+        """Hold a generation slot for the duration of the block"""
+        with tracer.span("scheduler.queue_wait", model=model, lane=lane):
+            await self.acquire(model, client, lane)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(model, time.monotonic() - start)
+
+    async def stream(self, model: str, client: str, lane: str,
+                     events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Hold a slot while ``events`` is being consumed"""
+        try:
+            async with self.slot(model, client, lane):
+                async for event in events:
+                    yield event
+        except SchedulerRejected as e:
+            yield {
+                "chunk": "",
+                "model": model,
+                "success": False,
+                "error": str(e),
+                "done": True
+            }
+
+    async def publish(self):
+        """Add admission counts since the last publish to the shared counters"""
+        if self.state is None:
+            return
+        for model, queue in list(self._queues.items()):
+            admitted, rejected = queue.published
+            current = (queue.admitted, queue.rejected)
+            for name, delta in (("admitted", current[0] - admitted), ("rejected", current[1] - rejected)):
+                if delta:
+                    await self.state.incr(f"scheduler:{model}:{name}", delta)
+            queue.published = current
+
+    async def cluster_stats(self) -> Dict[str, Dict[str, int]]:
+        """Admission counts of all workers, as last published"""
+        if self.state is None:
+            return {}
+        await self.publish()
+        totals = {}
+        for model in self._queues:
+            admitted = await self.state.get(f"scheduler:{model}:admitted")
+            rejected = await self.state.get(f"scheduler:{model}:rejected")
+            totals[model] = {"admitted": int(admitted or 0), "rejected": int(rejected or 0)}
+        return totals
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await self.publish()
+            except STATE_ERRORS as e:
+                logger.warning("Publishing scheduler counters failed: %s", e)
+
+    async def startup(self):
+        if self.state is not None and self.publish_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.publish()
+        except STATE_ERRORS as e:
+            logger.warning("Publishing scheduler counters failed: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        models: Dict[str, Any] = {}
+        for model, queue in self._queues.items():
+            waits: List[float] = sorted(queue.recent_waits)
+            models[model] = {
+                "limit": queue.limit,
+                "active": queue.active,
+                "queue_depth": queue.queued,
+                "queue_depth_by_lane": {
+                    lane: sum(len(w) for w in queue.lanes[lane].values()) for lane in LANES
+                },
+                "admitted": queue.admitted,
+                "rejected": queue.rejected,
+                "wait_seconds_avg": queue.wait_total / queue.admitted if queue.admitted else 0.0,
+                "wait_seconds_p95": waits[math.ceil(len(waits) * 0.95) - 1] if waits else 0.0,
+                "wait_seconds_max": queue.wait_max,
+                "service_seconds_ewma": queue.service_time
+            }
+        return {"enabled": self.enabled, "workers": self.workers, "models": models}
+
+
+# Global scheduler instance
+scheduler = Scheduler(
+    default_concurrency=settings.scheduler_default_concurrency,
+    model_concurrency=settings.scheduler_model_concurrency,
+    max_queue=settings.scheduler_max_queue,
+    max_queue_wait=settings.scheduler_max_queue_wait,
+    aging=settings.scheduler_aging,
+    enabled=settings.scheduler_enabled,
+    workers=settings.workers,
+    # Counters are only worth publishing when other workers can see them
+    state=shared_state if settings.shared_state_url else None,
+    publish_interval=settings.scheduler_publish_interval,
+    registry=metrics
+)
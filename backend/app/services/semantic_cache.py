@@ -0,0 +1,354 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from .ollama_service import OllamaService, ollama_service
+from .response_cache import ResponseCache
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# numpy is imported where it is used: it costs tens of milliseconds at
+# startup and is only needed once the semantic cache is enabled
+
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+class OllamaEmbedder:
+    """Embed texts with Ollama's /api/embed on the balanced backend pool"""
+
+    def __init__(self, service: OllamaService, model: str):
+        self.service = service
+        self.model = model
+
+    async def __call__(self, texts: List[str]) -> List[List[float]]:
+        return await self.service.embed(texts, self.model)
+
+
+class VectorIndex:
+    """
+    Fixed-capacity matrix of unit vectors with brute-force cosine search
+
+    Rows are filled in order; once full, the least recently used row is
+    overwritten. Each row belongs to a partition (model and options) and
+    searches only consider rows of the query's partition. With a ``path``
+    the vectors live in a memory-mapped ``.npy`` file and the row metadata
+    in a ``.json`` file next to it, so the index survives restarts without
+    being read into memory up front.
+    """
+
+    def __init__(self, capacity: int, path: Optional[str] = None):
+        import numpy as np
+
+        self.capacity = capacity
+        self.path = path
+        self.vectors: Optional["np.ndarray"] = None  # created on first insert, when the dimension is known
+        self.partitions = np.zeros(capacity, dtype=np.int64)
+        self.used = np.zeros(capacity, dtype=np.float64)  # last hit or insert (epoch seconds)
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self.filled = 0
+        self.evictions = 0
+        self._write_lock = threading.Lock()  # flushes may run in worker threads
+        if path:
+            self._load()
+
+    def _files(self) -> Tuple[str, str]:
+        return f"{self.path}.npy", f"{self.path}.json"
+
+    def _load(self):
+        import numpy as np
+
+        vectors_path, meta_path = self._files()
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            return
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.lib.format.open_memmap(vectors_path, mode="r+")
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable semantic cache at %s: %s", self.path, e)
+            return
+        if vectors.shape[0] != self.capacity:
+            logger.warning("Semantic cache at %s has a different capacity; starting empty", self.path)
+            return
+        self.vectors = vectors
+        self.filled = meta["filled"]
+        self.partitions[:self.filled] = meta["partitions"]
+        self.used[:self.filled] = meta["used"]
+        self.entries[:self.filled] = meta["entries"]
+
+    def _allocate(self, dim: int):
+        import numpy as np
+
+        if self.path:
+            self.vectors = np.lib.format.open_memmap(
+                self._files()[0], mode="w+", dtype=np.float32, shape=(self.capacity, dim)
+            )
+        else:
+            self.vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.vectors is None else self.vectors.shape[1]
+
+    def search(self, vector: "np.ndarray", partition: int, k: int = 1) -> List[Tuple[float, int]]:
+        """
+        Top-``k`` rows of ``partition`` by cosine similarity to a unit ``vector``
+
+        Returns:
+            (similarity, row) pairs, most similar first
+        """
+        import numpy as np
+
+        if self.filled == 0 or vector.shape[0] != self.dim:
+            return []
+        scores = self.vectors[:self.filled] @ vector
+        scores[self.partitions[:self.filled] != partition] = -np.inf
+        k = min(k, self.filled)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[row]), int(row)) for row in top if scores[row] > -np.inf]
+
+    def add(self, vector: "np.ndarray", partition: int, entry: Dict[str, Any]) -> int:
+        """
+        Store a unit ``vector``, evicting the least recently used row when full
+
+        A vector of another dimension than the stored ones (a different
+        embedding model) empties the index, which is then rebuilt at the
+        new dimension.
+        """
+        import numpy as np
+
+        if self.vectors is not None and vector.shape[0] != self.dim:
+            # The embedding model changed: the stored vectors cannot be compared any more
+            logger.warning(
+                "Semantic cache embeddings changed from %d to %d dimensions; rebuilding the index",
+                self.dim, vector.shape[0]
+            )
+            self.clear()
+            self.vectors = None
+        if self.vectors is None:
+            self._allocate(vector.shape[0])
+        if self.filled < self.capacity:
+            row = self.filled
+            self.filled += 1
+        else:
+            row = int(np.argmin(self.used))
+            self.evictions += 1
+        self.vectors[row] = vector
+        self.partitions[row] = partition
+        self.used[row] = time.time()
+        self.entries[row] = entry
+        return row
+
+    def touch(self, row: int):
+        self.used[row] = time.time()
+
+    def clear(self):
+        self.filled = 0
+        self.entries = [None] * self.capacity
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Copy of the row metadata for ``write`` (None when there is nothing to persist)"""
+        if not self.path or self.vectors is None:
+            return None
+        return {
+            "filled": self.filled,
+            "partitions": self.partitions[:self.filled].tolist(),
+            "used": self.used[:self.filled].tolist(),
+            "entries": self.entries[:self.filled]
+        }
+
+    def write(self, meta: Dict[str, Any]):
+        """Sync the memory-mapped vectors and write a ``snapshot`` to disk (blocking)"""
+        with self._write_lock:
+            self.vectors.flush()
+            _, meta_path = self._files()
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(meta_path + ".tmp", meta_path)
+
+    def flush(self):
+        """Write the metadata and sync the memory-mapped vectors to disk"""
+        meta = self.snapshot()
+        if meta is not None:
+            self.write(meta)
+
+    def nbytes(self) -> int:
+        return 0 if self.vectors is None else self.vectors.nbytes
+
+
+class SemanticCache:
+    """
+    Answers for prompts that mean the same as an earlier one
+
+    Prompts are embedded and compared by cosine similarity with earlier
+    prompts for the same model and options. A match above ``threshold``
+    returns the stored answer. Only prompts without conversation history
+    are considered, since an answer in one conversation says nothing about
+    another. The embedding of a missed prompt is kept briefly so storing
+    its answer afterwards does not embed it again.
+    """
+
+    def __init__(self, embed: Embedder, index: Optional[VectorIndex] = None, threshold: float = 0.92,
+                 top_k: int = 5, enabled: bool = True, flush_every: int = 100,
+                 make_index: Optional[Callable[[], VectorIndex]] = None):
+        self.embed = embed
+        self._index = index
+        self._make_index = make_index
+        self.threshold = threshold
+        self.top_k = top_k
+        self.enabled = enabled
+        self.flush_every = flush_every
+        self._recent: "OrderedDict[str, np.ndarray]" = OrderedDict()  # prompt -> embedding of recent misses
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.embeds = 0
+        self.embed_seconds = 0.0
+        self.search_seconds = 0.0
+
+    @property
+    def index(self) -> VectorIndex:
+        """The vector index, built on first use when given as ``make_index``"""
+        if self._index is None:
+            self._index = self._make_index()
+        return self._index
+
+    @index.setter
+    def index(self, index: VectorIndex):
+        self._index = index
+
+    async def warm(self):
+        """Build the index (and read a persisted one) off the event loop"""
+        if self.enabled and self._index is None:
+            self._index = await asyncio.to_thread(self._make_index)
+
+    @staticmethod
+    def partition(model: str, options: Optional[Dict[str, Any]] = None) -> int:
+        digest = hashlib.sha256(json.dumps([model, options or {}], sort_keys=True).encode()).digest()
+        return int.from_bytes(digest[:8], "big", signed=True)
+
+    async def _vector(self, text: str) -> "np.ndarray":
+        import numpy as np
+
+        start = time.perf_counter()
+        vector = np.asarray((await self.embed([text]))[0], dtype=np.float32)
+        self.embeds += 1
+        self.embed_seconds += time.perf_counter() - start
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get(self, message: str, model: str,
+                  options: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up an answer to a prompt similar to ``message``
+
+        Returns:
+            Cached value ({"response", "model", "similarity"}) or None
+        """
+        if not self.enabled:
+            return None
+        text = ResponseCache.normalize_message(message)
+        try:
+            vector = await self._vector(text)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Semantic cache embedding failed: %s", e)
+            return None
+
+        start = time.perf_counter()
+        matches = self.index.search(vector, self.partition(model, options), self.top_k)
+        self.search_seconds += time.perf_counter() - start
+        if matches and matches[0][0] >= self.threshold:
+            similarity, row = matches[0]
+            self.index.touch(row)
+            self.hits += 1
+            return {**self.index.entries[row], "similarity": round(similarity, 4)}
+
+        self.misses += 1
+        self._recent[text] = vector
+        while len(self._recent) > 256:
+            self._recent.popitem(last=False)
+        return None
+
+    async def set(self, message: str, model: str, options: Optional[Dict[str, Any]], value: Dict[str, Any]):
+        """Store the answer to ``message``"""
+        if not self.enabled:
+            return
+        text = ResponseCache.normalize_message(message)
+        vector = self._recent.pop(text, None)
+        if vector is None:
+            try:
+                vector = await self._vector(text)
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Semantic cache embedding failed: %s", e)
+                return
+        self.index.add(vector, self.partition(model, options),
+                       {"response": value["response"], "model": value["model"]})
+        self._inserts += 1
+        if self._inserts % self.flush_every == 0:
+            # Copy the metadata here; msync and the JSON write happen off the event loop
+            meta = self.index.snapshot()
+            if meta is not None:
+                await asyncio.to_thread(self.index.write, meta)
+
+    async def record_stream(self, message: str, model: str, options: Optional[Dict[str, Any]],
+                            events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Pass stream events through and store the answer once it completes"""
+        async for event in events:
+            if event.get("done") and event.get("success") and not event.get("cached"):
+                await self.set(message, model, options, event)
+            yield event
+
+    async def clear(self):
+        if self._index is not None:
+            self._index.clear()
+        self._recent.clear()
+
+    def flush(self):
+        if self._index is not None:
+            self._index.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        index = self._index
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "entries": index.filled if index else 0,
+            "capacity": index.capacity if index else settings.semantic_cache_max_entries,
+            "bytes": index.nbytes() if index else 0,
+            "evictions": index.evictions if index else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "embed_ms_avg": 1000 * self.embed_seconds / self.embeds if self.embeds else 0.0,
+            "search_ms_avg": 1000 * self.search_seconds / lookups if lookups else 0.0
+        }
+
+
+def create_semantic_cache() -> SemanticCache:
+    """Build the semantic cache from settings"""
+    return SemanticCache(
+        embed=OllamaEmbedder(ollama_service, settings.semantic_cache_model),
+        make_index=lambda: VectorIndex(settings.semantic_cache_max_entries, settings.semantic_cache_path),
+        threshold=settings.semantic_cache_threshold,
+        top_k=settings.semantic_cache_top_k,
+        enabled=settings.semantic_cache_enabled
+    )
+
+
+# Global semantic cache instance
+semantic_cache = create_semantic_cache()
@@ -0,0 +1,351 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from app.core.config import settings
+
+
+class SharedState:
+    """
+    Key-value state that every worker process can see
+
+    Strings, integer counters and lists, each with an optional TTL in
+    seconds. Used for the response cache, sessions, rate limits and
+    scheduler counters when the server runs several workers.
+    """
+
+    name = "shared"
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """
+        Add to a counter, creating it at 0
+
+        ``ttl`` only applies when the counter is created, so a counter per
+        time window (rate limits) expires with its window.
+        """
+        raise NotImplementedError
+
+    async def push(self, key: str, values: List[str], max_len: Optional[int] = None,
+                   ttl: Optional[float] = None) -> int:
+        """
+        Append to a list, keep its newest ``max_len`` items and refresh its TTL
+
+        Returns:
+            Length of the list before trimming
+        """
+        raise NotImplementedError
+
+    async def items(self, key: str) -> List[str]:
+        """All items of a list (empty if missing)"""
+        raise NotImplementedError
+
+    async def drop_last(self, key: str, count: int):
+        """Remove the newest ``count`` items of a list"""
+        raise NotImplementedError
+
+    async def expire(self, key: str, ttl: float):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class MemoryState(SharedState):
+    """In-process state: shared by the tasks of one worker only"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], Any]] = {}  # key -> (expires, value)
+
+    def _lookup(self, key: str) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]):
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._lookup(key)
+        # Counters read back as strings, as they do from Redis
+        return str(value) if isinstance(value, int) else value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._store(key, value, ttl)
+
+    async def delete(self, key: str) -> bool:
+        return self._data.pop(key, None) is not None
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        value = self._lookup(key)
+        if value is None:
+            self._store(key, amount, ttl)
+            return amount
+        expires, _ = self._data[key]
+        self._data[key] = (expires, value + amount)
+        return value + amount
+
+    async def push(self, key: str, values: List[str], max_len: Optional[int] = None,
+                   ttl: Optional[float] = None) -> int:
+        items = self._lookup(key)
+        if items is None:
+            items = []
+            self._store(key, items, ttl)
+        elif ttl:
+            self._store(key, items, ttl)
+        # Without a ttl the list keeps its expiry, as with RPUSH in Redis
+        items.extend(values)
+        length = len(items)
+        if max_len is not None and length > max_len:
+            del items[:length - max_len]
+        return length
+
+    async def items(self, key: str) -> List[str]:
+        return list(self._lookup(key) or [])
+
+    async def drop_last(self, key: str, count: int):
+        items = self._lookup(key)
+        if items and count > 0:
+            del items[-count:]
+
+    async def expire(self, key: str, ttl: float):
+        value = self._lookup(key)
+        if value is not None:
+            self._store(key, value, ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "keys": len(self._data)}
+
+
+class RedisError(Exception):
+    """Error reply from the Redis server"""
+
+
+# Raised by a remote state that is down, slow or misbehaving
+STATE_ERRORS = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, RedisError)
+
+
+def encode_command(*args: Any) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Read one RESP2 reply; error replies are returned as RedisError instances"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Redis connection closed")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RedisError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode("utf-8")
+    if kind == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"Unexpected Redis reply: {line!r}")
+
+
+class RedisState(SharedState):
+    """
+    Shared state in Redis (or any server speaking its protocol)
+
+    A small RESP2 client over asyncio streams with a pool of connections.
+    Commands of one operation are pipelined, so each call costs a single
+    round trip.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "", max_connections: int = 10, timeout: float = 5.0):
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported shared state URL: {url}")
+        self.url = url
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._idle: Deque[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.commands = 0
+        self.errors = 0
+
+    def _pool(self) -> asyncio.Semaphore:
+        # Connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._idle.clear()
+            self._slots = asyncio.Semaphore(self.max_connections)
+        return self._slots
+
+    async def _open(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            writer.write(b"".join(encode_command(*command) for command in setup))
+            for _ in setup:
+                reply = await read_reply(reader)
+                if isinstance(reply, RedisError):
+                    writer.close()
+                    raise reply
+        return reader, writer
+
+    async def execute(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        """
+        Send commands in one pipeline and return their replies
+
+        Raises:
+            RedisError: A command failed (after all replies were read)
+        """
+        payload = b"".join(encode_command(*command) for command in commands)
+        async with self._pool():
+            reused = bool(self._idle)
+            while True:
+                connection = self._idle.popleft() if self._idle else await self._open()
+                reader, writer = connection
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    replies = [await asyncio.wait_for(read_reply(reader), self.timeout) for _ in commands]
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        # The server closed an idle connection: retry once on a fresh one
+                        reused = False
+                        continue
+                    self.errors += 1
+                    raise
+                except BaseException:
+                    # The connection may hold unread replies; never reuse it
+                    writer.close()
+                    self.errors += 1
+                    raise
+                break
+            self._idle.append(connection)
+        self.commands += len(commands)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                self.errors += 1
+                raise reply
+        return replies
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def get(self, key: str) -> Optional[str]:
+        (value,) = await self.execute(("GET", self._key(key)))
+        return value
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        if ttl:
+            await self.execute(("SET", self._key(key), value, "PX", int(ttl * 1000)))
+        else:
+            await self.execute(("SET", self._key(key), value))
+
+    async def delete(self, key: str) -> bool:
+        (count,) = await self.execute(("DEL", self._key(key)))
+        return count > 0
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        key = self._key(key)
+        if not ttl:
+            (value,) = await self.execute(("INCRBY", key, amount))
+            return value
+        # Only a new counter gets the TTL. A pipeline is not atomic, so SET NX
+        # then INCRBY could recreate a key expiring in between without one;
+        # INCRBY first tells from its result whether it created the key.
+        (value,) = await self.execute(("INCRBY", key, amount))
+        if value == amount:
+            await self.execute(("PEXPIRE", key, int(ttl * 1000)))
+        return value
+
+    async def push(self, key: str, values: List[str], max_len: Optional[int] = None,
+                   ttl: Optional[float] = None) -> int:
+        key = self._key(key)
+        commands: List[Tuple[Any, ...]] = [("RPUSH", key, *values)]
+        if max_len is not None:
+            commands.append(("LTRIM", key, -max_len, -1))
+        if ttl:
+            commands.append(("PEXPIRE", key, int(ttl * 1000)))
+        replies = await self.execute(*commands)
+        return replies[0]
+
+    async def items(self, key: str) -> List[str]:
+        (values,) = await self.execute(("LRANGE", self._key(key), 0, -1))
+        return values
+
+    async def drop_last(self, key: str, count: int):
+        if count > 0:
+            await self.execute(("LTRIM", self._key(key), 0, -count - 1))
+
+    async def expire(self, key: str, ttl: float):
+        await self.execute(("PEXPIRE", self._key(key), int(ttl * 1000)))
+
+    async def close(self):
+        while self._idle:
+            _, writer = self._idle.popleft()
+            writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "host": f"{self.host}:{self.port}/{self.db}",
+            "commands": self.commands,
+            "errors": self.errors,
+            "idle_connections": len(self._idle)
+        }
+
+
+def create_shared_state() -> SharedState:
+    """Build the shared state from settings (in-process unless a URL is set)"""
+    if settings.shared_state_url:
+        return RedisState(settings.shared_state_url, prefix=settings.shared_state_prefix)
+    return MemoryState()
+
+
+# Global shared state instance
+shared_state = create_shared_state()
@@ -0,0 +1,393 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from .metrics import metrics
+
+# Yielded by subscribe(heartbeats=True) when a stream has been idle for a while
+HEARTBEAT = None
+
+
+class _Stream:
+    """
+    One generation and the log of its events
+
+    Events are appended by a pump task and read by any number of
+    subscribers, each with its own cursor. The log outlives the client
+    connection so a client that reconnects can pick up where it left off.
+    """
+
+    def __init__(self, request_id: str, model: str):
+        self.request_id = request_id
+        self.model = model
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.succeeded = False
+        self.cancelled = False
+        self.stop_reason = "Request cancelled"
+        self.subscribers = 0
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.grace: Optional[asyncio.TimerHandle] = None
+        self.ticker: Optional[asyncio.TimerHandle] = None
+        self.meta: Dict[str, Any] = {}
+        self.resumable = True  # kept for resume_grace after the last reader leaves
+        self.changed = asyncio.Event()
+        self.tokens = 0
+        # Chunk events not yet visible to subscribers, merged into one on flush
+        self.pending: List[Dict[str, Any]] = []
+        self.pending_bytes = 0
+        self.flush_timer: Optional[asyncio.TimerHandle] = None
+        self.read = 0  # events taken by the fastest subscriber
+        self.reader: Optional[asyncio.Future] = None  # set while the pump waits for readers
+
+    def advance(self, index: int):
+        """Record a subscriber's position, waking the pump if it was waiting for it"""
+        if index > self.read:
+            self.read = index
+            self.wake_pump()
+
+    def wake_pump(self):
+        if self.reader is not None and not self.reader.done():
+            self.reader.set_result(None)
+
+    def notify(self):
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def flush(self):
+        """Publish the buffered chunk events as one event"""
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if not self.pending:
+            return
+        if len(self.pending) == 1:
+            event = self.pending[0]
+        else:
+            event = dict(self.pending[0])
+            event["chunk"] = "".join(e["chunk"] for e in self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+        self.events.append(event)
+        self.notify()
+
+
+class StreamRegistry:
+    """
+    Active and recently finished chat streams, keyed by request ID
+
+    Each stream's upstream events are pulled by a pump task of its own, so
+    generation does not depend on the client connection. When the last
+    client goes away the generation is kept for ``resume_grace`` seconds
+    for a reconnect, then cancelled, which closes the Ollama request and
+    releases the scheduler slot. Cancelling by ID stops it at once.
+    Finished streams stay replayable for ``replay_ttl`` seconds.
+
+    Tokens can be coalesced as they enter the log: consecutive chunk events
+    are merged into one once ``flush_tokens`` tokens or ``flush_bytes``
+    characters are buffered, or ``flush_ms`` after the first of them,
+    whichever comes first. Subscribers wake once per merged event rather
+    than once per token, and the log (hence frame numbering for resumes)
+    is the same for every reader.
+
+    While a stream has subscribers, the pump stops pulling once the log is
+    ``read_ahead`` events past the fastest of them (0 = no limit), so a
+    slow client slows the upstream read instead of filling memory.
+    """
+
+    def __init__(self, resume_grace: float = 0.0, replay_ttl: float = 60.0,
+                 max_streams: int = 1000, heartbeat: float = 15.0,
+                 flush_tokens: int = 1, flush_bytes: int = 1024, flush_ms: float = 50.0,
+                 read_ahead: int = 0):
+        self.resume_grace = resume_grace
+        self.replay_ttl = replay_ttl
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.flush_tokens = flush_tokens
+        self.flush_bytes = flush_bytes
+        self.flush_ms = flush_ms
+        self.read_ahead = read_ahead
+        self._streams: "OrderedDict[str, _Stream]" = OrderedDict()
+        self._answer_tokens: Dict[str, float] = {}  # EWMA of tokens per completed answer
+        self.completed = 0
+        self.disconnected = 0
+        self.cancelled = 0
+        self.resumed = 0
+        self.tokens_saved = 0
+        self.draining = False
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def _purge(self):
+        now = time.monotonic()
+        excess = len(self._streams) - self.max_streams
+        for request_id, stream in list(self._streams.items()):
+            if stream.finished_at is None:
+                continue
+            if excess > 0 or stream.finished_at + self.replay_ttl < now:
+                del self._streams[request_id]
+                excess -= 1
+
+    def is_active(self, request_id: str) -> bool:
+        """True if ``request_id`` is generating or still replayable"""
+        self._purge()
+        return request_id in self._streams
+
+    def meta(self, request_id: str) -> Dict[str, Any]:
+        """Caller data stored with the stream (e.g. its wire protocol)"""
+        return self._streams[request_id].meta
+
+    def start(self, request_id: str, model: str, events: AsyncIterator[Dict[str, Any]],
+              meta: Optional[Dict[str, Any]] = None, resumable: bool = True):
+        """
+        Start pulling ``events`` in the background under ``request_id``
+
+        Args:
+            request_id: ID the stream can be resumed and cancelled by
+            model: Model name (for the tokens-saved estimate)
+            events: Upstream service events
+            meta: Caller data to keep with the stream
+            resumable: Keep generating for ``resume_grace`` once no client
+                is reading; if False, stop as soon as the last one leaves
+        """
+        self._purge()
+        stream = _Stream(request_id, model)
+        stream.meta = meta or {}
+        stream.resumable = resumable
+        loop = asyncio.get_running_loop()
+        coalesce = self.flush_tokens > 1
+
+        async def pump():
+            try:
+                async for event in self._paced(stream, events):
+                    if event.get("chunk"):
+                        stream.tokens += 1
+                    if coalesce and event.get("chunk") and not event.get("done") and event.get("success"):
+                        stream.pending.append(event)
+                        stream.pending_bytes += len(event["chunk"])
+                        if len(stream.pending) >= self.flush_tokens or stream.pending_bytes >= self.flush_bytes:
+                            stream.flush()
+                        elif stream.flush_timer is None:
+                            stream.flush_timer = loop.call_later(self.flush_ms / 1000, stream.flush)
+                        continue
+                    stream.flush()
+                    stream.events.append(event)
+                    stream.notify()
+                    if event.get("done"):
+                        stream.succeeded = event.get("success", False)
+            except asyncio.CancelledError:
+                stream.flush()
+                if stream.cancelled:
+                    stream.events.append(
+                        {"chunk": "", "model": model, "success": False, "error": stream.stop_reason, "done": True}
+                    )
+                raise
+            except Exception as e:
+                stream.flush()
+                stream.events.append({"chunk": "", "model": model, "success": False, "error": str(e), "done": True})
+            finally:
+                stream.flush()
+                self._finish(stream)
+
+        stream.task = asyncio.create_task(pump())
+        if self.heartbeat > 0:
+            def tick():
+                # Wake idle subscribers so they can send a heartbeat
+                if not stream.done:
+                    stream.notify()
+                    stream.ticker = loop.call_later(self.heartbeat, tick)
+
+            stream.ticker = loop.call_later(self.heartbeat, tick)
+        self._streams[request_id] = stream
+
+    async def _paced(self, stream: _Stream, events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Pull ``events`` no further than ``read_ahead`` events past the fastest subscriber"""
+        try:
+            async for event in events:
+                yield event
+                while self.read_ahead and stream.subscribers and len(stream.events) - stream.read >= self.read_ahead:
+                    stream.reader = asyncio.get_running_loop().create_future()
+                    await stream.reader
+        finally:
+            # Cancelled while waiting for readers: close the upstream stream now
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _finish(self, stream: _Stream):
+        stream.done = True
+        stream.finished_at = time.monotonic()
+        for handle in (stream.grace, stream.ticker):
+            if handle is not None:
+                handle.cancel()
+        stream.notify()
+        if stream.succeeded:
+            self._record_answer(stream.model, stream.tokens)
+        elif stream.cancelled or not (stream.events and stream.events[-1].get("done")):
+            # Stopped early rather than failed upstream
+            self._record_stopped(stream, "cancelled" if stream.cancelled else "disconnected")
+
+    async def subscribe(self, request_id: str, after: int = 0,
+                        heartbeats: bool = False) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Read the events of a stream, replaying from index ``after``
+
+        Args:
+            request_id: Stream to read
+            after: Number of events the client already has
+            heartbeats: Also yield HEARTBEAT when the stream has been idle
+
+        Yields:
+            Events (and HEARTBEAT markers when ``heartbeats`` is set)
+
+        Raises:
+            KeyError: Unknown or expired request ID
+        """
+        self._purge()
+        stream = self._streams[request_id]
+        if stream.grace is not None:
+            stream.grace.cancel()
+            stream.grace = None
+        stream.subscribers += 1
+        index = after
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        try:
+            while True:
+                if index < len(stream.events):
+                    yield stream.events[index]
+                    index += 1
+                    stream.advance(index)
+                    last = loop.time()
+                elif stream.done:
+                    return
+                else:
+                    await stream.changed.wait()
+                    if heartbeats and index == len(stream.events) and loop.time() - last >= self.heartbeat / 2:
+                        yield HEARTBEAT
+                        last = loop.time()
+        finally:
+            stream.subscribers -= 1
+            stream.wake_pump()  # without subscribers it generates ahead for a resume
+            if stream.subscribers == 0 and not stream.done:
+                if self.resume_grace > 0 and stream.resumable:
+                    stream.grace = loop.call_later(self.resume_grace, self._abandon, stream)
+                else:
+                    self._abandon(stream)
+
+    async def resume(self, request_id: str, after: int = 0,
+                     heartbeats: bool = False) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Like subscribe(), counting the reconnect"""
+        self.resumed += 1
+        async for event in self.subscribe(request_id, after, heartbeats):
+            yield event
+
+    @staticmethod
+    def _abandon(stream: _Stream):
+        # Nobody is reading any more: stop pulling tokens from Ollama
+        if stream.subscribers == 0 and not stream.done and stream.task is not None:
+            stream.task.cancel()
+
+    async def guard(self, request_id: str, model: str, events: AsyncIterator[Dict[str, Any]],
+                    meta: Optional[Dict[str, Any]] = None, heartbeats: bool = False,
+                    resumable: bool = True) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Start ``events`` under ``request_id`` once iterated, and read it
+
+        Yields:
+            The upstream events; an error event if cancelled by ID
+        """
+        self.start(request_id, model, events, meta, resumable)
+        async for event in self.subscribe(request_id, heartbeats=heartbeats):
+            yield event
+
+    def cancel(self, request_id: str) -> bool:
+        """
+        Stop the generation with ``request_id``
+
+        Returns:
+            False if no such stream is generating
+        """
+        stream = self._streams.get(request_id)
+        if stream is None or stream.done:
+            return False
+        stream.cancelled = True
+        stream.task.cancel()
+        return True
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Let the streams in flight finish, then stop the rest
+
+        Called on shutdown; callers should refuse new streams while
+        ``draining`` is set, which stays set until the process exits.
+
+        Args:
+            timeout: Seconds to wait for generations to complete
+
+        Returns:
+            Number of streams stopped because the timeout ran out
+        """
+        self.draining = True
+        loop = asyncio.get_running_loop()
+        live = [
+            stream for stream in self._streams.values()
+            if not stream.done and stream.task is not None and stream.task.get_loop() is loop
+        ]
+        if live:
+            await asyncio.wait([stream.task for stream in live], timeout=timeout)
+        stopped = []
+        for stream in live:
+            if not stream.done:
+                stream.cancelled = True
+                stream.stop_reason = "Server shutting down"
+                stream.task.cancel()
+                stopped.append(stream.task)
+        await asyncio.gather(*stopped, return_exceptions=True)
+        return len(stopped)
+
+    def _record_answer(self, model: str, tokens: int):
+        self.completed += 1
+        previous = self._answer_tokens.get(model)
+        self._answer_tokens[model] = tokens if previous is None else 0.8 * previous + 0.2 * tokens
+
+    def _record_stopped(self, stream: _Stream, reason: str):
+        if reason == "cancelled":
+            self.cancelled += 1
+        else:
+            self.disconnected += 1
+        # Estimate the rest of the answer from typical answer length for the model
+        saved = max(int(self._answer_tokens.get(stream.model, 0) - stream.tokens), 0)
+        self.tokens_saved += saved
+        metrics.observe_stream_stopped(stream.model, reason, saved)
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge()
+        return {
+            "active": sum(1 for stream in self._streams.values() if not stream.done),
+            "replayable": sum(1 for stream in self._streams.values() if stream.done),
+            "completed": self.completed,
+            "disconnected": self.disconnected,
+            "cancelled": self.cancelled,
+            "resumed": self.resumed,
+            "tokens_saved": self.tokens_saved,
+            "draining": self.draining
+        }
+
+
+# Global registry instance
+stream_registry = StreamRegistry(
+    resume_grace=settings.sse_resume_grace,
+    replay_ttl=settings.sse_replay_ttl,
+    max_streams=settings.sse_replay_max_streams,
+    heartbeat=settings.sse_heartbeat_interval,
+    flush_tokens=settings.stream_flush_tokens,
+    flush_bytes=settings.stream_flush_bytes,
+    flush_ms=settings.stream_flush_ms,
+    read_ahead=settings.stream_read_ahead
+)
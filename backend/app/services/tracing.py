@@ -0,0 +1,365 @@
+import json
+import logging
+import os
+import random
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# W3C trace context: version-traceid-parentid-flags
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# OpenTelemetry span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    recording = True
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def fail(self, error: BaseException):
+        """Mark the stage as failed (ignored once it has ended)"""
+        if self.end_ns is None:
+            self.error = str(error) or type(error).__name__
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Stands in for a span when the request is not traced"""
+
+    recording = False
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def fail(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+# Span that new spans are children of, for the running request
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """The spans of one request"""
+
+    __slots__ = ("trace_id", "root", "spans", "sampled", "dropped_spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.root: Optional[Span] = None
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms if self.root is not None else 0.0
+
+    @property
+    def failed(self) -> bool:
+        return any(span.error for span in self.spans)
+
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}  # int64 is a string in OTLP/JSON
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Tracer:
+    """
+    In-process request tracing with OpenTelemetry-compatible output
+
+    Each HTTP request gets a trace whose spans time its stages (parsing,
+    cache lookup, queue wait, upstream connect, first token, streaming,
+    serialization). The running span is kept in a context variable, so
+    stages in other services and in tasks spawned by the request attach
+    to it without being passed around. Every request is recorded while
+    it runs; afterwards ``sample_rate`` of traces are kept, plus all slow
+    (over ``slow_seconds``) and failed ones. Kept traces go to a ring
+    buffer of ``buffer_size`` for /debug/traces and, with an
+    ``export_path``, are appended there as OTLP/JSON lines (one
+    ``ExportTraceServiceRequest`` per trace).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        sample_rate: float = 1.0,
+        slow_seconds: float = 5.0,
+        buffer_size: int = 1000,
+        export_path: Optional[str] = None,
+        max_spans: int = 500,
+        service_name: str = "ollama-chat-api"
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.export_path = export_path
+        self.max_spans = max_spans
+        self.service_name = service_name
+        self.buffer: Deque[Trace] = deque(maxlen=buffer_size)
+        self._file = None
+        self.started = 0
+        self.kept = 0
+        self.exported = 0
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None,
+                    attributes: Optional[Dict[str, Any]] = None) -> Optional[Trace]:
+        """
+        Begin the trace of a request, continuing the caller's trace if given
+
+        Args:
+            name: Root span name
+            traceparent: Incoming W3C ``traceparent`` header
+            attributes: Root span attributes
+
+        Returns:
+            The trace, or None when tracing is disabled
+        """
+        if not self.enabled:
+            return None
+        self.started += 1
+        match = TRACEPARENT.match(traceparent or "")
+        if match:
+            trace_id, parent_id, flags = match.groups()
+            sampled = bool(int(flags, 16) & 1) or random.random() < self.sample_rate
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+            sampled = random.random() < self.sample_rate
+        trace = Trace(trace_id, sampled)
+        trace.root = Span(trace, name, parent_id, KIND_SERVER, attributes)
+        trace.spans.append(trace.root)
+        return trace
+
+    @staticmethod
+    def activate(trace: Trace):
+        """Make ``trace`` the current one; returns a token for ``deactivate``"""
+        return _current.set(trace.root)
+
+    @staticmethod
+    def deactivate(token):
+        _current.reset(token)
+
+    def finish(self, trace: Trace):
+        """End the root span and keep the trace if it is sampled, slow or failed"""
+        trace.root.end()
+        if not (trace.sampled or trace.duration_ms >= self.slow_seconds * 1000 or trace.failed):
+            return
+        self.kept += 1
+        self.buffer.append(trace)
+        if self.export_path:
+            self._export(trace)
+
+    def _add(self, span: Span) -> Span:
+        trace = span.trace
+        if len(trace.spans) < self.max_spans:
+            trace.spans.append(span)
+        else:
+            trace.dropped_spans += 1
+        return span
+
+    @staticmethod
+    def current_span():
+        """The running span, or a no-op span outside a traced request"""
+        return _current.get() or NOOP_SPAN
+
+    def start_span(self, name: str, kind: int = KIND_INTERNAL, **attributes):
+        """
+        Start a child of the running span without making it current
+
+        For stages that outlive one block, such as a stream consumed across
+        many ``yield`` points. The caller must ``end()`` it.
+        """
+        parent = _current.get()
+        if parent is None:
+            return NOOP_SPAN
+        return self._add(Span(parent.trace, name, parent.span_id, kind, attributes))
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes) -> Iterator[Any]:
+        """Time a block as a child of the running span, which it becomes for the block"""
+        parent = _current.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+        span = self._add(Span(parent.trace, name, parent.span_id, kind, attributes))
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.fail(e)
+            raise
+        finally:
+            span.end()
+            try:
+                _current.reset(token)
+            except ValueError:
+                _current.set(parent)  # block ended in another context (e.g. a closed generator)
+
+    def span_since_start(self, name: str, **attributes):
+        """Record a span from the arrival of the request until now (e.g. request parsing)"""
+        parent = _current.get()
+        if parent is None:
+            return NOOP_SPAN
+        root = parent.trace.root
+        span = self._add(Span(parent.trace, name, root.span_id, KIND_INTERNAL, attributes, root.start_ns))
+        span.end()
+        return span
+
+    @staticmethod
+    def headers(trace: Trace) -> List[Tuple[bytes, bytes]]:
+        """Response headers that identify the trace"""
+        flags = "01" if trace.sampled else "00"
+        return [
+            (b"x-trace-id", trace.trace_id.encode()),
+            (b"traceparent", f"00-{trace.trace_id}-{trace.root.span_id}-{flags}".encode())
+        ]
+
+    def slowest(self, limit: int = 20, min_duration_ms: float = 0.0) -> List[Trace]:
+        """Slowest traces in the buffer, slowest first"""
+        traces = [t for t in self.buffer if t.duration_ms >= min_duration_ms]
+        return sorted(traces, key=lambda t: t.duration_ms, reverse=True)[:limit]
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        for trace in reversed(self.buffer):
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    @staticmethod
+    def summary(trace: Trace) -> Dict[str, Any]:
+        """Readable form of a trace: spans as offsets from the start of the request"""
+        start = trace.root.start_ns
+        return {
+            "trace_id": trace.trace_id,
+            "name": trace.root.name,
+            "duration_ms": round(trace.duration_ms, 3),
+            "error": trace.failed,
+            "dropped_spans": trace.dropped_spans,
+            "spans": [
+                {
+                    "name": span.name,
+                    "span_id": span.span_id,
+                    "parent_span_id": span.parent_id,
+                    "offset_ms": round((span.start_ns - start) / 1e6, 3),
+                    "duration_ms": round(span.duration_ms, 3),
+                    "attributes": span.attributes,
+                    **({"error": span.error} if span.error else {})
+                }
+                for span in sorted(trace.spans, key=lambda s: s.start_ns)
+            ]
+        }
+
+    def to_otlp(self, traces: List[Trace]) -> Dict[str, Any]:
+        """Traces as an OTLP/JSON ``ExportTraceServiceRequest``"""
+        spans = []
+        for trace in traces:
+            for span in trace.spans:
+                otlp = {
+                    "traceId": trace.trace_id,
+                    "spanId": span.span_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns or time.time_ns()),
+                    "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+                    "status": {"code": STATUS_ERROR, "message": span.error} if span.error else {"code": STATUS_UNSET}
+                }
+                if span.parent_id:
+                    otlp["parentSpanId"] = span.parent_id
+                spans.append(otlp)
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+        }]}
+
+    def _export(self, trace: Trace):
+        try:
+            if self._file is None:
+                self._file = open(self.export_path, "a", buffering=1 << 16, encoding="utf-8")
+            self._file.write(json.dumps(self.to_otlp([trace]), separators=(",", ":")) + "\n")
+            self.exported += 1
+        except OSError as e:
+            logger.warning("Exporting trace to %s failed: %s", self.export_path, e)
+
+    def flush(self):
+        """Write buffered exports to disk"""
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except OSError as e:
+                logger.warning("Flushing traces to %s failed: %s", self.export_path, e)
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_seconds": self.slow_seconds,
+            "started": self.started,
+            "kept": self.kept,
+            "exported": self.exported,
+            "buffered": len(self.buffer)
+        }
+
+
+# Global tracer instance
+tracer = Tracer(
+    enabled=settings.tracing_enabled,
+    sample_rate=settings.tracing_sample_rate,
+    slow_seconds=settings.tracing_slow_seconds,
+    buffer_size=settings.tracing_buffer_size,
+    export_path=settings.tracing_export_path,
+    max_spans=settings.tracing_max_spans,
+    service_name=settings.app_name
+)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class _Step:
+    __slots__ = ("name", "run", "required", "state", "error", "seconds")
+
+    def __init__(self, name: str, run: Callable[[], Awaitable[Any]], required: bool):
+        self.name = name
+        self.run = run
+        self.required = required
+        self.state = "pending"  # pending, running, done, failed
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+
+
+class Warmup:
+    """
+    Startup work that runs in the background after the app starts serving
+
+    Steps run concurrently, each bounded by ``timeout``. Readiness only
+    waits for the ``required`` ones (e.g. the first backend health check);
+    the rest (model preloads, index loads) finish while traffic is already
+    being served. A failed step is logged and reported, never retried here.
+    """
+
+    def __init__(self, timeout: float = 60.0):
+        self.timeout = timeout
+        self._steps: List[_Step] = []
+        self._tasks: List[asyncio.Task] = []
+        self.started: Optional[float] = None
+
+    def start(self, steps: Dict[str, Callable[[], Awaitable[Any]]], required: Optional[List[str]] = None):
+        """
+        Run ``steps`` in the background
+
+        Args:
+            steps: Step name -> coroutine function
+            required: Names of the steps readiness waits for
+        """
+        required = set(required or ())
+        self.started = time.perf_counter()
+        self._steps = [_Step(name, run, name in required) for name, run in steps.items()]
+        self._tasks = [asyncio.create_task(self._run(step)) for step in self._steps]
+
+    async def _run(self, step: _Step):
+        step.state = "running"
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(step.run(), self.timeout)
+            step.state = "done"
+        except Exception as e:
+            step.state = "failed"
+            step.error = str(e) or type(e).__name__
+            logger.warning("Warm-up step %s failed: %s", step.name, step.error)
+        finally:
+            step.seconds = time.perf_counter() - start
+
+    @property
+    def ready(self) -> bool:
+        """True once every required step has finished (successfully or not)"""
+        return self.started is not None and all(
+            step.state in ("done", "failed") for step in self._steps if step.required
+        )
+
+    async def wait(self, required_only: bool = False):
+        """Wait for the steps (or only the required ones) to finish"""
+        loop = asyncio.get_running_loop()
+        tasks = [
+            task for step, task in zip(self._steps, self._tasks)
+            if (step.required or not required_only) and task.get_loop() is loop
+        ]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "steps": {
+                step.name: {
+                    "state": step.state,
+                    "required": step.required,
+                    "seconds": step.seconds,
+                    **({"error": step.error} if step.error else {})
+                }
+                for step in self._steps
+            }
+        }
+
+
+# Global warm-up instance
+warmup = Warmup(timeout=settings.warmup_timeout)
@@ -0,0 +1 @@
+# Backend benchmarks (run as scripts, e.g. python -m benchmarks.stream_protocol)
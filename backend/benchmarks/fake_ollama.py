@@ -0,0 +1,269 @@
+"""
+Deterministic fake Ollama server for tests and benchmarks
+
+Speaks just enough of the Ollama REST API (/api/chat, /api/embed, /api/tags,
+/api/ps) to exercise
+OllamaService without a GPU box. Tokens are emitted with asyncio.sleep so the
+server itself never blocks and concurrent requests can overlap. Token rate,
+first-token delay and failures are configurable; failures are drawn from a
+seeded generator so runs are repeatable.
+
+Usage (from the backend directory):
+    python -m benchmarks.fake_ollama --port 11434 --tokens-per-second 50 --num-tokens 200
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_fake_ollama_app(
+    tokens: List[str] = None,
+    token_delay: float = 0.01,
+    models: List[str] = None,
+    error: str = None,
+    loaded: List[str] = None,
+    tokens_per_second: Optional[float] = None,
+    first_token_delay: float = 0.0,
+    num_tokens: Optional[int] = None,
+    failure_rate: float = 0.0,
+    midstream_failure_rate: float = 0.0,
+    seed: int = 0,
+    sizes: Optional[Dict[str, int]] = None,
+    embedding_dim: int = 64,
+    embed_error_status: Optional[int] = None,
+    model_tokens: Optional[Dict[str, List[str]]] = None
+) -> FastAPI:
+    """
+    Build a FastAPI app that imitates Ollama
+
+    Args:
+        tokens: Tokens emitted for every chat request
+        token_delay: Seconds to wait before each token
+        models: Model names reported by /api/tags
+        error: If set, every chat request fails with this message
+        loaded: Model names reported as loaded in memory by /api/ps
+        tokens_per_second: Token rate (overrides ``token_delay``)
+        first_token_delay: Extra seconds before the first token (prompt eval)
+        num_tokens: Emit this many synthetic tokens instead of ``tokens``
+        failure_rate: Fraction of chat requests failing with HTTP 500
+        midstream_failure_rate: Fraction of streams that break off halfway
+        seed: Seed for failure injection
+        sizes: Model sizes in bytes reported by /api/tags and /api/ps
+        embedding_dim: Length of the bag-of-words vectors from /api/embed
+        embed_error_status: If set, every /api/embed request fails with this HTTP status
+        model_tokens: Tokens for particular models, instead of ``tokens``
+
+    Returns:
+        FastAPI application; ``app.state.calls`` records (start, end) times
+        of completed generations and ``app.state.tokens_sent`` counts tokens;
+        ``app.state.loads`` records (model, keep_alive) of load/unload requests
+    """
+    if num_tokens is not None:
+        tokens = [f" t{i}" for i in range(num_tokens)]
+    tokens = tokens if tokens is not None else ["Hello", " from", " fake", " Ollama", "!"]
+    if tokens_per_second:
+        token_delay = 1.0 / tokens_per_second
+    rng = random.Random(seed)
+    models = models if models is not None else ["mistral:latest"]
+    loaded = list(loaded) if loaded is not None else []
+    sizes = sizes or {}
+    model_tokens = model_tokens or {}
+
+    app = FastAPI()
+    app.state.calls = []
+    app.state.tokens_sent = 0
+    app.state.requests = []
+    app.state.peers = []
+    app.state.loaded = loaded
+    app.state.loads = []
+    app.state.embed_requests = []
+
+    @app.get("/api/tags")
+    async def tags(request: Request):
+        app.state.peers.append(request.client.port)
+        return {"models": [{"name": name, "model": name, "size": sizes.get(name, 0)} for name in models]}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": name, "model": name, "size": sizes.get(name, 0)} for name in loaded]}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        app.state.embed_requests.append(body)
+        if embed_error_status:
+            return JSONResponse({"error": f"{body.get('model')} does not support embeddings"}, status_code=embed_error_status)
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return {"model": body.get("model"), "embeddings": [_bag_of_words(text, embedding_dim) for text in inputs]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", models[0])
+        if body.get("messages") == []:
+            # Empty chat: load the model (or unload it with keep_alive 0)
+            app.state.loads.append((model, body.get("keep_alive")))
+            unload = body.get("keep_alive") in (0, "0", "0s")
+            if unload and model in loaded:
+                loaded.remove(model)
+            elif not unload and model not in loaded:
+                loaded.append(model)
+            return {"model": model, "created_at": "2024-01-01T00:00:00Z",
+                    "message": {"role": "assistant", "content": ""},
+                    "done_reason": "unload" if unload else "load", "done": True}
+        app.state.requests.append(body)
+        reply = model_tokens.get(model, tokens)
+        if error:
+            return JSONResponse({"error": error}, status_code=500)
+        if failure_rate and rng.random() < failure_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=500)
+        break_at = len(reply) // 2 if midstream_failure_rate and rng.random() < midstream_failure_rate else None
+
+        def timings(start: float) -> dict:
+            # Same fields (in nanoseconds) as the final chunk of real Ollama
+            eval_ns = int((time.perf_counter() - start) * 1e9)
+            return {
+                "total_duration": eval_ns + 2000000,
+                "load_duration": 1000000,
+                "prompt_eval_count": len(body.get("messages", [])),
+                "prompt_eval_duration": 1000000,
+                "eval_count": len(reply),
+                "eval_duration": eval_ns
+            }
+
+        def frame(content: str, done: bool, start: float = None) -> str:
+            data = {
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": content},
+                "done": done
+            }
+            if done:
+                data.update(timings(start))
+            return json.dumps(data) + "\n"
+
+        if not body.get("stream", True):
+            start = time.perf_counter()
+            await asyncio.sleep(first_token_delay + token_delay * len(reply))
+            app.state.calls.append((start, time.perf_counter()))
+            return {
+                "model": model,
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": "".join(reply)},
+                "done": True,
+                **timings(start)
+            }
+
+        async def generate():
+            start = time.perf_counter()
+            await asyncio.sleep(first_token_delay)
+            for i, token in enumerate(reply):
+                if i == break_at:
+                    yield json.dumps({"error": "injected mid-stream failure"}) + "\n"
+                    return
+                await asyncio.sleep(token_delay)
+                app.state.tokens_sent += 1
+                yield frame(token, False)
+            yield frame("", True, start)
+            app.state.calls.append((start, time.perf_counter()))
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return app
+
+
+def _bag_of_words(text: str, dim: int) -> List[float]:
+    """Unit-length hashed word counts, so paraphrases sharing words score high"""
+    vector = [0.0] * dim
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        vector[zlib.crc32(word.encode()) % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+@contextmanager
+def serve_app(app, lifespan: str = "off"):
+    """
+    Run an ASGI app with uvicorn on a free local port in a background thread
+
+    Yields:
+        Base URL of the server
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    config = uvicorn.Config(app, log_level="warning", loop="asyncio", lifespan=lifespan)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("Server did not start")
+        time.sleep(0.01)
+
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        sock.close()
+
+
+@contextmanager
+def run_fake_ollama(**kwargs):
+    """
+    Run a fake Ollama server on a free local port in a background thread
+
+    Yields:
+        Tuple of (base_url, app)
+    """
+    app = create_fake_ollama_app(**kwargs)
+    with serve_app(app) as url:
+        yield url, app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.05, help="seconds")
+    parser.add_argument("--num-tokens", type=int, default=100, help="tokens per answer")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--midstream-failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_fake_ollama_app(
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+        num_tokens=args.num_tokens,
+        failure_rate=args.failure_rate,
+        midstream_failure_rate=args.midstream_failure_rate,
+        seed=args.seed
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
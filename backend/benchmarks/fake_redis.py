@@ -0,0 +1,263 @@
+"""
+In-process stand-in for a Redis server
+
+Speaks RESP2 and implements the commands the shared state backend uses
+(strings, counters, lists, expiry), so multi-worker state can be tested
+without a Redis install. Data lives in one dict and is lost on exit.
+
+Usage (from the backend directory):
+    python -m benchmarks.fake_redis --port 6379
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode()
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(item) for item in value)
+    if value == "OK" or value == "PONG":
+        return f"+{value}\r\n".encode()
+    data = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedis:
+    """Command handlers over a dict of key -> (expires, value)"""
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.data: Dict[str, Tuple[Optional[float], Any]] = {}
+        self.commands: List[List[str]] = []
+        self.connections: set = set()  # handler tasks, cancelled on shutdown
+
+    def _get(self, key: str) -> Any:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _expires(self, key: str) -> Optional[float]:
+        return self.data[key][0] if key in self.data else None
+
+    def execute(self, args: List[str], authed: bool) -> Any:
+        name = args[0].upper()
+        self.commands.append([name] + args[1:])
+        if name == "AUTH":
+            return "OK" if args[-1] == self.password else ValueError("invalid password")
+        if self.password and not authed:
+            return ValueError("NOAUTH Authentication required")
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return ValueError(f"unknown command '{name}'")
+        try:
+            return handler(*args[1:])
+        except (TypeError, ValueError) as e:
+            return ValueError(str(e))
+
+    def cmd_ping(self):
+        return "PONG"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_flushdb(self):
+        self.data.clear()
+        return "OK"
+
+    def cmd_get(self, key):
+        value = self._get(key)
+        if isinstance(value, list):
+            raise ValueError("WRONGTYPE")
+        return value
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if "NX" in options and self._get(key) is not None:
+            return None
+        expires = None
+        if "PX" in options:
+            expires = time.monotonic() + int(options[options.index("PX") + 1]) / 1000
+        elif "EX" in options:
+            expires = time.monotonic() + int(options[options.index("EX") + 1])
+        self.data[key] = (expires, value)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        return sum(1 for key in keys if self._get(key) is not None and self.data.pop(key))
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._get(key) is not None)
+
+    def cmd_incrby(self, key, amount):
+        value = int(self._get(key) or 0) + int(amount)
+        self.data[key] = (self._expires(key), str(value))
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, 1)
+
+    def cmd_pexpire(self, key, ms):
+        value = self._get(key)
+        if value is None:
+            return 0
+        self.data[key] = (time.monotonic() + int(ms) / 1000, value)
+        return 1
+
+    def cmd_expire(self, key, seconds):
+        return self.cmd_pexpire(key, int(seconds) * 1000)
+
+    def cmd_pttl(self, key):
+        if self._get(key) is None:
+            return -2
+        expires = self._expires(key)
+        return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+
+    def _list(self, key) -> list:
+        value = self._get(key)
+        if value is None:
+            value = []
+            self.data[key] = (None, value)
+        if not isinstance(value, list):
+            raise ValueError("WRONGTYPE")
+        return value
+
+    def cmd_rpush(self, key, *values):
+        items = self._list(key)
+        items.extend(values)
+        return len(items)
+
+    def cmd_llen(self, key):
+        return len(self._get(key) or [])
+
+    @staticmethod
+    def _range(items: list, start: int, stop: int) -> slice:
+        length = len(items)
+        start = max(length + start, 0) if start < 0 else start
+        stop = length + stop if stop < 0 else stop
+        return slice(start, stop + 1)
+
+    def cmd_lrange(self, key, start, stop):
+        items = self._get(key) or []
+        return list(items[self._range(items, int(start), int(stop))])
+
+    def cmd_ltrim(self, key, start, stop):
+        items = self._get(key)
+        if items is not None:
+            kept = items[self._range(items, int(start), int(stop))]
+            if kept:
+                self.data[key] = (self._expires(key), kept)
+            else:
+                del self.data[key]
+        return "OK"
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[str]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.decode().split()  # inline command (redis-cli style)
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+    return args
+
+
+async def serve(redis: FakeRedis, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        redis.connections.add(task)
+        authed = False
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                reply = redis.execute(args, authed)
+                if args[0].upper() == "AUTH" and reply == "OK":
+                    authed = True
+                writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            redis.connections.discard(task)
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+@contextmanager
+def run_fake_redis(password: Optional[str] = None):
+    """
+    Run a fake Redis server on a free local port in a background thread
+
+    Yields:
+        Tuple of (redis:// URL, FakeRedis)
+    """
+    redis = FakeRedis(password)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    holder = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        holder["server"] = loop.run_until_complete(serve(redis))
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait(10)
+    port = holder["server"].sockets[0].getsockname()[1]
+    auth = f":{password}@" if password else ""
+    async def stop():
+        holder["server"].close()
+        for task in list(redis.connections):
+            task.cancel()
+        await asyncio.gather(*redis.connections, return_exceptions=True)
+
+    try:
+        yield f"redis://{auth}127.0.0.1:{port}/0", redis
+    finally:
+        asyncio.run_coroutine_threadsafe(stop(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Redis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    async def run():
+        server = await serve(FakeRedis(args.password), args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Load driver for /chat and /chat/stream
+
+Sends ``requests`` chat requests with ``concurrency`` in flight and reports
+latency percentiles, time to first token and throughput. Every request gets
+a distinct message so the response cache and coalescing do not short-circuit
+the run.
+
+Usage (from the backend directory, against a running server):
+    python -m benchmarks.load --url http://127.0.0.1:8000 --endpoint stream --concurrency 16 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+API_PREFIX = "/api/v1"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (``q`` in 0..100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * q / 100) - 1, 0)]
+
+
+async def _chat(client: httpx.AsyncClient, message: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    response = await client.post(f"{API_PREFIX}/chat", json={"message": message, "use_cache": False})
+    latency = time.perf_counter() - start
+    ok = response.status_code == 200
+    tokens = len(response.json()["response"].split()) if ok else 0
+    return {"ok": ok, "status": response.status_code, "latency": latency, "ttft": None, "tokens": tokens}
+
+
+async def _stream(client: httpx.AsyncClient, message: str) -> Dict[str, Any]:
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+    ok = False
+    payload = {"message": message, "use_cache": False, "stream_protocol": 2}
+    async with client.stream("POST", f"{API_PREFIX}/chat/stream", json=payload) as response:
+        status = response.status_code
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("chunk"):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += 1
+            if event.get("done"):
+                ok = status == 200 and "error" not in event
+    return {"ok": ok, "status": status, "latency": time.perf_counter() - start, "ttft": ttft, "tokens": tokens}
+
+
+async def run_load(
+    base_url: str,
+    endpoint: str = "stream",
+    concurrency: int = 8,
+    requests: int = 100,
+    message: str = "Benchmark request",
+    transport: Optional[httpx.AsyncBaseTransport] = None
+) -> Dict[str, Any]:
+    """
+    Drive load against the API and summarize the results
+
+    Args:
+        base_url: API base URL (without the /api/v1 prefix)
+        endpoint: "chat" or "stream"
+        concurrency: Requests kept in flight
+        requests: Total requests to send
+        message: Message prefix; each request appends its index
+        transport: Optional httpx transport (e.g. ASGITransport in tests)
+
+    Returns:
+        Summary as returned by summarize()
+    """
+    call = _stream if endpoint == "stream" else _chat
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+    samples: List[Dict[str, Any]] = []
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits, transport=transport) as client:
+        async def worker():
+            while not queue.empty():
+                i = queue.get_nowait()
+                try:
+                    samples.append(await call(client, f"{message} #{i}"))
+                except httpx.HTTPError as e:
+                    samples.append({"ok": False, "status": None, "latency": None, "ttft": None,
+                                    "tokens": 0, "error": str(e)})
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+    return summarize(samples, elapsed, endpoint=endpoint, concurrency=concurrency)
+
+
+def summarize(samples: List[Dict[str, Any]], elapsed: float, **info) -> Dict[str, Any]:
+    """
+    Reduce per-request samples to latency percentiles and throughput
+
+    Returns:
+        Dictionary of metrics (seconds for latencies)
+    """
+    ok = [s for s in samples if s["ok"]]
+    latencies = [s["latency"] for s in ok]
+    ttfts = [s["ttft"] for s in ok if s["ttft"] is not None]
+    tokens = sum(s["tokens"] for s in ok)
+    summary = dict(info)
+    summary.update({
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(ok) / elapsed if elapsed else 0.0,
+        "tokens_per_second": tokens / elapsed if elapsed else 0.0,
+    })
+    for q in (50, 95, 99):
+        summary[f"latency_p{q}"] = percentile(latencies, q)
+        summary[f"ttft_p{q}"] = percentile(ttfts, q)
+    return summary
+
+
+def format_summary(name: str, summary: Dict[str, Any]) -> str:
+    """Render one summary as a short human-readable block"""
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    lines = [
+        f"{name}: {summary['requests']} requests, {summary['errors']} errors, "
+        f"{summary['requests_per_second']:.1f} req/s, {summary['tokens_per_second']:.0f} tokens/s",
+        "  latency p50/p95/p99: " + " / ".join(ms(summary[f"latency_p{q}"]) for q in (50, 95, 99)),
+    ]
+    if summary.get("ttft_p50") is not None:
+        lines.append("  ttft    p50/p95/p99: " + " / ".join(ms(summary[f"ttft_p{q}"]) for q in (50, 95, 99)))
+    if summary.get("server_cpu_percent") is not None:
+        lines.append(f"  server cpu {summary['server_cpu_percent']:.0f}%, "
+                     f"peak rss {summary['server_peak_rss_mb']:.1f}MB")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive load against a running API server")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=("chat", "stream"), default="stream")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    summary = asyncio.run(run_load(args.url, args.endpoint, args.concurrency, args.requests))
+    print(format_summary(args.endpoint, summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Search latency of the retrieval index on a synthetic corpus
+
+Builds a DocumentIndex of ``--chunks`` synthetic chunks (Zipf-distributed
+words, clustered random embeddings), merges the postings and clusters the
+vectors as the background rebuild would, then times hybrid searches. The
+query embedding call to Ollama is not included: only index work is
+timed. Recall compares the vector search with an exact scan.
+
+Usage (from the backend directory):
+    python -m benchmarks.retrieval --chunks 1000000 --dim 64
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any, Dict
+
+import numpy as np
+
+from app.services.retrieval import DocumentIndex
+from benchmarks.load import percentile
+
+
+def build_index(chunks: int, dim: int, words_per_chunk: int = 40, vocabulary: int = 50000,
+                seed: int = 0) -> DocumentIndex:
+    """Fill an in-memory index with ``chunks`` synthetic chunks, merged and clustered"""
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    centers = rng.normal(size=(max(chunks // 1000, 1), dim)).astype(np.float32)
+    index = DocumentIndex(chunks, ivf_min_chunks=min(20000, chunks))
+    batch = 10000
+    for start in range(0, chunks, batch):
+        size = min(batch, chunks - start)
+        ranks = np.minimum(rng.zipf(1.3, size=(size, words_per_chunk)), vocabulary) - 1
+        texts = [" ".join(row) for row in words[ranks]]
+        vectors = centers[rng.integers(len(centers), size=size)] + rng.normal(scale=0.5, size=(size, dim))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        index.add(f"doc{start // batch}", texts, vectors.astype(np.float32))
+    index.bm25.merge()
+    centroids, labels = index.vectors.cluster(index.count)
+    index.vectors.install(index.count, centroids, labels)
+    return index
+
+
+def run_retrieval_benchmark(chunks: int = 100000, dim: int = 64, queries: int = 200, k: int = 4,
+                            seed: int = 0) -> Dict[str, Any]:
+    """
+    Build a synthetic index and time ``queries`` hybrid searches
+
+    Returns:
+        Summary dict with build time, search latency percentiles (ms) and
+        vector recall@1 against an exact scan
+    """
+    start = time.perf_counter()
+    index = build_index(chunks, dim, seed=seed)
+    build_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed + 1)
+    rows = rng.integers(index.count, size=queries)
+    latencies = []
+    found = 0
+    for row in rows.tolist():
+        # A few words of a chunk and a nearby vector, as a paraphrase would give
+        query = " ".join(index.texts[row].split()[:6])
+        vector = index.vectors.vectors[row] + rng.normal(scale=0.01, size=dim).astype(np.float32)
+        vector /= np.linalg.norm(vector)
+        begin = time.perf_counter()
+        index.search(query, vector, k)
+        latencies.append((time.perf_counter() - begin) * 1000)
+        exact = int(np.argmax(index.vectors.vectors[:index.count] @ vector))
+        found += index.vectors.search(vector, index.live, 1) == [exact]
+
+    return {
+        "chunks": chunks,
+        "dim": dim,
+        "clusters": len(index.vectors.centroids),
+        "nprobe": index.vectors.nprobe,
+        "build_seconds": round(build_seconds, 2),
+        "search_ms_p50": round(percentile(latencies, 50), 3),
+        "search_ms_p99": round(percentile(latencies, 99), 3),
+        "search_ms_mean": round(statistics.mean(latencies), 3),
+        "vector_recall_at_1": round(found / queries, 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure retrieval search latency")
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+    print(json.dumps(run_retrieval_benchmark(args.chunks, args.dim, args.queries, args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
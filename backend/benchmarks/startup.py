@@ -0,0 +1,119 @@
+"""
+Cold-start time of the API: import, liveness and readiness
+
+Each run starts a fresh ``uvicorn app.main:app`` process against a fake
+Ollama server and polls /livez and /readyz until they answer 200. Import
+time is measured in a separate interpreter, which also reports whether
+heavy optional modules (numpy) were pulled in at import.
+
+Usage (from the backend directory):
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+from benchmarks.fake_ollama import run_fake_ollama
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = (
+    "import sys, time, json; start = time.perf_counter(); import app.main; "
+    "print(json.dumps({'import_ms': (time.perf_counter() - start) * 1000, "
+    "'numpy_imported': 'numpy' in sys.modules}))"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env: Dict[str, str]) -> Dict[str, Any]:
+    """Import app.main in a fresh interpreter and time it"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_boot(env: Dict[str, str], timeout: float = 30.0) -> Dict[str, Optional[float]]:
+    """
+    Start the server and time how long /livez and /readyz take to answer 200
+
+    Returns:
+        Milliseconds from process start to each probe passing (None on timeout)
+    """
+    port = _free_port()
+    command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning"]
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times: Dict[str, Optional[float]] = {"livez_ms": None, "readyz_ms": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+            for probe in ("livez", "readyz"):
+                while time.perf_counter() - start < timeout:
+                    try:
+                        if client.get(f"/{probe}").status_code == 200:
+                            times[f"{probe}_ms"] = (time.perf_counter() - start) * 1000
+                            break
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.005)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return times
+
+
+def run_startup_benchmark(runs: int = 3, extra_env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Median import, liveness and readiness times over ``runs`` cold starts
+
+    Returns:
+        Summary dict; probe times are None if a probe never passed
+    """
+    with run_fake_ollama(token_delay=0) as (url, _):
+        env = {**os.environ, "OLLAMA_HOST": url, "OLLAMA_HOSTS": "[]", **(extra_env or {})}
+        imports = [measure_import(env) for _ in range(runs)]
+        boots = [measure_boot(env) for _ in range(runs)]
+
+    def median(values):
+        values = [value for value in values if value is not None]
+        return round(statistics.median(values), 1) if len(values) == runs else None
+
+    return {
+        "runs": runs,
+        "import_ms": median([result["import_ms"] for result in imports]),
+        "livez_ms": median([boot["livez_ms"] for boot in boots]),
+        "readyz_ms": median([boot["readyz_ms"] for boot in boots]),
+        "numpy_imported": any(result["numpy_imported"] for result in imports)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API cold-start time")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra settings for the server, e.g. SEMANTIC_CACHE_ENABLED=true")
+    args = parser.parse_args()
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    print(json.dumps(run_startup_benchmark(args.runs, extra_env), indent=2))
+
+
+if __name__ == "__main__":
+    main()
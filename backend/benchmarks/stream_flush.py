@@ -0,0 +1,128 @@
+"""
+Streams per worker on the /chat/stream path, per token vs coalesced frames
+
+Simulates concurrent streams receiving tokens at a fixed rate and pushes
+them through the pipeline the API uses: metrics, the stream registry
+(which coalesces tokens) and SSE encoding. The process CPU time per token gives the
+number of such streams one worker can sustain before it is saturated.
+No network is involved, so the numbers show the Python overhead only;
+run benchmarks.suite with --env STREAM_FLUSH_TOKENS=8 for the end-to-end view.
+
+Usage (from the backend directory):
+    python -m benchmarks.stream_flush --streams 200 --tokens 100 --tokens-per-second 50
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+
+from app.api.streaming import encode_sse
+from app.services.metrics import metrics
+from app.services.stream_registry import StreamRegistry
+
+MODEL = "benchmark"
+
+# (name, max_tokens, max_bytes, max_ms)
+POLICIES = [
+    ("per-token", 1, 1024, 50.0),
+    ("coalesced", 8, 1024, 50.0),
+]
+
+
+async def _tokens(count: int, delay: float) -> AsyncIterator[Dict[str, Any]]:
+    for i in range(count):
+        await asyncio.sleep(delay)
+        yield {"chunk": f" tok{i}", "model": MODEL, "success": True, "done": False}
+    yield {
+        "chunk": "",
+        "response": "".join(f" tok{i}" for i in range(count)),
+        "model": MODEL,
+        "timestamp": datetime.now().isoformat(),
+        "success": True,
+        "done": True
+    }
+
+
+async def _stream(registry: StreamRegistry, index: int, tokens: int, delay: float) -> Dict[str, Any]:
+    events = metrics.track_stream(MODEL, _tokens(tokens, delay))
+    frames = written = 0
+    text: List[str] = []
+    guarded = registry.guard(f"bench-{index}", MODEL, events, meta={"protocol": 2}, heartbeats=True)
+    async for frame in encode_sse(guarded, protocol=2):
+        frames += 1  # one socket write each in the real server
+        written += len(frame)
+        data = frame.partition("data: ")[2]
+        if data:
+            text.append(json.loads(data).get("chunk", ""))
+    return {"frames": frames, "bytes": written, "text": "".join(text)}
+
+
+async def _run(streams: int, tokens: int, tokens_per_second: float,
+               max_tokens: int, max_bytes: int, max_ms: float) -> Dict[str, Any]:
+    registry = StreamRegistry(replay_ttl=0, flush_tokens=max_tokens, flush_bytes=max_bytes, flush_ms=max_ms)
+    delay = 1.0 / tokens_per_second
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*[_stream(registry, i, tokens, delay) for i in range(streams)])
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    expected = "".join(f" tok{i}" for i in range(tokens))
+    total_tokens = streams * tokens
+    cpu_per_token = cpu / total_tokens
+    return {
+        "streams": streams,
+        "tokens": total_tokens,
+        "frames": sum(r["frames"] for r in results),
+        "bytes": sum(r["bytes"] for r in results),
+        "intact": all(r["text"] == expected for r in results),
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "cpu_us_per_token": cpu_per_token * 1e6,
+        # Streams at this token rate that would keep one worker 100% busy
+        "sustainable_streams": 1 / (cpu_per_token * tokens_per_second) if cpu_per_token else None
+    }
+
+
+def run_stream_benchmark(streams: int = 200, tokens: int = 100, tokens_per_second: float = 50.0,
+                         max_tokens: int = 1, max_bytes: int = 1024, max_ms: float = 50.0) -> Dict[str, Any]:
+    """
+    Measure one flush policy
+
+    Args:
+        streams: Concurrent streams
+        tokens: Tokens per stream
+        tokens_per_second: Token rate of each stream
+        max_tokens, max_bytes, max_ms: Flush policy (see StreamRegistry)
+
+    Returns:
+        Frames, bytes, CPU per token and the sustainable stream estimate
+    """
+    return asyncio.run(_run(streams, tokens, tokens_per_second, max_tokens, max_bytes, max_ms))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-token and coalesced stream frames")
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=100, help="tokens per stream")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="per stream")
+    parser.add_argument("--flush-tokens", type=int, default=8)
+    parser.add_argument("--flush-bytes", type=int, default=1024)
+    parser.add_argument("--flush-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    policies = [POLICIES[0], ("coalesced", args.flush_tokens, args.flush_bytes, args.flush_ms)]
+    for name, max_tokens, max_bytes, max_ms in policies:
+        result = run_stream_benchmark(args.streams, args.tokens, args.tokens_per_second,
+                                      max_tokens, max_bytes, max_ms)
+        print(
+            f"{name}: {result['frames']} frames, {result['bytes'] / 1024:.0f}KB, "
+            f"{result['cpu_us_per_token']:.1f}us CPU/token, "
+            f"~{result['sustainable_streams']:.0f} streams/worker at {args.tokens_per_second:g} tokens/s"
+            + ("" if result["intact"] else " (TEXT MISMATCH)")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare /chat/stream wire protocols on a synthetic 1k-token answer
+
+Measures bytes on the wire and encoder CPU time for protocol 1 (full
+response resent per event) and protocol 2 (delta-only events).
+
+Usage (from the backend directory):
+    python -m benchmarks.stream_protocol --tokens 1000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from app.api.streaming import encode_stream
+
+
+async def synthetic_events(tokens: int, model: str = "mistral:latest"):
+    """Yield service events shaped like OllamaService.stream_response"""
+    parts = []
+    for i in range(tokens):
+        content = f" w{i % 1000:03d}"
+        parts.append(content)
+        yield {"chunk": content, "model": model, "success": True, "done": False}
+    yield {
+        "chunk": "",
+        "response": "".join(parts),
+        "model": model,
+        "timestamp": datetime.now().isoformat(),
+        "success": True,
+        "done": True
+    }
+
+
+async def measure(protocol: int, tokens: int):
+    """Return (bytes, cpu_seconds) for one encoded answer"""
+    total = 0
+    start = time.process_time()
+    async for frame in encode_stream(synthetic_events(tokens), protocol):
+        total += len(frame.encode("utf-8"))
+    return total, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tokens", type=int, default=1000, help="tokens per answer")
+    parser.add_argument("--repeat", type=int, default=20, help="answers per protocol")
+    args = parser.parse_args()
+
+    print(f"Answer length: {args.tokens} tokens, {args.repeat} runs per protocol")
+    print(f"{'protocol':>8} {'bytes/answer':>14} {'cpu ms/answer':>14}")
+    for protocol in (1, 2):
+        results = [asyncio.run(measure(protocol, args.tokens)) for _ in range(args.repeat)]
+        size = results[0][0]
+        cpu_ms = min(cpu for _, cpu in results) * 1000
+        print(f"{protocol:>8} {size:>14,} {cpu_ms:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+End-to-end latency benchmark against a fake Ollama server
+
+Starts the fake Ollama server and the API server (as a separate uvicorn
+process pointed at it), drives /chat and /chat/stream at the requested
+concurrency and reports p50/p95/p99 latency, time to first token,
+throughput and the API server's CPU and peak memory. Results can be saved
+as a baseline and later runs compared against it to catch regressions.
+
+Usage (from the backend directory):
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --compare
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .fake_ollama import run_fake_ollama
+from .load import format_summary, run_load
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Metrics where a higher value is a regression; all others regress downwards
+LOWER_IS_BETTER = (
+    "latency_p50", "latency_p95", "latency_p99",
+    "ttft_p50", "ttft_p95", "ttft_p99",
+    "server_cpu_seconds", "server_peak_rss_mb",
+)
+HIGHER_IS_BETTER = ("requests_per_second", "tokens_per_second")
+
+
+class ProcessSampler:
+    """CPU time and memory of a process, read from /proc (Linux only)"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self) -> Optional[float]:
+        try:
+            fields = Path(f"/proc/{self.pid}/stat").read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            return None
+        # utime and stime are fields 14 and 15 of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def peak_rss_mb(self) -> Optional[float]:
+        try:
+            for line in Path(f"/proc/{self.pid}/status").read_text().splitlines():
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api_server(ollama_url: str, port: int, env: Dict[str, str]) -> subprocess.Popen:
+    """Run the API in its own process so its CPU and memory can be measured"""
+    server_env = dict(os.environ)
+    server_env.update({"OLLAMA_HOST": ollama_url, "CACHE_ENABLED": "False"})
+    server_env.update(env)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=server_env
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/ping", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("API server did not start")
+
+
+def run_suite(args) -> Dict[str, Any]:
+    """Run every scenario and return {scenario: summary}"""
+    fake_options = dict(
+        tokens_per_second=args.tokens_per_second,
+        first_token_delay=args.first_token_delay,
+        num_tokens=args.num_tokens,
+        failure_rate=args.failure_rate,
+        seed=0
+    )
+    env = dict(item.split("=", 1) for item in args.env)
+    results: Dict[str, Any] = {}
+    with run_fake_ollama(**fake_options) as (ollama_url, _):
+        port = free_port()
+        process = start_api_server(ollama_url, port, env)
+        try:
+            sampler = ProcessSampler(process.pid)
+            url = f"http://127.0.0.1:{port}"
+            # Warm up connections and lazy initialisation outside the measurement
+            asyncio.run(run_load(url, "chat", 2, 4, message="warmup"))
+            for endpoint in args.endpoints:
+                cpu_before = sampler.cpu_seconds()
+                summary = asyncio.run(run_load(url, endpoint, args.concurrency, args.requests))
+                cpu_after = sampler.cpu_seconds()
+                if cpu_before is not None and cpu_after is not None:
+                    summary["server_cpu_seconds"] = cpu_after - cpu_before
+                    summary["server_cpu_percent"] = 100 * summary["server_cpu_seconds"] / summary["elapsed_seconds"]
+                summary["server_peak_rss_mb"] = sampler.peak_rss_mb()
+                results[endpoint] = summary
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    return {
+        "config": {
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "tokens_per_second": args.tokens_per_second,
+            "first_token_delay": args.first_token_delay,
+            "num_tokens": args.num_tokens,
+            "failure_rate": args.failure_rate,
+        },
+        "results": results
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Compare a run against the baseline
+
+    Args:
+        baseline: Saved run
+        current: New run
+        tolerance: Allowed relative change (0.25 = 25%)
+
+    Returns:
+        Human-readable regressions (empty if none)
+    """
+    regressions = []
+    for scenario, expected in baseline.get("results", {}).items():
+        actual = current.get("results", {}).get(scenario)
+        if actual is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = expected.get(metric), actual.get(metric)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / old
+            if metric in LOWER_IS_BETTER and change > tolerance:
+                regressions.append(f"{scenario}.{metric}: {old:.4g} -> {new:.4g} (+{change:.0%})")
+            elif metric in HIGHER_IS_BETTER and change < -tolerance:
+                regressions.append(f"{scenario}.{metric}: {old:.4g} -> {new:.4g} ({change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against a fake Ollama server")
+    parser.add_argument("--endpoints", nargs="+", choices=("chat", "stream"), default=["chat", "stream"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.05, help="seconds")
+    parser.add_argument("--num-tokens", type=int, default=50, help="tokens per answer")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE",
+                        help="extra settings for the API server, e.g. SCHEDULER_DEFAULT_CONCURRENCY=32")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the baseline")
+    parser.add_argument("--compare", action="store_true", help="fail if worse than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--json", action="store_true", help="print the raw results as JSON")
+    args = parser.parse_args()
+
+    current = run_suite(args)
+    if args.json:
+        print(json.dumps(current, indent=2))
+    else:
+        for scenario, summary in current["results"].items():
+            print(format_summary(scenario, summary))
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(current, indent=2) + "\n")
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("config") != current["config"]:
+            print("Warning: baseline was recorded with a different configuration")
+        regressions = compare(baseline, current, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_ollama import run_fake_ollama
+from app.services import ollama_service, response_cache, stream_registry
+from app.services.backend_pool import BackendPool
+
+
+@pytest.fixture(autouse=True)
+def not_draining():
+    """Each test starts with a serving app (a lifespan shutdown leaves it draining, like a worker about to exit)"""
+    stream_registry.draining = False
+
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    """
+    Point the global OllamaService at fake Ollama servers (with a cold cache)
+
+    Each call starts one more server; the service balances across all of them.
+    """
+    def start(**kwargs):
+        server = run_fake_ollama(**kwargs)
+        url, app = server.__enter__()
+        started.append(server)
+        urls.append(url)
+        monkeypatch.setattr(ollama_service, "pool", BackendPool(urls, health_interval=0))
+        return app
+
+    started = []
+    urls = []
+    asyncio.run(response_cache.clear())
+    yield start
+    for server in started:
+        server.__exit__(None, None, None)
@@ -0,0 +1,128 @@
+"""
+Run a JSONL file of chat requests through /chat/batch
+
+Results are appended to the output file as they arrive, so the output
+doubles as the checkpoint: running the same command again only sends the
+items that do not have a successful result yet.
+
+Usage:
+    python run_batch.py prompts.jsonl results.jsonl --concurrency 8
+
+Each input line is a chat request, e.g.
+    {"id": "q1", "message": "Summarize ...", "model": "mistral:latest"}
+Lines without an ``id`` are identified by their line number.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Set
+
+import httpx
+
+
+def load_items(path: str) -> List[Dict[str, Any]]:
+    """Read input requests, giving every item an ID"""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", number)
+            items.append(item)
+    return items
+
+
+def completed_ids(path: str) -> Set[str]:
+    """IDs with a successful result in an existing output file"""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # line cut short by an interrupted run
+            if result.get("success"):
+                done.add(json.dumps(result.get("id")))
+    return done
+
+
+def run_batch(url: str, items: List[Dict[str, Any]], output: str, concurrency: int) -> Dict[str, Any]:
+    """
+    Send ``items`` to the server and append each result to ``output``
+
+    Returns:
+        The server's summary line (empty if the connection dropped)
+    """
+    body = "".join(json.dumps(item) + "\n" for item in items)
+    summary: Dict[str, Any] = {}
+    if os.path.exists(output) and os.path.getsize(output) > 0:
+        with open(output, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")  # close the line an interrupted run cut short
+    with open(output, "a", encoding="utf-8") as out, httpx.Client(timeout=None) as client:
+        with client.stream(
+            "POST",
+            f"{url.rstrip('/')}/api/v1/chat/batch",
+            params={"concurrency": concurrency},
+            content=body.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if "summary" in result:
+                    summary = result["summary"]
+                    continue
+                out.write(line + "\n")
+                out.flush()  # checkpoint every result
+                status = "ok" if result["success"] else f"error: {result['error']}"
+                print(f"[{result['id']}] {status}", file=sys.stderr)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run JSONL chat requests through /chat/batch")
+    parser.add_argument("input", help="JSONL file of chat requests")
+    parser.add_argument("output", help="JSONL file results are appended to (also the checkpoint)")
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="API server base URL")
+    parser.add_argument("--concurrency", type=int, default=4, help="items run in parallel")
+    parser.add_argument("--restart", action="store_true", help="ignore earlier results and run everything")
+    args = parser.parse_args()
+
+    items = load_items(args.input)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = completed_ids(args.output)
+    pending = [item for item in items if json.dumps(item["id"]) not in done]
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(pending)} to run", file=sys.stderr)
+    if not pending:
+        return
+
+    start = time.perf_counter()
+    try:
+        summary = run_batch(args.url, pending, args.output, args.concurrency)
+    except (httpx.HTTPError, KeyboardInterrupt) as e:
+        print(f"Interrupted ({e or 'cancelled'}); run again to resume", file=sys.stderr)
+        sys.exit(1)
+
+    print(
+        f"{summary.get('succeeded', 0)}/{summary.get('items', len(pending))} succeeded in "
+        f"{time.perf_counter() - start:.1f}s, {summary.get('tokens', 0)} tokens, "
+        f"{summary.get('tokens_per_second', 0.0)} tokens/s",
+        file=sys.stderr
+    )
+    if summary.get("failed"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,115 @@
+import argparse
+import asyncio
+import logging
 import sys
 import os
+from typing import Optional
+
 import uvicorn
 
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from app.core.config import settings
+
+logger = logging.getLogger("run_server")
+
+
+def available_cores() -> int:
+    """CPU cores this process may run on (respects affinity and cpusets)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def worker_count(requested: int) -> int:
+    """Resolve a worker count setting, 0 meaning one per core"""
+    return requested if requested > 0 else available_cores()
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that drains before it stops listening
+
+    uvicorn closes its listening socket as soon as SIGTERM arrives and only
+    then runs the lifespan shutdown, so a load balancer would see refused
+    connections rather than a failing /readyz. Here the first SIGTERM or
+    SIGINT only marks the worker as draining: /readyz answers 503 and new
+    streams are refused while those in flight finish (for up to
+    SHUTDOWN_DRAIN_TIMEOUT seconds), then the server shuts down as usual.
+    A second signal skips the wait.
+    """
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self._drain: Optional[asyncio.Task] = None
+        self._draining = False
+
+    def handle_exit(self, sig, frame):
+        if self.should_exit or self._draining:
+            super().handle_exit(sig, frame)
+            return
+        # The worker's app, imported by uvicorn before it installed the signal handlers
+        from app.services import stream_registry
+
+        self._draining = True
+        stream_registry.draining = True
+        asyncio.get_event_loop().call_soon_threadsafe(self._start_drain, stream_registry, sig)
+
+    def _start_drain(self, registry, sig):
+        self._drain = asyncio.get_running_loop().create_task(self._drain_then_exit(registry, sig))
+
+    async def _drain_then_exit(self, registry, sig):
+        try:
+            stopped = await registry.drain(settings.shutdown_drain_timeout)
+            if stopped:
+                logger.warning("Stopped %d streams still running after %ss", stopped, settings.shutdown_drain_timeout)
+        finally:
+            super().handle_exit(sig, None)
+
+
+def serve(config: uvicorn.Config):
+    """Run ``config`` like ``uvicorn.run`` does, with a DrainingServer per worker"""
+    server = DrainingServer(config)
+    if config.workers > 1:
+        from uvicorn.supervisors import Multiprocess
+
+        Multiprocess(config, target=server.run, sockets=[config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Ollama Chat API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--production", action="store_true",
+                        help="several worker processes, no auto-reload, graceful drain on shutdown")
+    parser.add_argument("--workers", type=int, default=settings.workers,
+                        help="worker processes in production mode (0 = one per CPU core)")
+    args = parser.parse_args()
+
+    if not args.production:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
+        return
+
+    workers = worker_count(args.workers)
+    if workers > 1 and not settings.shared_state_url:
+        logger.warning(
+            "Running %d workers without SHARED_STATE_URL: caches, sessions and scheduler "
+            "limits are per worker", workers
+        )
+    # Workers read their settings from the environment; each takes its share of the slots
+    os.environ["WORKERS"] = str(workers)
+    serve(uvicorn.Config(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        reload=False,
+        timeout_graceful_shutdown=settings.shutdown_drain_timeout
+    ))
+
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8001, reload=True)
+    main()
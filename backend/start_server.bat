@@ -10,10 +10,10 @@ call .venv\Scripts\activate.bat
 
 REM Check if packages are installed
 echo 📦 Checking dependencies...
-python -c "import fastapi, uvicorn, ollama; print('✅ All packages installed')" 2>nul
+python -c "import fastapi, uvicorn, httpx; print('✅ All packages installed')" 2>nul
 if errorlevel 1 (
     echo ⚠️  Installing missing packages...
-    pip install fastapi uvicorn pydantic pydantic-settings ollama httpx python-multipart
+    pip install -r requirements.txt
 )
 
 REM Start the server
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+from app.services import ollama_service
+from app.services.backend_pool import BackendPool, CircuitBreaker
+from app.services.hedging import HedgePolicy
+
+
+def test_requests_spread_across_nodes(fake_ollama):
+    """Concurrent requests go to the node with the fewest outstanding requests"""
+    first = fake_ollama(token_delay=0.05)
+    second = fake_ollama(token_delay=0.05)
+
+    async def run():
+        return await asyncio.gather(*[
+            ollama_service.generate_response(f"q{i}") for i in range(4)
+        ])
+
+    results = asyncio.run(run())
+    assert all(r["success"] for r in results)
+    assert len(first.state.requests) == 2
+    assert len(second.state.requests) == 2
+
+
+def test_prefers_node_with_model_loaded(fake_ollama):
+    """Nodes that report the model in /api/ps win over cold nodes"""
+    cold = fake_ollama(loaded=[])
+    warm = fake_ollama(loaded=["mistral:latest"])
+
+    async def run():
+        await ollama_service.pool.refresh()
+        for i in range(3):
+            await ollama_service.generate_response(f"q{i}", model="mistral:latest")
+
+    asyncio.run(run())
+    assert len(warm.state.requests) == 3
+    assert len(cold.state.requests) == 0
+
+
+def test_failover_to_next_node_before_first_token(fake_ollama):
+    """A node that errors before streaming anything is skipped"""
+    broken = fake_ollama(error="model crashed")
+    healthy = fake_ollama(tokens=["ok"])
+
+    async def run():
+        events = []
+        for _ in range(2):
+            async for event in ollama_service.stream_response("hi"):
+                events.append(event)
+        return events
+
+    events = asyncio.run(run())
+    finals = [e for e in events if e["done"]]
+    assert [e["success"] for e in finals] == [True, True]
+    assert all(e["response"] == "ok" for e in finals)
+    assert len(healthy.state.requests) == 2
+    assert ollama_service.pool.backends[0].failures >= 1
+
+
+def test_unreachable_node_marked_down(monkeypatch):
+    """Connection errors mark a node unhealthy so it is skipped next time"""
+    pool = BackendPool(["http://127.0.0.1:1"], health_interval=0)
+    monkeypatch.setattr(ollama_service, "pool", pool)
+
+    result = asyncio.run(ollama_service.generate_response("hi"))
+    assert result["success"] is False
+    assert pool.backends[0].healthy is False
+    assert pool.stats()["backends"][0]["failures"] == 1
+
+
+def test_pick_round_robins_between_equal_nodes():
+    pool = BackendPool(["http://a", "http://b"], health_interval=0)
+    picks = {pool.pick("m").host for _ in range(4)}
+    assert picks == {"http://a", "http://b"}
+
+
+def test_circuit_opens_on_failures_and_closes_after_a_good_probe():
+    breaker = CircuitBreaker(window=4, min_calls=2, failure_ratio=0.5, slow_seconds=1.0, open_seconds=0.05)
+    breaker.record(True, 0.1)
+    breaker.record(True, 5.0)  # slow first token
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open" and breaker.allow()
+    breaker.acquire()
+    assert not breaker.allow()  # one probe at a time
+    breaker.record(False)
+    assert breaker.state == "open" and breaker.opens == 2
+
+    time.sleep(0.06)
+    breaker.acquire()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_open_circuit_stops_traffic_to_a_failing_node(fake_ollama):
+    broken = fake_ollama(error="model crashed", loaded=["mistral:latest"])
+    healthy = fake_ollama(tokens=["ok"], loaded=["mistral:latest"])
+    for backend in ollama_service.pool.backends:
+        backend.breaker = CircuitBreaker(window=4, min_calls=2, open_seconds=60, name=backend.host)
+    circuit = ollama_service.pool.backends[0].breaker
+
+    async def run():
+        await ollama_service.pool.refresh()  # both nodes have the model loaded
+        results = []
+        while circuit.state == "closed" and len(results) < 20:
+            results.append(await ollama_service.generate_response("q"))
+        failed_over = len(broken.state.requests)
+        results += [await ollama_service.generate_response(f"q{i}") for i in range(6)]
+        return results, failed_over
+
+    results, failed_over = asyncio.run(run())
+    assert all(r["success"] for r in results)  # failures went to the healthy node
+    assert circuit.state == "open" and failed_over == 2
+    assert len(broken.state.requests) == failed_over  # nothing more once open
+    assert ollama_service.pool.stats()["backends"][0]["circuit"]["state"] == "open"
+
+
+def test_late_first_token_is_hedged_on_another_node(fake_ollama, monkeypatch):
+    slow = fake_ollama(first_token_delay=3.0, loaded=["mistral:latest"])
+    fast = fake_ollama(token_delay=0, loaded=[])
+    monkeypatch.setattr(ollama_service, "hedging", HedgePolicy(default_delay=0.1))
+
+    async def run():
+        await ollama_service.pool.refresh()  # the slow node has the model loaded, so it is picked first
+        start = time.perf_counter()
+        result = await ollama_service.generate_response("hi")
+        elapsed = time.perf_counter() - start
+        await asyncio.sleep(0.1)
+        return result, elapsed
+
+    result, elapsed = asyncio.run(run())
+    assert result["success"] and elapsed < 1.5
+    assert len(slow.state.requests) == len(fast.state.requests) == 1
+    assert slow.state.calls == []  # the losing generation was cancelled
+    assert ollama_service.hedging.stats()["hedges_won"] == 1
+    assert [b.outstanding for b in ollama_service.pool.backends] == [0, 0]
+
+
+def test_hedge_budget_caps_extra_requests(fake_ollama, monkeypatch):
+    first = fake_ollama(first_token_delay=0.2, token_delay=0)
+    second = fake_ollama(first_token_delay=0.2, token_delay=0)
+    monkeypatch.setattr(ollama_service, "hedging", HedgePolicy(default_delay=0.05, budget_ratio=0.0, budget_burst=1))
+
+    async def run():
+        return [await ollama_service.generate_response(f"q{i}") for i in range(4)]
+
+    assert all(r["success"] for r in asyncio.run(run()))
+    stats = ollama_service.hedging.stats()
+    assert stats["hedged"] == 1 and stats["denied_by_budget"] == 3
+    assert len(first.state.requests) + len(second.state.requests) == 5
+
+
+def test_stalled_node_times_out_instead_of_waiting_forever(fake_ollama, monkeypatch):
+    fake_ollama(first_token_delay=5.0)
+    monkeypatch.setattr(ollama_service, "first_token_timeout", 0.2)
+
+    start = time.perf_counter()
+    result = asyncio.run(ollama_service.generate_response("hi"))
+    assert time.perf_counter() - start < 2.0
+    assert result["success"] is False
+    assert "No response from" in result["error"]
+    assert ollama_service.pool.backends[0].failures == 1
@@ -0,0 +1,112 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import run_batch
+from app.main import app
+from app.services import rate_limiter
+from app.services.rate_limiter import TokenBuckets
+from benchmarks.fake_ollama import serve_app
+
+
+def post_batch(client, lines, **params):
+    body = "".join(line + "\n" for line in lines)
+    response = client.post("/api/v1/chat/batch", content=body, params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def max_overlap(calls):
+    edges = sorted([(start, 1) for start, _ in calls] + [(end, -1) for _, end in calls])
+    running = peak = 0
+    for _, step in edges:
+        running += step
+        peak = max(peak, running)
+    return peak
+
+
+def test_batch_streams_results_then_summary(fake_ollama):
+    fake_ollama(tokens=["one ", "two"])
+    lines = [
+        json.dumps({"id": "a", "message": "batch question a"}),
+        json.dumps({"message": "batch question b"}),
+        "not json",
+        json.dumps({"id": "d", "message": "batch question d", "session_id": "bad id!"}),
+    ]
+    with TestClient(app) as client:
+        results = post_batch(client, lines)
+
+    summary = results.pop()["summary"]
+    by_id = {result["id"]: result for result in results}
+    assert set(by_id) == {"a", 1, 2, "d"}
+    assert by_id["a"]["success"] and by_id["a"]["response"] == "one two"
+    assert by_id["a"]["tokens"] == 2
+    assert by_id[1]["index"] == 1
+    assert by_id[2]["error"].startswith("Invalid JSON")
+    assert by_id["d"]["error"].startswith("Invalid request")
+    assert summary["items"] == 4
+    assert summary["succeeded"] == 2 and summary["failed"] == 2
+    assert summary["tokens"] == 4
+    assert summary["tokens_per_second"] > 0
+
+
+def test_batch_bounds_parallelism(fake_ollama):
+    fake = fake_ollama(tokens=["x"] * 5, token_delay=0.02)
+    lines = [json.dumps({"message": f"parallel question {i}", "use_cache": False}) for i in range(8)]
+    with TestClient(app) as client:
+        results = post_batch(client, lines, concurrency=2)
+
+    assert results[-1]["summary"]["succeeded"] == 8
+    assert len(fake.state.calls) == 8
+    assert max_overlap(fake.state.calls) <= 2
+
+
+def test_batch_rejects_empty_and_oversized_input(fake_ollama, monkeypatch):
+    fake_ollama()
+    with TestClient(app) as client:
+        assert client.post("/api/v1/chat/batch", content="\n\n").status_code == 400
+        from app.core.config import settings
+        monkeypatch.setattr(settings, "batch_max_items", 1)
+        body = "\n".join(json.dumps({"message": f"q{i}"}) for i in range(2))
+        assert client.post("/api/v1/chat/batch", content=body).status_code == 413
+
+
+def test_cli_checkpoint_skips_completed_items(fake_ollama, tmp_path):
+    fake = fake_ollama(tokens=["done"])
+    source = tmp_path / "in.jsonl"
+    output = tmp_path / "out.jsonl"
+    source.write_text("".join(json.dumps({"message": f"cli question {i}"}) + "\n" for i in range(4)))
+    # An earlier run finished item 1 and failed item 2
+    output.write_text(
+        json.dumps({"id": 1, "success": True, "response": "done"}) + "\n"
+        + json.dumps({"id": 2, "success": False, "error": "boom"}) + "\n"
+        + '{"id": 3, "succ'
+    )
+
+    items = run_batch.load_items(str(source))
+    done = run_batch.completed_ids(str(output))
+    pending = [item for item in items if json.dumps(item["id"]) not in done]
+    assert [item["id"] for item in pending] == [2, 3, 4]
+
+    with serve_app(app, lifespan="on") as url:
+        summary = run_batch.run_batch(url, pending, str(output), concurrency=2)
+
+    assert summary["succeeded"] == 3
+    assert len(fake.state.requests) == 3
+    assert run_batch.completed_ids(str(output)) == {"1", "2", "3", "4"}
+
+
+def test_token_quota_applies_to_each_item(fake_ollama, monkeypatch):
+    fake = fake_ollama(num_tokens=40, token_delay=0)
+    monkeypatch.setattr(rate_limiter, "tokens", TokenBuckets(rate=0.01, burst=20))
+    lines = [json.dumps({"id": i, "message": f"long answer {i}", "use_cache": False}) for i in range(5)]
+    with TestClient(app) as client:
+        results = post_batch(client, lines, concurrency=1)
+
+    summary = results.pop()["summary"]
+    assert summary["succeeded"] == 1
+    limited = [r for r in results if not r["success"]]
+    assert len(limited) == 4
+    assert all(r["error"] == "Rate limit exceeded: tokens" and r["retry_after"] >= 1 for r in limited)
+    assert len(fake.state.requests) == 1
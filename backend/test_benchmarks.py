@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+
+from app.main import app
+from benchmarks.fake_ollama import run_fake_ollama
+from benchmarks.load import percentile, run_load
+from benchmarks.retrieval import run_retrieval_benchmark
+from benchmarks.startup import run_startup_benchmark
+from benchmarks.stream_flush import run_stream_benchmark
+from benchmarks.suite import compare
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {"results": {"stream": {"latency_p95": 1.0, "tokens_per_second": 100.0, "ttft_p50": 0.1}}}
+    current = {"results": {"stream": {"latency_p95": 1.5, "tokens_per_second": 95.0, "ttft_p50": 0.05}}}
+    regressions = compare(baseline, current, tolerance=0.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("stream.latency_p95")
+
+
+def test_fake_ollama_failure_injection_is_deterministic():
+    def statuses():
+        with run_fake_ollama(failure_rate=0.5, seed=7, token_delay=0) as (url, _):
+            return [
+                httpx.post(f"{url}/api/chat", json={"model": "m", "stream": False}).status_code
+                for _ in range(10)
+            ]
+
+    first = statuses()
+    assert first == statuses()
+    assert set(first) == {200, 500}
+
+
+def test_fake_ollama_first_token_delay_and_rate():
+    with run_fake_ollama(first_token_delay=0.1, tokens_per_second=100, num_tokens=5) as (url, app):
+        response = httpx.post(f"{url}/api/chat", json={"model": "m", "stream": False})
+    assert response.json()["message"]["content"] == " t0 t1 t2 t3 t4"
+    start, end = app.state.calls[0]
+    assert end - start >= 0.15
+
+
+def test_load_driver_reports_percentiles(fake_ollama):
+    fake_ollama(token_delay=0.001)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        return await run_load("http://test", "stream", concurrency=4, requests=8, transport=transport)
+
+    summary = asyncio.run(run())
+    assert summary["requests"] == 8
+    assert summary["errors"] == 0
+    assert summary["latency_p50"] <= summary["latency_p99"]
+    assert summary["ttft_p50"] is not None
+    assert summary["tokens_per_second"] > 0
+
+
+def test_stream_flush_benchmark_coalesces_without_losing_text():
+    per_token = run_stream_benchmark(streams=5, tokens=20, tokens_per_second=1000)
+    coalesced = run_stream_benchmark(streams=5, tokens=20, tokens_per_second=1000, max_tokens=4)
+    assert per_token["intact"] and coalesced["intact"]
+    assert per_token["frames"] == 5 * 21
+    assert coalesced["frames"] < per_token["frames"]
+    assert coalesced["sustainable_streams"] > 0
+
+
+def test_startup_benchmark_reaches_readiness():
+    result = run_startup_benchmark(runs=1)
+    assert result["livez_ms"] is not None
+    assert result["readyz_ms"] >= result["livez_ms"]
+    assert result["numpy_imported"] is False
+
+
+def test_retrieval_benchmark_reports_latency_and_recall():
+    result = run_retrieval_benchmark(chunks=5000, dim=16, queries=20)
+    assert result["clusters"] > 1
+    assert result["search_ms_p50"] <= result["search_ms_p99"]
+    assert result["vector_recall_at_1"] >= 0.9
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import httpx
+
+from app.main import app
+from app.services import scheduler, stream_registry
+from app.services.stream_registry import StreamRegistry
+from benchmarks.fake_ollama import serve_app
+
+
+async def slow_events(closed, count=100, delay=0.01):
+    try:
+        for i in range(count):
+            await asyncio.sleep(delay)
+            yield {"chunk": f"t{i}", "model": "m", "success": True, "done": False}
+        yield {"chunk": "", "response": "...", "model": "m", "success": True, "done": True}
+    finally:
+        closed.append(time.perf_counter())
+
+
+def test_closing_the_stream_stops_upstream_and_estimates_savings():
+    registry = StreamRegistry()
+
+    async def run():
+        closed = []
+        # One complete answer teaches the registry the typical length (10 tokens)
+        async for _ in registry.guard("a", "m", slow_events(closed, count=10, delay=0)):
+            pass
+
+        stream = registry.guard("b", "m", slow_events(closed, count=100))
+        async for event in stream:
+            if event["chunk"] == "t2":
+                break
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        return closed
+
+    closed = asyncio.run(run())
+    assert len(closed) == 2  # the upstream generator was closed, not left running
+    stats = registry.stats()
+    assert stats["completed"] == 1
+    assert stats["disconnected"] == 1
+    assert stats["tokens_saved"] == 7
+    assert stats["active"] == 0
+
+
+def test_cancel_by_request_id_ends_stream_with_error():
+    registry = StreamRegistry()
+
+    async def run():
+        closed = []
+        events = []
+        async for event in registry.guard("req-1", "m", slow_events(closed)):
+            events.append(event)
+            if len(events) == 3:
+                assert registry.cancel("req-1")
+        return events, closed
+
+    events, closed = asyncio.run(run())
+    assert events[-1]["success"] is False
+    assert events[-1]["error"] == "Request cancelled"
+    assert len(events) < 10
+    assert closed
+    assert registry.stats()["cancelled"] == 1
+    assert registry.cancel("req-1") is False
+
+
+def test_client_disconnect_aborts_ollama_generation(fake_ollama, monkeypatch):
+    fake = fake_ollama(tokens=[f" t{i}" for i in range(200)], token_delay=0.01)
+    # No resume window: stop as soon as the client is gone
+    monkeypatch.setattr(stream_registry, "resume_grace", 0)
+
+    with serve_app(app, lifespan="on") as url:
+        with httpx.Client(base_url=url) as client:
+            payload = {"message": "disconnect me", "use_cache": False, "stream_protocol": 2}
+            with client.stream("POST", "/api/v1/chat/stream", json=payload) as response:
+                assert response.headers["x-request-id"]
+                for i, _ in enumerate(response.iter_lines()):
+                    if i >= 3:
+                        break
+            # Response closed mid-stream, as when a browser tab is closed
+            time.sleep(0.3)
+            sent = fake.state.tokens_sent
+            time.sleep(0.2)
+            stats = client.get("/api/v1/streams/stats").json()
+            slots = scheduler.stats()["models"]["mistral:latest"]["active"]
+
+    assert sent < 100
+    assert fake.state.tokens_sent == sent  # Ollama stopped generating
+    assert stats["active"] == 0
+    assert stats["disconnected"] >= 1
+    assert slots == 0
+
+
+def test_cancel_endpoint(fake_ollama):
+    fake_ollama(tokens=[f" t{i}" for i in range(200)], token_delay=0.01)
+
+    with serve_app(app, lifespan="on") as url:
+        with httpx.Client(base_url=url) as client:
+            payload = {"message": "cancel me", "use_cache": False, "stream_protocol": 2}
+            headers = {"X-Request-ID": "my-request-42"}
+            with client.stream("POST", "/api/v1/chat/stream", json=payload, headers=headers) as response:
+                assert response.headers["x-request-id"] == "my-request-42"
+                lines = []
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    lines.append(line)
+                    if len(lines) == 2:
+                        assert client.post("/api/v1/chat/cancel/my-request-42").status_code == 200
+            missing = client.post("/api/v1/chat/cancel/my-request-42")
+
+    assert '"error":"Request cancelled"' in lines[-1]
+    assert len(lines) < 50
+    assert missing.status_code == 404
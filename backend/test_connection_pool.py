@@ -0,0 +1,51 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import ollama_service
+from app.services.backend_pool import create_client
+
+
+def test_lifespan_opens_and_closes_shared_pool(fake_ollama):
+    """The lifespan hook owns a single client for all Ollama traffic"""
+    fake_ollama()
+    with TestClient(app) as client:
+        pool = ollama_service.client
+        assert not pool.is_closed
+        client.get("/api/v1/health")
+        client.get("/api/v1/models")
+        assert ollama_service.client is pool
+
+    assert pool.is_closed
+
+
+def test_health_checks_reuse_keepalive_connection(fake_ollama):
+    """Model list refreshes reuse one pooled TCP connection; /health makes no upstream call"""
+    fake = fake_ollama()
+    with TestClient(app) as client:
+        for _ in range(5):
+            response = client.get("/api/v1/health")
+            assert response.json()["ollama_status"] == "healthy"
+        for _ in range(5):
+            client.post("/api/v1/models/refresh")
+
+    # One /api/tags call at startup plus the five refreshes
+    assert len(fake.state.peers) == 6
+    assert len(set(fake.state.peers)) == 1
+
+
+def test_pool_limits_and_timeouts_come_from_settings(monkeypatch):
+    """Pool size, timeouts and keep-alive are configurable"""
+    monkeypatch.setattr(settings, "ollama_max_connections", 7)
+    monkeypatch.setattr(settings, "ollama_max_keepalive_connections", 3)
+    monkeypatch.setattr(settings, "ollama_connect_timeout", 1.5)
+    monkeypatch.setattr(settings, "ollama_read_timeout", 42.0)
+    monkeypatch.setattr(settings, "ollama_write_timeout", 9.0)
+
+    client = create_client("http://127.0.0.1:1")
+    pool = client._transport._pool
+    assert pool._max_connections == 7
+    assert pool._max_keepalive_connections == 3
+    assert client.timeout.connect == 1.5
+    assert client.timeout.read == 42.0
+    assert client.timeout.write == 9.0  # not the connect timeout: large prompts take a while to send
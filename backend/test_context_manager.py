@@ -0,0 +1,137 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import context_manager
+from app.services.context_manager import SUMMARY_PREFIX, ContextManager
+from app.services.conversation_store import MemoryConversationStore, SharedConversationStore, SQLiteConversationStore
+from app.services.shared_state import MemoryState
+
+
+def word_count(text):
+    return len(text.split())
+
+
+def make_manager(budget=20, summarizer=None, max_turns=1000):
+    store = MemoryConversationStore(ttl=60, max_sessions=10, max_turns=max_turns, max_bytes=10**6)
+    manager = ContextManager(
+        store, default_budget=budget, trim_ratio=0.5,
+        estimator=word_count, summarizer=summarizer
+    )
+    return store, manager
+
+
+async def converse(store, manager, turns, words=3):
+    prompts = []
+    for i in range(turns):
+        message = " ".join([f"q{i}"] * words)
+        prompts.append(await manager.prepare("s", message, "m"))
+        await store.append("s", [("user", message), ("assistant", " ".join([f"a{i}"] * words))])
+    return prompts
+
+
+def test_prompt_stays_within_budget():
+    store, manager = make_manager(budget=20)
+    prompts = asyncio.run(converse(store, manager, 30))
+
+    for prompt in prompts:
+        assert sum(word_count(content) for _, content in prompt) + 3 <= 20
+        if prompt:
+            assert prompt[0][0] == "user"
+    assert manager.trims > 1
+
+
+def test_prefix_is_stable_between_trims():
+    store, manager = make_manager(budget=20)
+    prompts = asyncio.run(converse(store, manager, 12))
+
+    stable = 0
+    for before, after in zip(prompts, prompts[1:]):
+        if after[:len(before)] == before:
+            stable += 1
+    # Only the turns that trigger a trim change the prefix
+    assert stable == len(prompts) - 1 - manager.trims
+
+
+def test_dropped_turns_are_summarized_in_background():
+    calls = []
+
+    async def summarizer(summary, dropped, model):
+        calls.append(dropped)
+        return (summary + " " + " ".join(c.split()[0] for _, c in dropped)).strip()
+
+    async def run():
+        store, manager = make_manager(budget=20, summarizer=summarizer)
+        await converse(store, manager, 6)
+        await manager.drain()
+        return await manager.prepare("s", "next", "m"), manager
+
+    prompt, manager = asyncio.run(run())
+    assert calls
+    assert prompt[0][0] == "system"
+    assert prompt[0][1].startswith(SUMMARY_PREFIX + "q0 a0")
+    assert manager.stats()["summaries"] == len(calls)
+
+
+async def summarize_first_words(summary, dropped, model):
+    return (summary + " " + " ".join(c.split()[0] for _, c in dropped)).strip()
+
+
+def test_window_and_summary_survive_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    def open_manager():
+        store = SQLiteConversationStore(path, ttl=60, max_sessions=10, max_turns=1000, max_bytes=10**6)
+        return store, ContextManager(store, default_budget=20, trim_ratio=0.5, estimator=word_count,
+                                     summarizer=summarize_first_words)
+
+    async def run():
+        store, manager = open_manager()
+        await converse(store, manager, 6)
+        await manager.drain()
+        before = await manager.prepare("s", "next", "m")
+        store, restarted = open_manager()
+        return before, await restarted.prepare("s", "next", "m"), restarted.trims
+
+    before, after, trims = asyncio.run(run())
+    assert before[0][1].startswith(SUMMARY_PREFIX + "q0 a0")
+    assert after == before  # same prefix, so Ollama's cache still applies
+    assert trims == 0
+
+
+def test_workers_sharing_sessions_share_the_window():
+    state = MemoryState()
+    stores = [SharedConversationStore(state, ttl=60, max_sessions=10, max_turns=1000, max_bytes=10**6)
+              for _ in range(2)]
+    managers = [ContextManager(store, default_budget=20, trim_ratio=0.5, estimator=word_count,
+                               summarizer=summarize_first_words) for store in stores]
+
+    async def run():
+        await stores[0].create("s")
+        await converse(stores[0], managers[0], 6)
+        await managers[0].drain()
+        return await managers[0].prepare("s", "next", "m"), await managers[1].prepare("s", "next", "m")
+
+    first, second = asyncio.run(run())
+    assert second == first and first[0][0] == "system"
+    assert managers[1].trims == 0
+
+
+def test_window_survives_store_turn_cap():
+    store, manager = make_manager(budget=1000, max_turns=4)
+    prompts = asyncio.run(converse(store, manager, 5))
+    assert len(prompts[-1]) == 4
+
+
+def test_chat_prompt_uses_budget(fake_ollama, monkeypatch):
+    fake = fake_ollama(tokens=["word " * 40], token_delay=0)
+    monkeypatch.setattr(context_manager, "default_budget", 60)
+    monkeypatch.setattr(context_manager, "summarizer", None)
+    with TestClient(app) as client:
+        for i in range(6):
+            client.post("/api/v1/chat", json={"message": f"question {i}", "session_id": "budget"})
+
+    sizes = [len(r["messages"]) for r in fake.state.requests]
+    assert max(sizes) <= 3
+    assert fake.state.requests[-1]["messages"][-1]["content"] == "question 5"
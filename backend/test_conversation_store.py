@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.conversation_store import MemoryConversationStore, SQLiteConversationStore
+
+
+def test_memory_store_appends_and_caps_turns():
+    async def run():
+        store = MemoryConversationStore(ttl=60, max_sessions=10, max_turns=3, max_bytes=10_000)
+        await store.append("s", [("user", "one"), ("assistant", "two")])
+        await store.append("s", [("user", "three"), ("assistant", "four")])
+        return await store.history("s"), store.stats()
+
+    history, stats = asyncio.run(run())
+    assert history == [("assistant", "two"), ("user", "three"), ("assistant", "four")]
+    assert stats["bytes"] == len("twothreefour")
+
+
+def test_memory_store_evicts_by_session_cap_bytes_and_ttl():
+    async def run():
+        store = MemoryConversationStore(ttl=60, max_sessions=2, max_turns=10, max_bytes=20)
+        for name in ("a", "b", "c"):
+            await store.append(name, [("user", "hi")])
+        after_cap = [await store.history(n) for n in ("a", "b", "c")]
+        await store.append("big", [("user", "x" * 19)])
+        after_bytes = [await store.history(n) for n in ("b", "c", "big")]
+        store.ttl = 0
+        expired = await store.history("big")
+        return after_cap, after_bytes, expired
+
+    after_cap, after_bytes, expired = asyncio.run(run())
+    assert after_cap == [[], [("user", "hi")], [("user", "hi")]]
+    assert after_bytes == [[], [], [("user", "x" * 19)]]
+    assert expired == []
+
+
+def test_sqlite_store_persists_incrementally(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+
+    async def write():
+        store = SQLiteConversationStore(path, ttl=60, max_sessions=10, max_turns=10, max_bytes=10_000)
+        await store.append("s", [("user", "hello"), ("assistant", "hi")])
+        await store.append("s", [("user", "again"), ("assistant", "sure")])
+        rows = store._conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        return rows
+
+    async def read():
+        store = SQLiteConversationStore(path, ttl=60, max_sessions=10, max_turns=10, max_bytes=10_000)
+        history = await store.history("s")
+        deleted = await store.delete("s")
+        return history, deleted, await store.history("s")
+
+    assert asyncio.run(write()) == 4
+    history, deleted, after = asyncio.run(read())
+    assert [content for _, content in history] == ["hello", "hi", "again", "sure"]
+    assert deleted
+    assert after == []
+
+
+def test_chat_sends_session_history_upstream(fake_ollama):
+    fake = fake_ollama(tokens=["Answer"], token_delay=0)
+    with TestClient(app) as client:
+        session_id = client.post("/api/v1/sessions").json()["session_id"]
+        first = client.post("/api/v1/chat", json={"message": "First", "session_id": session_id})
+        client.post(
+            "/api/v1/chat/stream",
+            json={"message": "Second", "session_id": session_id, "stream_protocol": 2}
+        )
+        history = client.get(f"/api/v1/sessions/{session_id}").json()
+
+    assert first.json()["session_id"] == session_id
+    assert fake.state.requests[0]["messages"] == [{"role": "user", "content": "First"}]
+    assert fake.state.requests[1]["messages"] == [
+        {"role": "user", "content": "First"},
+        {"role": "assistant", "content": "Answer"},
+        {"role": "user", "content": "Second"},
+    ]
+    assert [t["content"] for t in history["turns"]] == ["First", "Answer", "Second", "Answer"]
+
+
+def test_stream_done_event_carries_session_id(fake_ollama):
+    fake_ollama(token_delay=0)
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/chat/stream",
+            json={"message": "Hi", "session_id": "abc123", "stream_protocol": 2}
+        )
+        missing = client.delete("/api/v1/sessions/does-not-exist")
+
+    final = json.loads(response.text.strip().split("\n")[-1][6:])
+    assert final["session_id"] == "abc123"
+    assert missing.status_code == 404
@@ -0,0 +1,164 @@
+import asyncio
+import time
+from array import array
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import ollama_service
+from app.services.embedding_batcher import EmbeddingBatcher
+
+
+class FakeService:
+    """Records the batches it is asked to embed"""
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def embed(self, texts, model=None):
+        self.calls.append(list(texts))
+        await asyncio.sleep(0.001)
+        if self.error:
+            raise self.error
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    service = FakeService()
+
+    async def run():
+        batcher = EmbeddingBatcher(service, max_batch=64, max_wait=0.01)
+        results = await asyncio.gather(
+            *[batcher.embed([f"text {i}" * (i + 1)], "m") for i in range(10)],
+            batcher.embed(["a", "bb", "a"], "m")
+        )
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+    assert len(service.calls) == 1
+    assert len(service.calls[0]) == 12  # the repeated "a" is embedded once
+    assert results[3] == [[float(len("text 3" * 4)), 1.0]]
+    assert results[-1] == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert batcher.stats()["avg_batch_size"] == 12
+
+
+def test_full_batch_is_sent_without_waiting():
+    service = FakeService()
+
+    async def run():
+        batcher = EmbeddingBatcher(service, max_batch=4, max_wait=10.0)
+        start = time.perf_counter()
+        await asyncio.gather(*[batcher.embed([str(i)], "m") for i in range(8)])
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 1.0
+    assert [len(call) for call in service.calls] == [4, 4]
+
+
+def test_upstream_failure_reaches_every_caller():
+    service = FakeService(error=RuntimeError("model not found"))
+
+    async def run():
+        batcher = EmbeddingBatcher(service, max_batch=8, max_wait=0.005)
+        return await asyncio.gather(*[batcher.embed(["x"], "m") for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(r) for r in results] == ["model not found"] * 3
+    assert len(service.calls) == 1
+
+
+
+def test_refused_batch_fails_only_the_offending_caller():
+    service = FakeService()
+    embed = service.embed
+
+    async def refuse_bad_input(texts, model=None):
+        if "bad" in texts:
+            service.calls.append(list(texts))
+            request = httpx.Request("POST", "http://ollama/api/embed")
+            response = httpx.Response(400, request=request)
+            raise httpx.HTTPStatusError("400 Bad Request", request=request, response=response)
+        return await embed(texts, model)
+
+    service.embed = refuse_bad_input
+
+    async def run():
+        batcher = EmbeddingBatcher(service, max_batch=8, max_wait=0.005)
+        results = await asyncio.gather(
+            *[batcher.embed([f"ok {i}"], "m") for i in range(3)], batcher.embed(["bad", "ok 0"], "m"),
+            return_exceptions=True
+        )
+        return batcher, results
+
+    batcher, results = asyncio.run(run())
+    assert results[:3] == [[[4.0, 1.0]], [[4.0, 1.0]], [[4.0, 1.0]]]
+    assert isinstance(results[3], httpx.HTTPStatusError)
+    assert ["bad", "ok 0"] in service.calls
+    assert batcher.stats()["splits"] == 2
+
+def test_embeddings_endpoint_json_and_binary(fake_ollama):
+    fake_ollama(embedding_dim=8)
+    with TestClient(app) as client:
+        as_json = client.post("/api/v1/embeddings", json={"input": ["hello world", "goodbye"]})
+        as_binary = client.post("/api/v1/embeddings", json={
+            "input": ["hello world", "goodbye"], "encoding_format": "binary"
+        })
+        too_many = client.post("/api/v1/embeddings", json={"input": ["x"] * (settings.embed_max_inputs + 1)})
+
+    body = as_json.json()
+    assert body["model"] == settings.embed_default_model
+    assert body["dimensions"] == 8 and len(body["embeddings"]) == 2
+    assert as_binary.headers["content-type"] == "application/octet-stream"
+    assert as_binary.headers["X-Embedding-Count"] == "2"
+    assert as_binary.headers["X-Embedding-Dimensions"] == "8"
+    assert len(as_binary.content) == 2 * 8 * 4
+    values = array("f", as_binary.content).tolist()
+    flat = [value for vector in body["embeddings"] for value in vector]
+    assert values == pytest.approx(flat, rel=1e-6)
+    assert too_many.status_code == 413
+
+
+def test_embeddings_endpoint_batches_concurrent_clients(fake_ollama):
+    fake = fake_ollama()
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/api/v1/embeddings", json={"input": f"sentence {i}"}) for i in range(20)
+            ])
+
+    responses = asyncio.run(run())
+    assert all(r.status_code == 200 for r in responses)
+    assert len(fake.state.embed_requests) < 20
+    assert sum(len(request["input"]) for request in fake.state.embed_requests) == 20
+
+
+def test_refused_embedding_is_not_retried_or_held_against_the_node(fake_ollama):
+    first = fake_ollama(embed_error_status=400)
+    second = fake_ollama(embed_error_status=400)
+    with TestClient(app) as client:
+        response = client.post("/api/v1/embeddings", json={"input": "hello", "model": "mistral:latest"})
+
+    assert response.status_code == 400
+    assert len(first.state.embed_requests) + len(second.state.embed_requests) == 1
+    assert all(b.failures == 0 and b.breaker.allow() for b in ollama_service.pool.backends)
+
+
+def test_server_error_is_retried_on_the_next_node(fake_ollama):
+    broken = fake_ollama(embed_error_status=500)
+    healthy = fake_ollama()
+
+    async def run():
+        vectors = [await ollama_service.embed(["hello"]) for _ in range(2)]
+        await ollama_service.pool.shutdown()
+        return vectors
+
+    vectors = asyncio.run(run())
+    assert all(len(v) == 1 for v in vectors)
+    assert len(healthy.state.embed_requests) == 2
+    assert sum(b.failures for b in ollama_service.pool.backends) == len(broken.state.embed_requests)
@@ -0,0 +1,107 @@
+import asyncio
+import re
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.metrics import Counter, Histogram, Metrics
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Read one sample value from Prometheus text output"""
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = re.match(r"([a-z_]+)(\{(.*)\})? (\S+)$", line)
+        if match.group(1) != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(3) or ""))
+        if all(found.get(k) == v for k, v in labels.items()):
+            return float(match.group(4))
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("latency_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    child = histogram.labels("/a")
+    for value in (0.05, 0.1, 0.5, 3.0):
+        child.observe(value)
+    text = "\n".join(histogram.render())
+    assert sample(text, "latency_seconds_bucket", route="/a", le="0.1") == 2
+    assert sample(text, "latency_seconds_bucket", route="/a", le="1") == 3
+    assert sample(text, "latency_seconds_bucket", route="/a", le="+Inf") == 4
+    assert sample(text, "latency_seconds_count", route="/a") == 4
+    assert sample(text, "latency_seconds_sum", route="/a") == 3.65
+
+
+def test_counter_escapes_label_values():
+    counter = Counter("things_total", "test", ("name",))
+    counter.labels('a"b').inc(2)
+    assert 'things_total{name="a\\"b"} 2' in counter.render()
+
+
+def test_track_stream_records_ttft_and_token_gaps():
+    registry = Metrics()
+
+    async def events():
+        for token in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield {"chunk": token, "done": False, "success": True}
+        yield {"chunk": "", "response": "abc", "done": True, "success": True}
+
+    async def run():
+        return [e async for e in registry.track_stream("m", events())]
+
+    assert len(asyncio.run(run())) == 4
+    text = registry.render()
+    assert sample(text, "chat_time_to_first_token_seconds_count", model="m") == 1
+    assert sample(text, "chat_inter_token_latency_seconds_count", model="m") == 2
+    assert sample(text, "chat_tokens_total", model="m") == 3
+    assert sample(text, "chat_tokens_per_second_count", model="m") == 1
+    assert sample(text, "chat_streams_in_flight") == 0
+
+
+def test_cached_stream_replays_are_labelled_apart(fake_ollama):
+    fake_ollama(tokens=["x", "y"], token_delay=0.01)
+    with TestClient(app) as client:
+        before = client.get("/metrics").text
+        for _ in range(2):
+            client.post("/api/v1/chat/stream", json={"message": "replay me", "stream_protocol": 2})
+        text = client.get("/metrics").text
+
+    def delta(name, **labels):
+        return sample(text, name, **labels) - sample(before, name, **labels)
+
+    generated = dict(model="mistral:latest", source="generated")
+    assert delta("chat_time_to_first_token_seconds_count", **generated) == 1
+    assert delta("chat_time_to_first_token_seconds_count", model="mistral:latest", source="cached") == 1
+    assert delta("chat_inter_token_latency_seconds_count", **generated) == 1
+
+
+def test_metrics_endpoint_reports_routes_streams_and_ollama_timings(fake_ollama):
+    fake_ollama(tokens=["x", "y", "z"])
+    with TestClient(app) as client:
+        before = client.get("/metrics").text
+        client.post("/api/v1/chat", json={"message": "metrics one", "use_cache": False})
+        client.post("/api/v1/chat/stream", json={
+            "message": "metrics two", "use_cache": False, "stream_protocol": 2
+        })
+        client.delete("/api/v1/sessions/missing-session")
+        response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+
+    def delta(name, **labels):
+        return sample(text, name, **labels) - sample(before, name, **labels)
+
+    route = dict(method="POST", route="/api/v1/chat", status="200")
+    assert delta("http_requests_total", **route) == 1
+    assert delta("http_requests_total", method="DELETE", route="/api/v1/sessions/{session_id}", status="404") == 1
+    assert delta("http_request_duration_seconds_count", method="POST", route="/api/v1/chat/stream") == 1
+    assert delta("chat_time_to_first_token_seconds_count", model="mistral:latest", source="generated") == 1
+    assert delta("chat_tokens_total", model="mistral:latest", source="generated") == 3
+    assert delta("ollama_eval_tokens_total", model="mistral:latest") == 6
+    assert delta("ollama_load_duration_seconds_count", model="mistral:latest") == 2
+    assert sample(text, "http_requests_in_flight") == 1  # the /metrics request itself
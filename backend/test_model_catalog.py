@@ -0,0 +1,77 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import metrics, model_residency, ollama_service, scheduler
+from app.services.model_catalog import ModelCatalog
+from app.services.ollama_service import OllamaService
+
+
+def test_models_etag_and_not_modified(fake_ollama):
+    models = ["mistral:latest", "llama3"]
+    fake_ollama(models=models)
+    with TestClient(app) as client:
+        first = client.get("/api/v1/models")
+        etag = first.headers["etag"]
+        unchanged = client.get("/api/v1/models", headers={"If-None-Match": etag})
+        models.append("codellama")
+        refreshed = client.post("/api/v1/models/refresh").json()
+        changed = client.get("/api/v1/models", headers={"If-None-Match": etag})
+
+    assert first.json()["models"] == ["mistral:latest", "llama3"]
+    assert etag.startswith('W/"')
+    assert unchanged.status_code == 304 and unchanged.content == b""
+    assert refreshed["changed"] is True
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["models"][-1] == "codellama"
+
+
+def test_catalog_merges_nodes_and_keeps_last_good_list(fake_ollama):
+    fake_ollama(models=["a", "shared"])
+    fake_ollama(models=["shared", "b"])
+    catalog = ModelCatalog(ollama_service, interval=0)
+
+    async def run():
+        await catalog.refresh()
+        merged = catalog.listing(), catalog.health(), catalog.stats()
+        # Every node goes away: the list survives, health reports it
+        catalog.service = OllamaService(hosts=["http://127.0.0.1:1"])
+        changed = await catalog.refresh()
+        await catalog.service.aclose()
+        await ollama_service.aclose()
+        return merged, changed, catalog.listing(), catalog.health()
+
+    (listing, health, stats), changed, stale, down = asyncio.run(run())
+    assert listing["models"] == ["a", "shared", "b"]
+    assert health["status"] == "healthy" and health["backends_healthy"] == 2
+    assert stats["refreshes"] == 1
+    assert changed is False
+    assert stale["models"] == ["a", "shared", "b"] and stale["stale"] is True
+    assert down["status"] == "unreachable"
+
+
+def test_models_before_first_refresh():
+    catalog = ModelCatalog(ollama_service)
+    assert catalog.listing() == {"success": False, "error": "Model list not loaded yet", "models": []}
+    assert catalog.health()["status"] == "unknown"
+    assert catalog.known(ollama_service.default_model) and not catalog.known("llama3")
+
+
+def test_unknown_models_are_refused_before_per_model_state(fake_ollama):
+    fake = fake_ollama(models=["mistral:latest"])
+    with TestClient(app) as client:
+        chat = client.post("/api/v1/chat", json={"message": "hi", "model": "made-up-1"})
+        stream = client.post("/api/v1/chat/stream", json={"message": "hi", "model": "made-up-2"})
+        known = client.post("/api/v1/chat", json={"message": "hi", "model": "mistral:latest"})
+
+    assert chat.status_code == stream.status_code == 404
+    assert chat.json()["detail"] == "Model made-up-1 is not available"
+    assert known.status_code == 200
+    assert len(fake.state.requests) == 1
+    # Made-up names never become scheduler queues, metric labels or residency rates
+    assert not {"made-up-1", "made-up-2"} & set(scheduler._queues)
+    assert not {"made-up-1", "made-up-2"} & set(model_residency._rates)
+    assert "made-up" not in metrics.render()
+
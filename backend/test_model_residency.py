@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import ollama_service
+from app.services.backend_pool import CircuitBreaker
+from app.services.model_residency import ModelResidency
+
+
+def test_plan_keeps_busiest_models_within_budget():
+    residency = ModelResidency(
+        ollama_service, memory_budget_mb=10, model_sizes_mb={"a": 6, "b": 6, "c": 3}, interval=0
+    )
+    for model, count in (("a", 3), ("b", 2), ("c", 1)):
+        for _ in range(count):
+            residency.record(model)
+
+    assert residency.rate("a") > residency.rate("b") > residency.rate("c") > 0
+    # b does not fit next to a; the smaller c still does
+    assert residency.plan() == ["a", "c"]
+
+
+def test_plan_drops_idle_models_and_keeps_preloaded():
+    residency = ModelResidency(ollama_service, preload=["pinned"], min_rate=1000.0, interval=0)
+    residency.record("rarely-used")
+    assert residency.plan() == ["pinned"]
+
+
+def test_preload_ping_and_unload(fake_ollama):
+    fake = fake_ollama(loaded=["stale"], sizes={"mistral:latest": 4 * 1024 * 1024, "other": 2 * 1024 * 1024})
+    residency = ModelResidency(ollama_service, preload=["mistral:latest"], memory_budget_mb=8, interval=0)
+
+    async def run():
+        await ollama_service.pool.refresh()
+        await residency.startup()
+        residency.record("other")
+        await residency.reconcile()
+        stats = residency.stats()
+        await ollama_service.pool.shutdown()
+        return stats
+
+    stats = asyncio.run(run())
+    assert fake.state.loads[0] == ("mistral:latest", "10m")
+    assert ("other", "10m") in fake.state.loads
+    assert ("stale", 0) in fake.state.loads
+    assert sorted(fake.state.loaded) == ["mistral:latest", "other"]
+    assert stats["loads"] == 2 and stats["pings"] == 1 and stats["unloads"] == 1
+    assert stats["models"]["mistral:latest"]["size_mb"] == 4
+    assert stats["models"]["other"]["resident"]
+    assert "stale" not in stats["models"]
+
+
+def test_models_endpoint_reports_residency(fake_ollama):
+    fake_ollama()
+    with TestClient(app) as client:
+        client.post("/api/v1/chat", json={"message": "residency question", "use_cache": False})
+        body = client.get("/api/v1/models").json()
+
+    assert body["success"]
+    model = body["residency"]["models"]["mistral:latest"]
+    assert model["requests"] >= 1 and model["rate_per_minute"] > 0
+
+
+def test_keep_alive_round_leaves_breaker_probes_alone(fake_ollama):
+    fake = fake_ollama(loaded=[])  # cold, so the balancer picks the node
+    residency = ModelResidency(ollama_service, interval=0)
+    residency.record("mistral:latest")
+    backend = ollama_service.pool.backends[0]
+    backend.breaker = CircuitBreaker(window=2, min_calls=1, open_seconds=0.5, name=backend.host)
+    backend.breaker.record(False)
+
+    async def run():
+        await ollama_service.pool.refresh()
+        await residency.reconcile()  # circuit open: nothing to load on, the round still finishes
+        skipped = list(fake.state.loads)
+        time.sleep(0.5)
+        await residency.reconcile()
+        await ollama_service.pool.shutdown()
+        return skipped
+
+    skipped = asyncio.run(run())
+    assert skipped == []
+    assert fake.state.loads == [("mistral:latest", "10m")]
+    # the keep-alive ping took no probe slot, so a real request can still probe the node
+    assert backend.breaker.state == "half_open" and backend.breaker.allow()
@@ -0,0 +1,93 @@
+from fastapi.testclient import TestClient
+
+import app.api.chat as chat_api
+from app.core.config import settings
+from app.main import app
+from app.services.metrics import Metrics
+from app.services.model_router import ModelRouter
+
+
+class FakeQueue:
+    """Expected queue waits per model"""
+
+    def __init__(self, waits=None):
+        self.waits = waits or {}
+
+    def estimated_wait(self, model):
+        return self.waits.get(model, 0.0)
+
+
+def make_router(waits=None, registry=None, **kwargs):
+    return ModelRouter(
+        ["small", "medium", "large"],
+        FakeQueue(waits),
+        registry or Metrics(),
+        short_prompt_tokens=50,
+        escalate_patterns=settings.router_escalate_patterns,
+        uncertain_patterns=settings.router_uncertain_patterns,
+        queue_slo=2.0,
+        **kwargs
+    )
+
+
+def test_prompts_move_up_one_tier_per_sign_of_difficulty():
+    router = make_router()
+    assert router.route("what time is it in Oslo?", 8, "default").model == "small"
+    assert router.route("summarise this " + "word " * 100, 120, "default").model == "medium"
+    hard = router.route("Debug this:\n```\n" + "x = 1\n" * 100 + "```", 150, "default")
+    assert (hard.model, hard.reason) == ("large", "complex")
+    assert router.decisions == {"small": {"short": 1}, "medium": {"complex": 1}, "large": {"complex": 1}}
+    assert ModelRouter([], FakeQueue(), Metrics()).route("hi", 1, "default").model == "default"
+
+
+def test_busy_model_is_downgraded_to_one_within_the_slo():
+    registry = Metrics()
+    router = make_router(waits={"large": 9.0, "medium": 3.0, "small": 0.5}, registry=registry)
+    route = router.route("Prove it step by step " + "word " * 100, 120, "default")
+
+    assert (route.model, route.reason) == ("small", "downgrade")
+    rendered = registry.render()
+    assert 'router_downgrades_total{from_model="large",to_model="small"} 1' in rendered
+    assert 'router_downgrade_wait_saved_seconds_sum{model="small"} 8.5' in rendered
+
+
+def test_failed_answers_cascade_to_the_next_tier():
+    router = make_router(waits={"large": 5.0})
+    route = router.route("hello", 2, "default")
+    unsure = {"success": True, "response": "I'm not sure what you mean."}
+
+    assert router.next_model(route, {"success": True, "response": "Hi there!"}) is None
+    assert router.next_model(route, unsure) == "medium"
+    assert router.next_model(route, {"success": True, "response": "", "done_reason": "stop"}) is None  # large is busy
+    router.finish(route)
+
+    assert route.model == "medium" and route.outcome == "escalated"
+    stats = router.stats()
+    assert stats["escalations"] == 1 and stats["escalations_shed"] == 1
+    assert set(stats["latency_seconds_avg"]) == {"escalated"}
+
+
+def test_auto_chat_escalates_and_reports_metrics(fake_ollama, monkeypatch):
+    fake = fake_ollama(token_delay=0, model_tokens={"small": ["I", " don't", " know."]})
+    registry = Metrics()
+    router = ModelRouter(
+        ["small", "large"], chat_api.scheduler, registry,
+        uncertain_patterns=settings.router_uncertain_patterns
+    )
+    monkeypatch.setattr(chat_api, "model_router", router)
+    with TestClient(app) as client:
+        answer = client.post("/api/v1/chat", json={"message": "what is 2+2?", "model": "auto"})
+        again = client.post("/api/v1/chat", json={"message": "what is 2+2?", "model": "auto"})
+        streamed = client.post("/api/v1/chat/stream", json={"message": "and 3+3?", "model": "auto"})
+        stats = client.get("/api/v1/router/stats").json()
+
+    assert answer.json()["model"] == "large"
+    assert again.json()["cached"] is True  # cached for auto requests, not under "small"
+    assert '"model": "small"' in streamed.text  # streams are routed but never escalated
+    assert [request["model"] for request in fake.state.requests] == ["small", "large", "small"]
+    assert stats["decisions"] == {"small": {"short": 3}}
+    assert stats["escalations"] == 1
+    rendered = registry.render()
+    assert 'router_escalations_total{from_model="small",to_model="large"} 1' in rendered
+    assert 'router_request_duration_seconds_count{model="large",route="escalated"} 1' in rendered
+    assert 'router_request_duration_seconds_count{model="small",route="direct"} 1' in rendered
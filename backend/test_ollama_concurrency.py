@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from benchmarks.fake_ollama import run_fake_ollama
+from app.services.model_catalog import ModelCatalog
+from app.services.ollama_service import OllamaService
+
+
+def test_generate_requests_overlap():
+    """Concurrent chats run side by side instead of one after another"""
+    tokens = ["tok"] * 10
+    token_delay = 0.02
+    with run_fake_ollama(tokens=tokens, token_delay=token_delay) as (url, fake):
+        async def run():
+            service = OllamaService(host=url)
+            try:
+                return await asyncio.gather(*[
+                    service.generate_response("Hello") for _ in range(5)
+                ])
+            finally:
+                await service.aclose()
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+
+    single = token_delay * len(tokens)
+    assert all(r["success"] for r in results)
+    assert all(r["response"] == "tok" * 10 for r in results)
+    # Five sequential calls would take at least 5x a single call
+    assert elapsed < single * 3
+
+    # Every call started before the first one finished
+    first_end = min(end for _, end in fake.state.calls)
+    assert all(start < first_end for start, _ in fake.state.calls)
+
+
+def test_stream_does_not_block_event_loop():
+    """Other coroutines keep running while a stream is in progress"""
+    with run_fake_ollama(tokens=["a"] * 10, token_delay=0.02) as (url, _):
+        async def run():
+            service = OllamaService(host=url)
+            ticks = 0
+            chunks = []
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.005)
+                    ticks += 1
+
+            task = asyncio.create_task(ticker())
+            try:
+                async for chunk in service.stream_response("Hello"):
+                    chunks.append(chunk)
+            finally:
+                task.cancel()
+                await service.aclose()
+            return ticks, chunks
+
+        ticks, chunks = asyncio.run(run())
+
+    assert all(c["success"] for c in chunks)
+    assert chunks[-1]["done"]
+    assert chunks[-1]["response"] == "a" * 10
+    assert ticks > 10
+
+
+def test_list_models():
+    """The model catalog lists models through the service's async client"""
+    with run_fake_ollama(models=["mistral:latest", "llama3:latest"]) as (url, _):
+        async def run():
+            service = OllamaService(host=url)
+            try:
+                catalog = ModelCatalog(service, interval=0)
+                await catalog.refresh()
+                return catalog.listing()
+            finally:
+                await service.aclose()
+
+        result = asyncio.run(run())
+
+    assert result["success"]
+    assert result["models"] == ["mistral:latest", "llama3:latest"]
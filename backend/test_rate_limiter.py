@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.api import chat as chat_api
+from app.main import app
+from app.services import rate_limiter
+from app.services.rate_limiter import RateLimiter, SharedWindows, TokenBuckets
+from app.services.shared_state import MemoryState
+
+
+def test_token_bucket_allows_burst_then_refuses():
+    async def run():
+        buckets = TokenBuckets(rate=0.01, burst=3)
+        decisions = [await buckets.acquire("ip:1") for _ in range(4)]
+        return decisions, await buckets.acquire("ip:2")
+
+    decisions, other = asyncio.run(run())
+    assert [d.allowed for d in decisions] == [True, True, True, False]
+    assert [d.remaining for d in decisions[:3]] == [2, 1, 0]
+    assert decisions[3].retry_after > 90  # one unit refills every 100 seconds
+    assert other.allowed  # buckets are per client
+
+
+def test_token_bucket_memory_is_bounded():
+    """Refilled buckets are dropped and the least recently seen client goes past max_keys"""
+    async def run():
+        buckets = TokenBuckets(rate=1000.0, burst=1, max_keys=2)
+        await buckets.acquire("a")
+        await asyncio.sleep(0.01)  # "a" is full again
+        await buckets.acquire("b")
+        refilled = len(buckets._full_at)
+        slow = TokenBuckets(rate=0.01, burst=5, max_keys=2)
+        for client in ("a", "b", "c"):
+            await slow.acquire(client)
+        return refilled, slow
+
+    refilled, slow = asyncio.run(run())
+    assert refilled == 1
+    assert list(slow._full_at) == ["b", "c"]
+    assert slow.evictions == 1
+
+
+def test_token_quota_admits_while_positive_and_charges_afterwards():
+    async def run():
+        limiter = RateLimiter(tokens=TokenBuckets(rate=0.01, burst=10))
+        await limiter.check("key:a")
+        await limiter.charge("key:a", 25)  # a long answer puts the client into debt
+        try:
+            await limiter.check("key:a")
+        except Exception as e:
+            return limiter, e
+
+    limiter, error = asyncio.run(run())
+    assert error.limit_name == "tokens"
+    assert error.headers["RateLimit-Remaining"] == "0"
+    assert int(error.headers["Retry-After"]) > 1000
+    assert limiter.limited == {"requests": 0, "tokens": 1}
+
+
+def test_shared_windows_count_across_workers():
+    """Two limiters on one shared store enforce a single budget"""
+    async def run():
+        state = MemoryState()
+        workers = [SharedWindows(state, "requests", rate=1.0, burst=3) for _ in range(2)]
+        return [(await workers[i % 2].acquire("ip:1")).allowed for i in range(4)]
+
+    # Avoid a window boundary in the middle of the test
+    if 3 - time.time() % 3 < 0.5:
+        time.sleep(0.5)
+    assert asyncio.run(run()) == [True, True, True, False]
+
+
+def test_shared_windows_allow_requests_when_the_store_is_down():
+    class DownState(MemoryState):
+        async def incr(self, key, amount=1, ttl=None):
+            raise OSError("connection refused")
+
+    async def run():
+        windows = SharedWindows(DownState(), "requests", rate=1.0, burst=1)
+        return [await windows.acquire("ip:1") for _ in range(3)], windows
+
+    decisions, windows = asyncio.run(run())
+    assert all(d.allowed for d in decisions)
+    assert windows.errors == 3
+
+
+def test_chat_returns_429_with_rate_limit_headers(fake_ollama, monkeypatch):
+    fake_ollama(token_delay=0)
+    monkeypatch.setattr(rate_limiter, "requests", TokenBuckets(rate=0.01, burst=2))
+    monkeypatch.setattr(chat_api, "KNOWN_KEY_DIGESTS", frozenset(
+        chat_api._key_digest(key) for key in ("k1", "k2")
+    ))
+    with TestClient(app) as client:
+        responses = [
+            client.post("/api/v1/chat", json={"message": f"hi {i}"}, headers={"X-API-Key": "k1"})
+            for i in range(3)
+        ]
+        other = client.post("/api/v1/chat", json={"message": "hi"}, headers={"X-API-Key": "k2"})
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[0].headers["RateLimit-Limit"] == "2"
+    assert responses[0].headers["RateLimit-Remaining"] == "1"
+    assert "Retry-After" in responses[2].headers
+    assert responses[2].json()["detail"] == "Rate limit exceeded: requests"
+    assert other.status_code == 200
+
+
+def test_rotating_unknown_api_keys_does_not_reset_the_limit(fake_ollama, monkeypatch):
+    fake_ollama(token_delay=0)
+    monkeypatch.setattr(rate_limiter, "requests", TokenBuckets(rate=0.01, burst=2))
+    monkeypatch.setattr(chat_api, "KNOWN_KEY_DIGESTS", frozenset([chat_api._key_digest("known")]))
+    with TestClient(app) as client:
+        rotated = [
+            client.post("/api/v1/chat", json={"message": f"hi {i}"}, headers={"X-API-Key": f"made-up-{i}"})
+            for i in range(3)
+        ]
+        known = client.post("/api/v1/chat", json={"message": "hi"}, headers={"X-API-Key": "known"})
+
+    # unknown keys all count as the same client IP
+    assert [r.status_code for r in rotated] == [200, 200, 429]
+    assert known.status_code == 200
+
+
+def test_streamed_tokens_count_against_the_quota(fake_ollama, monkeypatch):
+    fake_ollama(token_delay=0, num_tokens=40)
+    monkeypatch.setattr(rate_limiter, "tokens", TokenBuckets(rate=0.01, burst=20))
+    with TestClient(app) as client:
+        first = client.post("/api/v1/chat/stream", json={"message": "long answer", "use_cache": False})
+        assert first.status_code == 200
+        assert first.headers["RateLimit-Policy"].startswith("20;")
+        second = client.post("/api/v1/chat/stream", json={"message": "again", "use_cache": False})
+
+    assert second.status_code == 429
+    assert second.json()["detail"] == "Rate limit exceeded: tokens"
@@ -0,0 +1,119 @@
+import asyncio
+
+import httpx
+
+from app.main import app
+from app.services import request_coalescer
+from app.services.ollama_service import OllamaService
+from app.services.request_coalescer import RequestCoalescer
+from benchmarks.fake_ollama import run_fake_ollama
+
+
+def test_identical_calls_share_one_upstream_request():
+    with run_fake_ollama(token_delay=0.01) as (url, fake):
+        async def run():
+            service = OllamaService(host=url)
+            coalescer = RequestCoalescer()
+            try:
+                results = await asyncio.gather(*[
+                    coalescer.do("k", lambda: service.generate_response("Hi")) for _ in range(5)
+                ])
+                other = await coalescer.do("other", lambda: service.generate_response("Bye"))
+                return results, other, coalescer.stats()
+            finally:
+                await service.aclose()
+
+        results, other, stats = asyncio.run(run())
+
+    assert len(fake.state.requests) == 2
+    assert all(r["response"] == results[0]["response"] for r in results)
+    assert other["success"]
+    assert stats["leaders"] == 2
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def run():
+        coalescer = RequestCoalescer()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.create_task(coalescer.do("k", slow))
+        second = asyncio.create_task(coalescer.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(run()) == ("done", True)
+
+
+def test_stream_fans_out_to_independent_subscribers():
+    with run_fake_ollama(tokens=["a", "b", "c", "d"], token_delay=0.01) as (url, fake):
+        async def run():
+            service = OllamaService(host=url)
+            coalescer = RequestCoalescer()
+
+            async def consume(delay, stop_after=None):
+                received = []
+                stream = coalescer.stream("k", lambda: service.stream_response("Hi"))
+                async for event in stream:
+                    received.append(event)
+                    await asyncio.sleep(delay)
+                    if stop_after and len(received) == stop_after:
+                        break
+                await stream.aclose()
+                return received
+
+            try:
+                return await asyncio.gather(consume(0), consume(0.03), consume(0, stop_after=1))
+            finally:
+                await service.aclose()
+
+        fast, slow, quitter = asyncio.run(run())
+
+    assert len(fake.state.requests) == 1
+    assert fast == slow
+    assert fast[-1]["response"] == "abcd"
+    assert len(quitter) == 1
+
+
+def test_stream_upstream_cancelled_when_all_subscribers_leave():
+    async def run():
+        coalescer = RequestCoalescer()
+        produced = []
+
+        async def source():
+            for i in range(100):
+                produced.append(i)
+                yield {"chunk": str(i)}
+                await asyncio.sleep(0.01)
+
+        stream = coalescer.stream("k", source)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        return produced, coalescer.stats()
+
+    produced, stats = asyncio.run(run())
+    assert len(produced) < 10
+    assert stats["streams_in_flight"] == 0
+
+
+def test_chat_endpoint_coalesces_concurrent_requests(fake_ollama):
+    fake = fake_ollama(token_delay=0.02)
+
+    async def run():
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/api/v1/chat", json={"message": "Burst", "use_cache": False})
+                for _ in range(4)
+            ])
+
+    before = request_coalescer.stats()["coalesced"]
+    responses = asyncio.run(run())
+    assert all(r.status_code == 200 for r in responses)
+    assert len(fake.state.requests) == 1
+    assert request_coalescer.stats()["coalesced"] - before == 3
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import response_cache
+from app.services.response_cache import MemoryCacheTier, ResponseCache, SQLiteCacheTier
+
+
+def test_key_normalizes_message_and_includes_model_and_options():
+    key = ResponseCache.make_key("What is  FastAPI?\n", "mistral:latest")
+    assert key == ResponseCache.make_key("  What is FastAPI? ", "mistral:latest")
+    assert key != ResponseCache.make_key("What is FastAPI?", "llama3:latest")
+    assert key != ResponseCache.make_key("What is FastAPI?", "mistral:latest", {"temperature": 0})
+
+
+def test_memory_tier_evicts_least_recently_used():
+    async def run():
+        tier = MemoryCacheTier(ttl=60, max_entries=2, max_bytes=10_000)
+        await tier.set("a", {"response": "1"})
+        await tier.set("b", {"response": "2"})
+        await tier.get("a")
+        await tier.set("c", {"response": "3"})
+        return [await tier.get(k) for k in "abc"], tier.stats()
+
+    values, stats = asyncio.run(run())
+    assert values == [{"response": "1"}, None, {"response": "3"}]
+    assert stats["evictions"] == 1
+
+
+def test_memory_tier_respects_byte_cap_and_ttl():
+    async def run():
+        tier = MemoryCacheTier(ttl=0.05, max_entries=100, max_bytes=200)
+        await tier.set("big", {"response": "x" * 500})
+        await tier.set("small", {"response": "ok"})
+        before = await tier.get("small")
+        time.sleep(0.06)
+        return await tier.get("big"), before, await tier.get("small")
+
+    big, before, after = asyncio.run(run())
+    assert big is None
+    assert before == {"response": "ok"}
+    assert after is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def write():
+        tier = SQLiteCacheTier(path, ttl=60, max_entries=10)
+        await tier.set("k", {"response": "persisted", "model": "m"})
+        tier.close()
+
+    async def read():
+        memory = MemoryCacheTier(ttl=60, max_entries=10, max_bytes=10_000)
+        cache = ResponseCache([memory, SQLiteCacheTier(path, ttl=60, max_entries=10)])
+        value = await cache.get("k")
+        return value, await memory.get("k"), cache.stats()
+
+    asyncio.run(write())
+    value, promoted, stats = asyncio.run(read())
+    assert value == {"response": "persisted", "model": "m"}
+    assert promoted == value
+    assert stats["tiers"]["disk"]["hits"] == 1
+
+
+def test_disk_tier_counts_rows_without_scanning(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def fill():
+        tier = SQLiteCacheTier(path, ttl=60, max_entries=50)
+        for i in range(120):
+            await tier.set(f"k{i % 110}", {"response": str(i), "model": "m"})
+        counted = tier.stats()["entries"]
+        (actual,) = tier._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()
+        reopened = SQLiteCacheTier(path, ttl=60, max_entries=50)
+        await reopened.warm()
+        await tier.clear()
+        return counted, actual, reopened.stats()["entries"], tier.stats()["entries"]
+
+    counted, actual, reopened, cleared = asyncio.run(fill())
+    assert counted == actual == 70  # trimmed to 50 at the 100th write, then 10 new and 10 evicted keys
+    assert reopened == 70
+    assert cleared == 0
+
+
+def test_chat_serves_repeated_prompt_from_cache(fake_ollama):
+    fake = fake_ollama(token_delay=0)
+    before = response_cache.stats()
+    with TestClient(app) as client:
+        first = client.post("/api/v1/chat", json={"message": "Hello"})
+        second = client.post("/api/v1/chat", json={"message": " Hello "})
+        bypass = client.post("/api/v1/chat", json={"message": "Hello", "use_cache": False})
+        stats = client.get("/api/v1/cache/stats").json()
+
+    assert first.json()["cached"] is False
+    assert second.json()["cached"] is True
+    assert second.json()["response"] == first.json()["response"]
+    assert bypass.json()["cached"] is False
+    assert len(fake.state.requests) == 2
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["bypassed"] - before["bypassed"] == 1
+
+
+def test_stream_replays_cached_answer(fake_ollama):
+    fake = fake_ollama(tokens=["Cached", " answer"], token_delay=0)
+    with TestClient(app) as client:
+        client.post("/api/v1/chat/stream", json={"message": "Hi", "stream_protocol": 2})
+        replay = client.post("/api/v1/chat/stream", json={"message": "Hi", "stream_protocol": 2})
+
+    events = [json.loads(line[6:]) for line in replay.text.split("\n") if line.startswith("data: ")]
+    assert len(fake.state.requests) == 1
+    assert "".join(e.get("chunk", "") for e in events) == "Cached answer"
+    assert events[-1]["response"] == "Cached answer"
+    assert events[-1]["cached"] is True
@@ -0,0 +1,151 @@
+import asyncio
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import retriever
+from app.services.retrieval import DocumentIndex, Retriever, VectorStore, chunk_words
+
+DOCS = {
+    "deploy.md": "To deploy the service run the release script and then restart the gateway nodes.",
+    "billing.md": "Invoices are generated on the first day of each month and emailed to the account owner.",
+    "oncall.md": "The oncall engineer acknowledges pages within five minutes and opens an incident channel.",
+}
+
+
+async def hashed_embed(texts):
+    """Bag-of-words vectors, so texts sharing words are similar"""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * 64
+        for word in text.lower().split():
+            vector[hash(word.strip(".,?")) % 64] += 1.0
+        vectors.append(vector)
+    return vectors
+
+
+def test_chunks_overlap_and_keep_the_tail():
+    lines = ["one two three four", "five six seven"]
+    assert list(chunk_words(lines, size=3, overlap=1)) == [
+        "one two three", "three four five", "five six seven"
+    ]
+    assert list(chunk_words(["a b"], size=3, overlap=1)) == ["a b"]
+
+
+def test_hybrid_search_finds_the_relevant_document():
+    async def run():
+        search = Retriever(hashed_embed, DocumentIndex(100), concurrency=2, batch_size=1)
+        ingested = await search.ingest_texts(DOCS)
+        return ingested, await search.search("how do I deploy the gateway?", k=1)
+
+    ingested, matches = asyncio.run(run())
+    assert ingested["success"] and ingested["chunks"] == 3
+    assert matches[0]["source"] == "deploy.md"
+    assert "release script" in matches[0]["text"]
+
+
+def test_reingest_skips_unchanged_and_replaces_changed_documents():
+    async def run():
+        search = Retriever(hashed_embed, DocumentIndex(100))
+        await search.ingest_texts(DOCS)
+        again = await search.ingest_texts({"billing.md": DOCS["billing.md"]})
+        await search.ingest_texts({"billing.md": "Invoices are now generated every quarter."})
+        matches = await search.search("when are invoices generated", k=5)
+        removed = search.remove("oncall.md")
+        return search, again, matches, removed
+
+    search, again, matches, removed = asyncio.run(run())
+    assert again["documents"][0]["skipped"]
+    billing = [m["text"] for m in matches if m["source"] == "billing.md"]
+    assert billing == ["Invoices are now generated every quarter."]
+    assert removed
+    stats = search.stats()
+    assert stats["documents"] == 2
+    assert stats["chunks"] == 2 and stats["retired_chunks"] == 2
+
+
+def test_vector_clusters_are_rebuilt_without_losing_new_rows():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(600, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    store = VectorStore(1000, nprobe=4, ivf_min_rows=200)
+    live = np.ones(1000, dtype=bool)
+    store.add(vectors[:400])
+    assert store.needs_clustering
+    centroids, labels = store.cluster(400)
+    store.add(vectors[400:])  # arrives while clustering runs
+    store.install(400, centroids, labels)
+
+    assert store.centroids is not None and not store.needs_clustering
+    for row in (7, 399, 450, 599):
+        assert store.search(vectors[row], live, 1) == [row]
+
+
+def test_background_rebuild_merges_postings_and_keeps_results():
+    async def run():
+        search = Retriever(hashed_embed, DocumentIndex(100, ivf_min_chunks=2), merge_threshold=1)
+        await search.ingest_texts(DOCS)
+        before = await search.search("incident channel pages", k=3)
+        await search._maintenance
+        after = await search.search("incident channel pages", k=3)
+        return search, before, after
+
+    search, before, after = asyncio.run(run())
+    assert search.merges == 1 and search.clusterings == 1
+    assert search.index.bm25.pending == 0
+    assert before[0]["source"] == after[0]["source"] == "oncall.md"
+
+
+def test_index_survives_restart(tmp_path):
+    path = str(tmp_path / "docs")
+
+    async def run():
+        search = Retriever(hashed_embed, DocumentIndex(100, path))
+        await search.ingest_texts(DOCS)
+        search.flush()
+        reloaded = Retriever(hashed_embed, DocumentIndex(100, path))
+        return await reloaded.search("monthly invoices for the account", k=1), reloaded
+
+    matches, reloaded = asyncio.run(run())
+    assert matches[0]["source"] == "billing.md"
+    assert reloaded.stats()["documents"] == 3
+
+
+def test_chat_with_retrieval_grounds_the_prompt(fake_ollama, monkeypatch):
+    fake = fake_ollama(token_delay=0)
+    monkeypatch.setattr(retriever, "_index", DocumentIndex(100))
+    with TestClient(app) as client:
+        ingested = client.post("/api/v1/retrieval/documents", json={"documents": DOCS})
+        assert ingested.json()["chunks"] == 3
+        response = client.post("/api/v1/chat", json={
+            "message": "How do I deploy the gateway?", "use_retrieval": True
+        })
+        plain = client.post("/api/v1/chat", json={"message": "How do I deploy the gateway?"})
+
+    assert response.status_code == 200
+    assert plain.json()["cached"] is False  # passages are part of the cache key
+    system = fake.state.requests[0]["messages"][0]
+    assert system["role"] == "system"
+    assert "[1] deploy.md" in system["content"]
+    assert fake.state.requests[1]["messages"][0]["role"] == "user"
+
+
+def test_file_ingestion_is_confined_to_the_documents_directory(fake_ollama, monkeypatch, tmp_path):
+    fake_ollama(token_delay=0)
+    docs = tmp_path / "docs"
+    (docs / "guides").mkdir(parents=True)
+    (docs / "guides" / "deploy.md").write_text(DOCS["deploy.md"])
+    (docs / "guides" / "image.png").write_bytes(b"\x89PNG")
+    (tmp_path / "secret.txt").write_text("do not read")
+    monkeypatch.setattr(settings, "retrieval_docs_dir", str(docs))
+    monkeypatch.setattr(retriever, "_index", DocumentIndex(100))
+    with TestClient(app) as client:
+        outside = client.post("/api/v1/retrieval/ingest", json={"paths": ["../secret.txt"]})
+        ingested = client.post("/api/v1/retrieval/ingest", json={"paths": ["guides"]})
+        found = client.get("/api/v1/retrieval/search", params={"q": "release script", "k": 1})
+
+    assert outside.status_code == 400
+    assert [d["source"] for d in ingested.json()["documents"]] == [str(docs / "guides" / "deploy.md")]
+    assert found.json()["passages"][0]["source"].endswith("deploy.md")
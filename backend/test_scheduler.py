@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import scheduler
+from app.services.metrics import Metrics
+from app.services.scheduler import Scheduler, SchedulerRejected
+
+
+def test_per_model_concurrency_limit():
+    async def run():
+        sched = Scheduler(default_concurrency=2, model_concurrency={"big": 1})
+        running = {"small": 0, "big": 0}
+        peak = {"small": 0, "big": 0}
+
+        async def job(model):
+            async with sched.slot(model):
+                running[model] += 1
+                peak[model] = max(peak[model], running[model])
+                await asyncio.sleep(0.01)
+                running[model] -= 1
+
+        await asyncio.gather(*[job("small") for _ in range(5)], *[job("big") for _ in range(3)])
+        return peak, sched.stats()
+
+    peak, stats = asyncio.run(run())
+    assert peak == {"small": 2, "big": 1}
+    assert stats["models"]["big"]["admitted"] == 3
+    assert stats["models"]["big"]["active"] == 0
+
+
+def test_round_robin_across_clients_and_priority_lanes():
+    async def run():
+        sched = Scheduler(default_concurrency=1)
+        order = []
+        await sched.acquire("m")  # occupy the only slot
+
+        async def job(client, lane, name):
+            async with sched.slot("m", client, lane):
+                order.append(name)
+
+        tasks = [asyncio.create_task(job("a", "standard", f"a{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("b", "standard", "b0")))
+        tasks.append(asyncio.create_task(job("c", "batch", "c0")))
+        tasks.append(asyncio.create_task(job("d", "interactive", "d0")))
+        await asyncio.sleep(0)
+        sched.release("m")
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["d0", "a0", "b0", "a1", "a2", "c0"]
+
+
+def test_rejects_when_expected_wait_is_too_long():
+    async def run():
+        sched = Scheduler(default_concurrency=1, max_queue=10, max_queue_wait=1.0)
+        sched._queue("m").service_time = 0.6
+        await sched.acquire("m")
+        waiter = asyncio.create_task(sched.acquire("m"))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerRejected) as excinfo:
+            await sched.acquire("m")
+        waiter.cancel()
+        await asyncio.sleep(0)
+        return excinfo.value, sched.stats()["models"]["m"]
+
+    error, stats = asyncio.run(run())
+    assert error.retry_after == pytest.approx(1.2)
+    assert stats["rejected"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def run():
+        sched = Scheduler(default_concurrency=1)
+        await sched.acquire("m")
+        waiter = asyncio.create_task(sched.acquire("m"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        depth = sched.stats()["models"]["m"]["queue_depth"]
+        sched.release("m")
+        return depth, sched.stats()["models"]["m"]["active"]
+
+    assert asyncio.run(run()) == (0, 0)
+
+
+def test_queue_depth_admissions_and_waits_are_exported_as_metrics():
+    async def run():
+        registry = Metrics()
+        sched = Scheduler(default_concurrency=1, max_queue=1, registry=registry)
+        await sched.acquire("m", lane="interactive")
+        waiter = asyncio.create_task(sched.acquire("m", "a", "batch"))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerRejected):
+            await sched.acquire("m")
+        queued = registry.render()
+        sched.release("m")
+        await waiter
+        return queued, registry.render()
+
+    queued, done = asyncio.run(run())
+    assert 'scheduler_active_requests{model="m"} 1' in queued
+    assert 'scheduler_queued_requests{model="m",lane="batch"} 1' in queued
+    assert 'scheduler_queued_requests{model="m",lane="batch"} 0' in done
+    assert 'scheduler_rejected_total{model="m",reason="queue_full"} 1' in done
+    assert 'scheduler_admitted_total{model="m",lane="interactive"} 1' in done
+    assert 'scheduler_queue_wait_seconds_count{model="m",lane="batch"} 1' in done
+
+
+def test_chat_returns_429_with_retry_after(fake_ollama, monkeypatch):
+    fake_ollama(token_delay=0)
+    monkeypatch.setattr(scheduler, "_queues", {})
+    monkeypatch.setattr(scheduler, "max_queue", 0)
+    with TestClient(app) as client:
+        async def occupy():
+            for _ in range(scheduler.default_concurrency):
+                await scheduler.acquire("mistral:latest")
+
+        client.portal.call(occupy)
+        response = client.post("/api/v1/chat", json={"message": "Busy?", "use_cache": False})
+        stream = client.post("/api/v1/chat/stream", json={"message": "Busy?", "use_cache": False})
+        stats = client.get("/api/v1/scheduler/stats").json()
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert stream.status_code == 429
+    assert stats["models"]["mistral:latest"]["rejected"] == 2
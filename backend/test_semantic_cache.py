@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import semantic_cache
+from app.services.semantic_cache import SemanticCache, VectorIndex
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_index_top_k_partitions_and_lru_eviction():
+    index = VectorIndex(capacity=3)
+    index.add(unit(1, 0, 0), 1, {"response": "x"})
+    index.add(unit(1, 1, 0), 1, {"response": "xy"})
+    index.add(unit(1, 0, 0), 2, {"response": "other model"})
+
+    matches = index.search(unit(1, 0.1, 0), partition=1, k=5)
+    assert [row for _, row in matches] == [0, 1]
+    assert matches[0][0] > 0.99
+
+    index.touch(0)
+    index.add(unit(0, 0, 1), 1, {"response": "z"})  # full: replaces row 1, the least recently used
+    assert index.evictions == 1
+    assert index.entries[1] == {"response": "z"}
+    assert index.search(unit(0, 0, 1), partition=1)[0][1] == 1
+
+
+def test_index_persists_to_memory_mapped_file(tmp_path):
+    prefix = str(tmp_path / "semantic")
+    index = VectorIndex(capacity=4, path=prefix)
+    index.add(unit(0, 1), 7, {"response": "saved", "model": "m"})
+    index.flush()
+
+    reopened = VectorIndex(capacity=4, path=prefix)
+    assert isinstance(reopened.vectors, np.memmap)
+    similarity, row = reopened.search(unit(0, 1), partition=7)[0]
+    assert similarity > 0.99 and reopened.entries[row]["response"] == "saved"
+
+
+def test_index_rebuilds_when_the_embedding_dimension_changes(tmp_path):
+    prefix = str(tmp_path / "semantic")
+    index = VectorIndex(capacity=4, path=prefix)
+    index.add(unit(0, 1), 7, {"response": "old model"})
+    index.flush()
+
+    reopened = VectorIndex(capacity=4, path=prefix)
+    assert reopened.search(unit(0, 1, 0), partition=7) == []
+    row = reopened.add(unit(0, 1, 0), 7, {"response": "new model"})
+    reopened.flush()
+
+    assert row == 0 and reopened.dim == 3 and reopened.filled == 1
+    again = VectorIndex(capacity=4, path=prefix)
+    assert again.entries[again.search(unit(0, 1, 0), partition=7)[0][1]]["response"] == "new model"
+
+
+def test_periodic_flush_writes_off_the_event_loop(tmp_path):
+    prefix = str(tmp_path / "semantic")
+    index = VectorIndex(capacity=4, path=prefix)
+    writers = []
+    write = index.write
+    index.write = lambda meta: writers.append(threading.get_ident()) or write(meta)
+
+    async def embed(texts):
+        return [[1.0, float(len(text))] for text in texts]
+
+    async def run():
+        cache = SemanticCache(embed, index, flush_every=2)
+        for message in ("a", "bb", "ccc"):
+            await cache.set(message, "m", None, {"response": message, "model": "m"})
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(writers) == 1 and writers[0] != loop_thread
+    assert VectorIndex(capacity=4, path=prefix).filled == 2  # the snapshot taken at the second insert
+
+
+def test_cache_with_fake_embedder_threshold():
+    vectors = {"a b": [1.0, 0.0], "a b c": [0.9, 0.1], "d": [0.0, 1.0]}
+
+    async def embed(texts):
+        return [vectors[text] for text in texts]
+
+    async def run():
+        cache = SemanticCache(embed, VectorIndex(capacity=10), threshold=0.95)
+        assert await cache.get("a b", "m") is None
+        await cache.set("a b", "m", None, {"response": "answer", "model": "m"})
+        return cache, await cache.get("a b c", "m"), await cache.get("d", "m"), await cache.get("a b c", "other")
+
+    cache, paraphrase, unrelated, other_model = asyncio.run(run())
+    assert paraphrase["response"] == "answer" and paraphrase["similarity"] >= 0.95
+    assert unrelated is None and other_model is None
+    assert cache.embeds == 4  # the miss's embedding was reused by set()
+    assert cache.stats()["hit_rate"] == 0.25
+
+
+def test_chat_serves_paraphrase_from_semantic_cache(fake_ollama, monkeypatch):
+    fake = fake_ollama(tokens=["Paris"], token_delay=0)
+    monkeypatch.setattr(semantic_cache, "enabled", True)
+    monkeypatch.setattr(semantic_cache, "threshold", 0.8)
+    monkeypatch.setattr(semantic_cache, "index", VectorIndex(capacity=100))
+    with TestClient(app) as client:
+        first = client.post("/api/v1/chat", json={"message": "What is the capital of France?"}).json()
+        second = client.post("/api/v1/chat", json={"message": "Tell me what the capital of France is"}).json()
+        streamed = client.post("/api/v1/chat/stream", json={
+            "message": "tell me, what is the capital of France", "stream_protocol": 2
+        }).text
+        stats = client.get("/api/v1/cache/stats").json()["semantic"]
+
+    assert not first["cached"]
+    assert second["cached"] and second["response"] == "Paris"
+    assert '"cached": true' in streamed or '"cached":true' in streamed
+    assert len(fake.state.requests) == 1
+    assert stats["hits"] == 2 and stats["entries"] == 1
+    assert fake.state.embed_requests[0]["model"] == "nomic-embed-text"
@@ -14,6 +14,7 @@ sys.path.append(str(Path(__file__).parent / "app"))
 
 try:
     from app.services.ollama_service import ollama_service
+    from app.services.model_catalog import model_catalog
     from app.core.config import settings
 except ImportError as e:
     print(f"❌ Failed to import app modules: {e}")
@@ -26,7 +27,8 @@ async def test_ollama_connection():
     print("🔍 Testing Ollama connection...")
     
     try:
-        status = await ollama_service.check_ollama_status()
+        await model_catalog.refresh()
+        status = model_catalog.health()
         if status["status"] == "healthy":
             print(f"✅ Ollama is running and healthy")
             if "models" in status:
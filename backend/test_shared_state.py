@@ -0,0 +1,298 @@
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import stream_registry
+from app.services.conversation_store import SharedConversationStore
+from app.services.response_cache import MemoryCacheTier, ResponseCache, SharedCacheTier
+from app.services.scheduler import Scheduler
+from app.services.shared_state import MemoryState, RedisError, RedisState
+from app.services.stream_registry import StreamRegistry
+from benchmarks.fake_ollama import run_fake_ollama
+from benchmarks.fake_redis import run_fake_redis
+from run_server import available_cores, worker_count
+
+
+@pytest.fixture
+def redis_url():
+    with run_fake_redis() as (url, _):
+        yield url
+
+
+@pytest.fixture(params=["memory", "redis"])
+def state(request):
+    if request.param == "memory":
+        yield MemoryState()
+    else:
+        with run_fake_redis() as (url, _):
+            yield RedisState(url, prefix="test:")
+
+
+def test_strings_counters_and_lists(state):
+    async def run():
+        await state.set("greeting", "hello")
+        await state.set("short", "lived", ttl=0.05)
+        first = await state.incr("hits", 2, ttl=0.05)
+        second = await state.incr("hits", 3, ttl=10)
+        length = await state.push("log", ["a", "b", "c"], max_len=2)
+        await state.push("log", ["d"], max_len=2)
+        log = await state.items("log")
+        await state.drop_last("log", 1)
+        trimmed = await state.items("log")
+        counter = await state.get("hits")
+        await asyncio.sleep(0.1)
+        result = {
+            "greeting": await state.get("greeting"),
+            "short": await state.get("short"),
+            "hits": (first, second, counter, await state.get("hits")),
+            "log": (length, log, trimmed),
+            "deleted": (await state.delete("greeting"), await state.delete("greeting")),
+            "missing": await state.items("nothing"),
+        }
+        await state.close()
+        return result
+
+    result = asyncio.run(run())
+    assert result["greeting"] == "hello"
+    assert result["short"] is None
+    # The TTL comes from the call that created the counter
+    assert result["hits"] == (2, 5, "5", None)
+    assert result["log"] == (3, ["c", "d"], ["c"])
+    assert result["deleted"] == (True, False)
+    assert result["missing"] == []
+
+
+def test_counters_always_expire_and_lists_keep_their_expiry(state):
+    async def run():
+        counters = [await state.incr("window", 1, ttl=0.05) for _ in range(3)]
+        await state.push("log", ["a"], ttl=0.05)
+        await state.push("log", ["b"])  # no ttl: still expires with the first push
+        await asyncio.sleep(0.1)
+        result = counters, await state.get("window"), await state.items("log")
+        await state.close()
+        return result
+
+    counters, window, log = asyncio.run(run())
+    assert counters == [1, 2, 3]
+    assert window is None and log == []
+
+
+def test_redis_state_authenticates_prefixes_and_pipelines():
+    with run_fake_redis(password="s3cret") as (url, fake):
+        state = RedisState(url, prefix="app:")
+
+        async def run():
+            await state.push("turns", ["x"], max_len=5, ttl=60)
+            value = await state.incr("n", ttl=60)
+            await state.close()
+            return value
+
+        assert asyncio.run(run()) == 1
+        assert fake.commands[0] == ["AUTH", "s3cret"]
+        assert [command[0] for command in fake.commands[1:4]] == ["RPUSH", "LTRIM", "PEXPIRE"]
+        assert all(command[1].startswith("app:") for command in fake.commands[1:])
+        assert state.stats()["commands"] == 5
+
+
+def test_redis_state_reports_errors_and_bad_urls(redis_url):
+    state = RedisState(redis_url)
+
+    async def run():
+        await state.push("a-list", ["x"])
+        with pytest.raises(RedisError):
+            await state.get("a-list")
+        # The connection stays usable after an error reply
+        await state.set("ok", "1")
+        return await state.get("ok")
+
+    assert asyncio.run(run()) == "1"
+    assert state.stats()["errors"] == 1
+    with pytest.raises(ValueError):
+        RedisState("http://localhost:6379")
+
+
+def test_sessions_are_shared_between_workers(redis_url):
+    # Two stores on separate connections stand in for two worker processes
+    first = SharedConversationStore(RedisState(redis_url), ttl=60, max_sessions=10, max_turns=4, max_bytes=1000)
+    second = SharedConversationStore(RedisState(redis_url), ttl=60, max_sessions=10, max_turns=4, max_bytes=1000)
+
+    async def run():
+        session_id = await first.create()
+        empty = await second.window(session_id)
+        for i in range(3):
+            await first.append(session_id, [("user", f"q{i}"), ("assistant", f"a{i}")])
+        window = await second.window(session_id)
+        dropped = await second.drop_last(session_id, 2)
+        history = await first.history(session_id)
+        deleted = await second.delete(session_id)
+        return empty, window, dropped, history, deleted, await first.window(session_id)
+
+    empty, window, dropped, history, deleted, after = asyncio.run(run())
+    assert empty == (0, [])
+    assert window == (2, [("user", "q1"), ("assistant", "a1"), ("user", "q2"), ("assistant", "a2")])
+    assert dropped == 2
+    assert history == [("user", "q1"), ("assistant", "a1")]
+    assert deleted is True
+    assert after == (0, [])
+
+
+def test_cache_hit_from_another_worker(redis_url):
+    def worker_cache():
+        return ResponseCache([
+            MemoryCacheTier(ttl=60, max_entries=10, max_bytes=10000),
+            SharedCacheTier(RedisState(redis_url), ttl=60)
+        ])
+
+    first, second = worker_cache(), worker_cache()
+    key = ResponseCache.make_key("hello", "mistral:latest")
+
+    async def run():
+        await first.set(key, {"response": "hi", "model": "mistral:latest"})
+        return await second.get(key), await second.get(key)
+
+    shared_hit, memory_hit = asyncio.run(run())
+    assert shared_hit == memory_hit == {"response": "hi", "model": "mistral:latest"}
+    # The first lookup was copied into the worker's own memory tier
+    assert second.tier_hits == {"memory": 1, "shared": 1}
+
+
+def test_shared_cache_tier_survives_a_lost_server():
+    tier = SharedCacheTier(RedisState("redis://127.0.0.1:1/0", timeout=0.5), ttl=60)
+
+    async def run():
+        await tier.set("key", {"response": "x"})
+        return await tier.get("key")
+
+    assert asyncio.run(run()) is None
+    assert tier.stats()["errors"] == 2
+
+
+def test_scheduler_splits_slots_and_sums_counters_across_workers():
+    state = MemoryState()
+    workers = [
+        Scheduler(default_concurrency=8, model_concurrency={"small": 2}, workers=3, state=state)
+        for _ in range(2)
+    ]
+    assert workers[0].limit("mistral:latest") == 2
+    assert workers[0].limit("small") == 1  # never below one slot
+
+    async def run():
+        for scheduler, count in zip(workers, (3, 2)):
+            for _ in range(count):
+                async with scheduler.slot("mistral:latest"):
+                    pass
+        await workers[1].publish()
+        return await workers[0].cluster_stats()
+
+    assert asyncio.run(run())["mistral:latest"] == {"admitted": 5, "rejected": 0}
+
+
+def test_drain_finishes_short_streams_and_stops_long_ones():
+    registry = StreamRegistry(heartbeat=0)
+
+    async def generate(tokens, delay):
+        for token in tokens:
+            await asyncio.sleep(delay)
+            yield {"chunk": token, "model": "m", "success": True, "done": False}
+        yield {"chunk": "", "response": "".join(tokens), "model": "m", "success": True, "done": True}
+
+    async def run():
+        registry.start("short", "m", generate(["a", "b"], 0.01))
+        registry.start("long", "m", generate(["x"] * 100, 0.05))
+        start = time.monotonic()
+        stopped = await registry.drain(0.2)
+        elapsed = time.monotonic() - start
+        short = [event async for event in registry.subscribe("short")]
+        long = [event async for event in registry.subscribe("long")]
+        return stopped, elapsed, short[-1], long[-1]
+
+    stopped, elapsed, short, long = asyncio.run(run())
+    assert stopped == 1
+    assert elapsed < 1.0
+    assert short["success"] and short["response"] == "ab"
+    assert long["error"] == "Server shutting down"
+    assert registry.stats()["draining"] is True  # until the process exits
+
+
+def test_new_streams_are_refused_while_draining(fake_ollama):
+    fake_ollama(tokens=["a"], token_delay=0)
+    with TestClient(app) as client:
+        stream_registry.draining = True
+        try:
+            refused = client.post("/api/v1/chat/stream", json={"message": "too late"})
+        finally:
+            stream_registry.draining = False
+        accepted = client.post("/api/v1/chat/stream", json={"message": "after restart"})
+
+    assert refused.status_code == 503
+    assert refused.headers["retry-after"] == "1"
+    assert accepted.status_code == 200
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs SIGTERM")
+def test_sigterm_drains_a_real_server_before_it_stops_listening():
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with run_fake_ollama(num_tokens=30, token_delay=0.05) as (ollama_url, _):
+        env = {**os.environ, "OLLAMA_HOST": ollama_url, "SHUTDOWN_DRAIN_TIMEOUT": "20", "CACHE_ENABLED": "False"}
+        server = subprocess.Popen(
+            [sys.executable, "run_server.py", "--production", "--workers", "1", "--port", str(port),
+             "--host", "127.0.0.1"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            with httpx.Client(base_url=base, timeout=10) as client:
+                deadline = time.monotonic() + 30
+                while True:
+                    try:
+                        if client.get("/readyz").status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    assert time.monotonic() < deadline, "server did not become ready"
+                    time.sleep(0.1)
+
+                in_flight = {}
+
+                def stream():
+                    with client.stream("POST", "/api/v1/chat/stream", json={"message": "long answer"}) as response:
+                        in_flight["body"] = response.read().decode()
+
+                reader = threading.Thread(target=stream)
+                reader.start()
+                time.sleep(0.3)
+                server.send_signal(signal.SIGTERM)
+                time.sleep(0.3)
+                ready = client.get("/readyz")
+                refused = client.post("/api/v1/chat/stream", json={"message": "too late"})
+                reader.join(timeout=20)
+            assert server.wait(timeout=20) == 0
+        finally:
+            server.kill()
+            server.wait()
+
+    assert ready.status_code == 503 and ready.json()["draining"] is True
+    assert refused.status_code == 503
+    assert '"done": true' in in_flight["body"] and "Server shutting down" not in in_flight["body"]
+
+
+def test_worker_count_defaults_to_cores():
+    assert worker_count(0) == available_cores() >= 1
+    assert worker_count(3) == 3
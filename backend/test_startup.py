@@ -0,0 +1,80 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import model_residency, ollama_service, warmup
+from app.services.backend_pool import BackendPool
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_ready_once_a_backend_is_checked(fake_ollama):
+    fake_ollama(loaded=["mistral:latest"])
+    with TestClient(app) as client:
+        assert client.get("/livez").json() == {"status": "alive"}
+        wait_for(lambda: client.get("/readyz").status_code == 200)
+        body = client.get("/readyz").json()
+
+    assert body["healthy_backends"] == 1
+    assert body["warmup"]["steps"]["backends"]["state"] == "done"
+    assert ollama_service.pool.backends[0].loaded_models == {"mistral:latest"}
+
+
+def test_not_ready_without_a_healthy_backend(monkeypatch):
+    monkeypatch.setattr(ollama_service, "pool", BackendPool(["http://127.0.0.1:1"], health_interval=0))
+    with TestClient(app) as client:
+        wait_for(lambda: warmup.ready)
+        live = client.get("/livez")
+        ready = client.get("/readyz")
+
+    assert live.status_code == 200
+    assert ready.status_code == 503
+    assert ready.json()["healthy_backends"] == 0
+
+
+def test_slow_preload_does_not_delay_startup_or_readiness(fake_ollama, monkeypatch):
+    fake_ollama()
+
+    async def slow_preload():
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(model_residency, "startup", slow_preload)
+    start = time.monotonic()
+    with TestClient(app) as client:
+        started = time.monotonic() - start
+        wait_for(lambda: client.get("/readyz").status_code == 200)
+        steps = client.get("/readyz").json()["warmup"]["steps"]
+
+    assert started < 1.0
+    assert steps["models"] == {"state": "running", "required": False, "seconds": None}
+    # Shutdown cancels warm-up that is still running
+    assert time.monotonic() - start < 10
+
+
+def test_import_does_not_load_numpy():
+    probe = "import sys, app.main; print('numpy' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
+
+
+def test_import_opens_no_databases(tmp_path):
+    probe = "import app.main"
+    env = {
+        **os.environ,
+        "CACHE_DISK_PATH": str(tmp_path / "cache.sqlite3"),
+        "SESSION_DB_PATH": str(tmp_path / "sessions.sqlite3"),
+        "SEMANTIC_CACHE_ENABLED": "True",
+        "SEMANTIC_CACHE_PATH": str(tmp_path / "semantic"),
+    }
+    subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,59 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def read_events(response):
+    return [
+        json.loads(line[len("data: "):])
+        for line in response.text.split("\n")
+        if line.startswith("data: ")
+    ]
+
+
+def test_stream_protocol_v2_sends_deltas_only(fake_ollama):
+    """Protocol 2 events carry only new text; the final text is sent once"""
+    fake_ollama(tokens=["Hel", "lo", " there"], token_delay=0)
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/chat/stream",
+            json={"message": "Hi", "stream_protocol": 2}
+        )
+
+    assert response.status_code == 200
+    events = read_events(response)
+    assert events[:-1] == [{"chunk": "Hel"}, {"chunk": "lo"}, {"chunk": " there"}]
+    assert events[-1]["done"] is True
+    assert events[-1]["response"] == "Hello there"
+    assert events[-1]["model"] == "mistral:latest"
+    assert "timestamp" in events[-1]
+    assert all("full_response" not in e for e in events)
+
+
+def test_stream_protocol_v1_is_unchanged(fake_ollama):
+    """Protocol 1 keeps resending the accumulated text for old clients"""
+    fake_ollama(tokens=["a", "b"], token_delay=0)
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat/stream", json={"message": "Hi"})
+
+    events = read_events(response)
+    assert [e["full_response"] for e in events[:-1]] == ["a", "ab", "ab"]
+    assert events[-2]["done"] is True
+    assert events[-1] == {"done": True}
+
+
+def test_stream_protocol_v2_reports_errors(fake_ollama):
+    """Upstream failures end a protocol 2 stream with an error event"""
+    fake_ollama(error="model not found")
+    with TestClient(app) as client:
+        response = client.post(
+            "/api/v1/chat/stream",
+            json={"message": "Hi", "stream_protocol": 2}
+        )
+
+    events = read_events(response)
+    assert len(events) == 1
+    assert events[0]["done"] is True
+    assert "model not found" in events[0]["error"]
@@ -0,0 +1,103 @@
+import json
+import time
+from collections import deque
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.tracing import Tracer, tracer
+
+
+def span_names(summary):
+    return [span["name"] for span in summary["spans"]]
+
+
+def test_chat_trace_covers_every_stage(fake_ollama, monkeypatch):
+    fake_ollama(token_delay=0)
+    monkeypatch.setattr(tracer, "buffer", deque(maxlen=100))  # without traces of earlier tests
+    with TestClient(app) as client:
+        response = client.post("/api/v1/chat", json={"message": "trace me", "use_cache": True})
+        trace_id = response.headers["x-trace-id"]
+        summary = client.get(f"/debug/traces/{trace_id}").json()
+        slowest = client.get("/debug/traces", params={"limit": 5}).json()
+
+    assert response.status_code == 200 and response.json()["response"]
+    assert response.headers["traceparent"].startswith(f"00-{trace_id}-")
+    assert summary["name"] == "POST /api/v1/chat"
+    names = span_names(summary)
+    for stage in ("request.parse", "cache.lookup", "scheduler.queue_wait", "ollama.first_token",
+                  "ollama.connect", "ollama.stream", "response.serialize"):
+        assert stage in names, stage
+    spans = {span["name"]: span for span in summary["spans"]}
+    assert spans["cache.lookup"]["attributes"]["hit"] is False
+    assert spans["ollama.connect"]["parent_span_id"] == spans["ollama.first_token"]["span_id"]
+    assert spans["ollama.first_token"]["attributes"]["hedged"] is False
+    assert summary["spans"][0]["attributes"]["http.response.status_code"] == 200
+    assert trace_id in [trace["trace_id"] for trace in slowest["traces"]]
+    durations = [trace["duration_ms"] for trace in slowest["traces"]]
+    assert durations == sorted(durations, reverse=True)
+
+
+def test_incoming_traceparent_is_continued_and_probes_are_untraced(fake_ollama):
+    fake_ollama(token_delay=0)
+    parent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+    with TestClient(app) as client:
+        streamed = client.post("/api/v1/chat/stream", json={"message": "hello"}, headers={"traceparent": parent})
+        probe = client.get("/livez")
+        summary = client.get(f"/debug/traces/{'ab' * 16}").json()
+
+    assert streamed.headers["x-trace-id"] == "ab" * 16
+    assert "x-trace-id" not in probe.headers
+    root = summary["spans"][0]
+    assert root["parent_span_id"] == "cd" * 8
+    stream = next(span for span in summary["spans"] if span["name"] == "response.stream")
+    assert stream["attributes"]["frames"] > 1 and stream["attributes"]["serialize_ms"] >= 0
+
+
+def test_tail_sampling_keeps_slow_and_failed_traces():
+    sampler = Tracer(sample_rate=0.0, slow_seconds=0.05)
+    fast = sampler.start_trace("GET")
+    sampler.finish(fast)
+    slow = sampler.start_trace("GET")
+    time.sleep(0.06)
+    sampler.finish(slow)
+    failed = sampler.start_trace("GET")
+    token = sampler.activate(failed)
+    try:
+        with sampler.span("cache.lookup"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    sampler.deactivate(token)
+    sampler.finish(failed)
+
+    assert [t.trace_id for t in sampler.buffer] == [slow.trace_id, failed.trace_id]
+    assert sampler.summary(failed)["spans"][1]["error"] == "boom"
+    assert sampler.stats()["started"] == 3 and sampler.stats()["kept"] == 2
+
+
+def test_kept_traces_are_exported_as_otlp_json(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = Tracer(export_path=str(path))
+    trace = exporter.start_trace("POST", attributes={"url.path": "/api/v1/chat"})
+    token = exporter.activate(trace)
+    with exporter.span("scheduler.queue_wait", model="llama2"):
+        pass
+    exporter.deactivate(token)
+    exporter.finish(trace)
+    exporter.close()
+
+    request = json.loads(path.read_text().splitlines()[0])
+    spans = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root, child = spans
+    assert len(root["traceId"]) == 32 and len(root["spanId"]) == 16 and "parentSpanId" not in root
+    assert child["parentSpanId"] == root["spanId"] and root["kind"] == 2
+    assert int(child["endTimeUnixNano"]) >= int(child["startTimeUnixNano"])
+    assert {"key": "model", "value": {"stringValue": "llama2"}} in child["attributes"]
+
+
+def test_spans_outside_a_request_are_noops():
+    with tracer.span("cache.lookup") as span:
+        span.set("hit", True)
+    assert span.recording is False
+    assert tracer.start_span("ollama.stream").recording is False
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+from app.api.websocket import ChatSocket
+from app.core.config import settings
+from app.main import app
+from app.services import conversation_store, request_coalescer, stream_registry
+
+
+def receive_until(ws, predicate, received=0):
+    """Collect frames until one matches ``predicate``, acking data frames as they arrive"""
+    frames, data = [], received
+    while True:
+        frame = json.loads(ws.receive_text())
+        frames.append(frame)
+        if frame[0] in ("tok", "done", "err"):
+            data += 1
+            ws.send_text(json.dumps(["ack", data]))
+        if predicate(frame):
+            return frames
+
+
+def test_multiplexes_conversations_on_one_socket(fake_ollama):
+    fake_ollama(tokens=["a", "b", "c"], token_delay=0.01)
+    with TestClient(app) as client, client.websocket_connect("/api/v1/ws") as ws:
+        ready = json.loads(ws.receive_text())
+        assert ready[0] == "ready"
+        ws.send_text(json.dumps(["chat", "one", {"message": "first question", "use_cache": False}]))
+        ws.send_text(json.dumps(["chat", "two", {"message": "second question", "use_cache": False}]))
+        done = set()
+        frames = receive_until(ws, lambda f: f[0] == "done" and (done.add(f[1]) or done == {"one", "two"}))
+
+    tokens = {cid: "".join(f[2] for f in frames if f[0] == "tok" and f[1] == cid) for cid in ("one", "two")}
+    assert tokens == {"one": "abc", "two": "abc"}
+    finals = {f[1]: f[2] for f in frames if f[0] == "done"}
+    assert finals["one"]["response"] == "abc"
+    assert {f[1] for f in frames if f[0] == "start"} == {"one", "two"}
+
+
+def test_cancel_and_malformed_frames(fake_ollama):
+    fake_ollama(tokens=[f" t{i}" for i in range(200)], token_delay=0.01)
+    with TestClient(app) as client, client.websocket_connect("/api/v1/ws") as ws:
+        ws.receive_text()
+        ws.send_text("not json")
+        assert json.loads(ws.receive_text())[:2] == ["err", None]
+
+        ws.send_text(json.dumps(["chat", "long", {"message": "long answer", "use_cache": False}]))
+        receive_until(ws, lambda f: f[0] == "tok")
+        ws.send_text(json.dumps(["cancel", "long"]))
+        frames = receive_until(ws, lambda f: f[0] in ("err", "done"))
+
+    assert frames[-1] == ["err", "long", "Request cancelled"]
+    assert sum(1 for f in frames if f[0] == "tok") < 100
+
+
+
+def test_disconnect_stops_generation_without_resume_grace(fake_ollama, monkeypatch):
+    fake_ollama(tokens=[f" t{i}" for i in range(300)], token_delay=0.01)
+    monkeypatch.setattr(stream_registry, "resume_grace", 30)
+    with TestClient(app) as client:
+        with client.websocket_connect("/api/v1/ws") as ws:
+            ws.receive_text()
+            ws.send_text(json.dumps(["chat", "gone", {"message": "long answer", "use_cache": False}]))
+            frames = receive_until(ws, lambda f: f[0] == "tok")
+        request_id = next(f[2] for f in frames if f[0] == "start")
+        stream = stream_registry._streams[request_id]
+        deadline = time.monotonic() + 2
+        while not stream.done and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert stream.done and stream.grace is None
+    assert stream.tokens < 100
+
+def test_regenerate_replaces_last_session_answer(fake_ollama):
+    fake = fake_ollama(tokens=["answer"], token_delay=0)
+    with TestClient(app) as client, client.websocket_connect("/api/v1/ws") as ws:
+        ws.receive_text()
+        payload = {"message": "regen question", "session_id": "ws-regen"}
+        ws.send_text(json.dumps(["chat", "c", payload]))
+        receive_until(ws, lambda f: f[0] == "done")
+        ws.send_text(json.dumps(["regen", "c"]))
+        frames = receive_until(ws, lambda f: f[0] == "done")
+
+    assert frames[-1][2]["session_id"] == "ws-regen"
+    assert len(fake.state.requests) == 2  # the cache is bypassed
+    history = asyncio.run(conversation_store.history("ws-regen"))
+    assert history == [("user", "regen question"), ("assistant", "answer")]
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+
+def test_writer_respects_credit_window_and_prioritises_control():
+    async def run():
+        ws = FakeWebSocket()
+        socket = ChatSocket(ws, window=3, max_streams=1)
+        writer = asyncio.create_task(socket.writer())
+
+        async def produce():
+            for i in range(10):
+                await socket.data(["tok", "c", str(i)])
+
+        producer = asyncio.create_task(produce())
+        await asyncio.sleep(0.01)
+        blocked = list(ws.sent)
+        queued = len(socket._data)
+        socket.control(["pong"])
+        await asyncio.sleep(0.01)
+        with_pong = list(ws.sent)
+        socket.ack(3)
+        await asyncio.sleep(0.01)
+        waiting = not producer.done()
+        writer.cancel()
+        producer.cancel()
+        return blocked, queued, with_pong, ws.sent, waiting
+
+    blocked, queued, with_pong, final, waiting = asyncio.run(run())
+    assert [f[2] for f in blocked] == ["0", "1", "2"]
+    assert queued == 0  # the producer waits instead of queueing frames
+    assert with_pong[-1] == ["pong"]  # control frames bypass flow control
+    assert len([f for f in final if f[0] == "tok"]) == 6
+    assert waiting
+
+
+def test_client_that_does_not_ack_pauses_the_generation(fake_ollama, monkeypatch):
+    fake_ollama(tokens=[f" t{i}" for i in range(300)], token_delay=0.001)
+    monkeypatch.setattr(settings, "ws_window", 4)
+    monkeypatch.setattr(settings, "stream_read_ahead", 4)
+    monkeypatch.setattr(stream_registry, "read_ahead", 4)
+    monkeypatch.setattr(request_coalescer, "read_ahead", 4)
+    with TestClient(app) as client, client.websocket_connect("/api/v1/ws") as ws:
+        ws.receive_text()
+        ws.send_text(json.dumps(["chat", "slow", {"message": "long unacked answer", "use_cache": False}]))
+        start = json.loads(ws.receive_text())
+        while start[0] != "start":
+            start = json.loads(ws.receive_text())
+        for _ in range(4):
+            assert json.loads(ws.receive_text())[0] == "tok"
+        time.sleep(0.5)  # the whole answer would have streamed by now
+        pulled = stream_registry._streams[start[2]].tokens
+
+        ws.send_text(json.dumps(["ack", 4]))
+        frames = receive_until(ws, lambda f: f[0] == "done", received=4)
+
+    assert pulled < 50  # window + read-ahead buffers, not 300 tokens
+    assert frames[-1][2]["response"].count(" t") == 300
@@ -13,6 +13,7 @@ class ChatApp {
     this.isLoading = false;
     this.currentModel = "mistral:latest";
     this.messageHistory = [];
+    this.sessionId = null; // server-side conversation, created on first message
     this.retryCount = 0;
 
     this.initializeElements();
@@ -142,17 +143,76 @@ class ChatApp {
     return messageDiv;
   }
 
+  async ensureSession() {
+    if (this.sessionId) return this.sessionId;
+
+    try {
+      const response = await fetch(`${CONFIG.API_BASE_URL}/sessions`, {
+        method: "POST",
+      });
+      if (response.ok) {
+        const data = await response.json();
+        this.sessionId = data.session_id;
+      }
+    } catch (error) {
+      // Without a session the chat still works, just without server context
+      console.warn("Failed to create session:", error);
+    }
+    return this.sessionId;
+  }
+
   async streamChatResponse(message, messageDiv) {
     const url = `${CONFIG.API_BASE_URL}/chat/stream`;
     const messageText = messageDiv.querySelector(".message-text");
     const messageMeta = messageDiv.querySelector(".message-meta");
 
-    let fullResponse = "";
-    let currentModel = this.currentModel;
-    let timestamp = new Date().toISOString();
+    // Survives reconnects: the server resumes after lastEventId
+    const stream = {
+      requestId: null,
+      lastEventId: 0,
+      fullResponse: "",
+      finished: false,
+    };
+
+    const onEvent = (parsed) => {
+      if (parsed.error) {
+        const error = new Error(parsed.error);
+        error.fromServer = true;
+        throw error;
+      }
+
+      if (parsed.done) {
+        // Protocol 2: final text and metadata arrive once, at the end
+        if (typeof parsed.response === "string") {
+          stream.fullResponse = parsed.response;
+          messageText.textContent = stream.fullResponse;
+        }
+        const currentModel = parsed.model || this.currentModel;
+        const timestamp = parsed.timestamp || new Date().toISOString();
+        this.sessionId = parsed.session_id || this.sessionId;
+
+        const timestampDisplay = new Date(timestamp).toLocaleTimeString();
+        messageMeta.innerHTML = `
+          <span>Model: ${currentModel}</span>
+          <span>${timestampDisplay}</span>
+        `;
+        messageMeta.style.display = "block";
+        stream.finished = true;
+        return;
+      }
+
+      if (parsed.chunk) {
+        stream.fullResponse += parsed.chunk;
+        messageText.textContent = stream.fullResponse;
+
+        // Auto-scroll to keep the message in view
+        this.scrollToBottom();
+      }
+    };
 
     try {
-      const response = await fetch(url, {
+      const sessionId = await this.ensureSession();
+      let response = await fetch(url, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -160,61 +220,37 @@ class ChatApp {
         body: JSON.stringify({
           message: message,
           model: this.currentModel,
+          stream_protocol: 2,
+          session_id: sessionId,
         }),
       });
 
       if (!response.ok) {
         throw new Error(`HTTP ${response.status}`);
       }
+      stream.requestId = response.headers.get("X-Request-ID");
+
+      for (let attempt = 1; ; attempt++) {
+        try {
+          await this.readEventStream(response, stream, onEvent);
+          if (stream.finished) return;
+        } catch (error) {
+          if (error.fromServer) throw error;
+          console.warn("Stream interrupted:", error);
+        }
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder();
-
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        const chunk = decoder.decode(value);
-        const lines = chunk.split("\n");
-
-        for (const line of lines) {
-          if (line.startsWith("data: ")) {
-            const data = line.slice(6).trim();
-            if (data) {
-              try {
-                const parsed = JSON.parse(data);
-
-                if (parsed.error) {
-                  throw new Error(parsed.error);
-                }
-
-                if (parsed.done) {
-                  // Update metadata when done
-                  const timestampDisplay = new Date(
-                    timestamp
-                  ).toLocaleTimeString();
-                  messageMeta.innerHTML = `
-                    <span>Model: ${currentModel}</span>
-                    <span>${timestampDisplay}</span>
-                  `;
-                  messageMeta.style.display = "block";
-                  return;
-                }
-
-                if (parsed.chunk) {
-                  fullResponse += parsed.chunk;
-                  messageText.textContent = fullResponse;
-                  currentModel = parsed.model || currentModel;
-                  timestamp = parsed.timestamp || timestamp;
-
-                  // Auto-scroll to keep the message in view
-                  this.scrollToBottom();
-                }
-              } catch (e) {
-                console.warn("Failed to parse chunk:", data, e);
-              }
-            }
-          }
+        // Connection dropped before the final event: resume, don't regenerate
+        if (!stream.requestId || attempt > CONFIG.MAX_RETRIES) {
+          throw new Error("Connection lost");
+        }
+        await new Promise((resolve) =>
+          setTimeout(resolve, CONFIG.RETRY_DELAY * attempt)
+        );
+        response = await fetch(`${url}/${stream.requestId}`, {
+          headers: { "Last-Event-ID": String(stream.lastEventId) },
+        });
+        if (!response.ok) {
+          throw new Error(`HTTP ${response.status}`);
         }
       }
     } catch (error) {
@@ -224,6 +260,45 @@ class ChatApp {
     }
   }
 
+  async readEventStream(response, stream, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (!stream.finished) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      // Frames can be split across reads; keep the trailing partial frame
+      buffer += decoder.decode(value, { stream: true });
+      const frames = buffer.split("\n\n");
+      buffer = frames.pop();
+
+      for (const frame of frames) {
+        let id = null;
+        let data = "";
+        for (const line of frame.split("\n")) {
+          // Lines starting with ":" are heartbeats and are ignored
+          if (line.startsWith("id: ")) id = Number(line.slice(4));
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        if (!data.trim()) continue;
+
+        let parsed;
+        try {
+          parsed = JSON.parse(data);
+        } catch (e) {
+          console.warn("Failed to parse event:", data, e);
+          continue;
+        }
+        onEvent(parsed);
+        if (id !== null) stream.lastEventId = id;
+        if (stream.finished) break;
+      }
+    }
+    reader.cancel().catch(() => {});
+  }
+
   async callChatAPI(message) {
     const url = `${CONFIG.API_BASE_URL}/chat`;
 
@@ -237,6 +312,7 @@ class ChatApp {
           body: JSON.stringify({
             message: message,
             model: this.currentModel,
+            session_id: await this.ensureSession(),
           }),
         });
 
@@ -306,7 +382,8 @@ class ChatApp {
     this.chatMessages.appendChild(messageDiv);
     this.scrollToBottom();
 
-    // Store in history
+    // Store in local history for display; the conversation context
+    // itself lives server-side under this.sessionId
     this.messageHistory.push({
       role,
       content,